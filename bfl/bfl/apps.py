@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+class BflConfig(AppConfig):
+    name = 'bfl'
+    verbose_name = 'Billed Fitness Log'
+
+    def ready(self):
+        from . import db # Connect the signal handlers
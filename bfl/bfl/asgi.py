@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bfl.settings')
+os.environ.setdefault('BFL_ASYNC_VIEWS', '1') # Serve the read-only pages with async views, see bfl/asgi_urls.py
 
 application = get_asgi_application()
+
+from bfl import rendering # Needs the apps, which the application has set up
+from log import catalog
+rendering.prewarm() # Compile the templates before the first request, in the production rendering mode
+catalog.prewarm() # Build the autocomplete index of the exercise catalog
@@ -0,0 +1,19 @@
+"""
+URL configuration of the ASGI application (see bfl/asgi.py).
+
+The read-only pages are served by their async versions, which do not hold a
+thread of the sync bridge while they wait. Every other URL is the same as in
+bfl/urls.py, whose patterns follow and only match what is not listed here.
+"""
+from django.urls import path
+from users import async_views as user_async_views
+from log import async_views as log_async_views
+from . import urls
+
+urlpatterns = [
+    path('', user_async_views.landing, name='landing'),
+    path('home/', user_async_views.user_home, name='user_home'),
+    path('profile/', user_async_views.profile, name='profile'),
+    path('log/history/', log_async_views.history, name='history'),
+    path('log/history/exercise/<int:exercise_id>/', log_async_views.exercise_history, name='exercise_history'),
+] + urls.urlpatterns
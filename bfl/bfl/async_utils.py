@@ -0,0 +1,42 @@
+"""
+Helpers for the async views served by the ASGI application (see bfl/asgi_urls.py).
+
+Django 3.1 has no async ORM or template rendering, so every database access
+is wrapped in ``sync_to_async``. The calls run on the single thread that owns
+the request's database connection, and each view makes as few of them as
+possible: one to load the session and user, one to run the queries of the page.
+"""
+
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render
+
+async def aget_user(request):
+    """
+    Load the session and user of the request without blocking the event loop.
+    Afterwards ``request.user`` can be used from async code.
+    """
+    if not hasattr(request, '_cached_user'): # The attribute AuthenticationMiddleware's lazy request.user reads
+        request._cached_user = await sync_to_async(auth.get_user)(request)
+    return request._cached_user
+
+def async_login_required(view):
+    """
+    Async counterpart of django.contrib.auth.decorators.login_required.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+async def arender(request, template_name, context=None):
+    """
+    Render a template from async code. Lazy querysets in the context are run here.
+    """
+    return await sync_to_async(render)(request, template_name, context)
@@ -0,0 +1,54 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+
+Benchmarks create their data inside a transaction that is rolled back at the
+end, so they can be run against any database without leaving anything behind.
+"""
+
+import time
+from contextlib import contextmanager
+from django.db import transaction
+from .metrics import Timing
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back(using=None):
+    """
+    Run the body of a ``with`` block in a transaction that is always rolled back.
+    """
+    try:
+        with transaction.atomic(using=using):
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+def measure(func, repeat=20, warmup=2):
+    """
+    Call ``func`` repeatedly and return its timing statistics in milliseconds.
+    """
+    for _ in range(warmup):
+        func()
+    timing = Timing()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timing.add(time.perf_counter() - start)
+    return timing.as_dict()
+
+
+def format_table(rows, columns):
+    """
+    Format a list of dicts as a plain text table with the given columns.
+    """
+    widths = [max(len(str(column)), *(len(str(row.get(column, ''))) for row in rows)) for column in columns]
+    lines = ['  '.join(str(column).ljust(width) for column, width in zip(columns, widths))]
+    lines.append('  '.join('-' * width for width in widths))
+    for row in rows:
+        lines.append('  '.join(str(row.get(column, '')).ljust(width) for column, width in zip(columns, widths)))
+    return '\n'.join(lines)
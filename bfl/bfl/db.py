@@ -0,0 +1,35 @@
+"""
+Per connection database tuning.
+
+SQLite connections get the PRAGMAs of settings.SQLITE_PRAGMAS as soon as they
+are opened. Persistent connections (CONN_MAX_AGE) are checked at the start of
+every request and replaced if the server dropped them, which Django 3.1 does
+not do on its own.
+"""
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from . import metrics
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        # Only reused connections can have gone away, new ones are opened lazily
+        if connection.connection is None or not connection.settings_dict['CONN_MAX_AGE'] or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            metrics.incr('db.unusable_connections')
+            connection.close()
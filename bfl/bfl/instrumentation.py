@@ -0,0 +1,165 @@
+"""
+Opt-in request instrumentation, turned on with BFL_INSTRUMENTATION=1.
+
+For every request the middleware measures the wall time, the number and time
+of SQL queries, the time spent rendering templates and the time spent in
+Pillow, adds them to the response as a ``Server-Timing`` header (shown by the
+network panel of the browser's developer tools) and aggregates them per view
+in bfl.metrics under ``requests.<view name>.``.
+
+Each process regularly writes its aggregates to a JSON file in
+INSTRUMENTATION_DIR, which ``manage.py timing_report`` reads.
+
+Spans are collected in a context variable and queries on the connections of
+the thread that runs the middleware, so work done by background jobs (like
+the avatar queue) is not counted against the request that queued it.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends import django as django_backend
+from . import metrics
+
+SPANS = ('db', 'template', 'pillow')
+
+_current = contextvars.ContextVar('bfl_request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    The spans of one request.
+    """
+
+    def __init__(self):
+        self.spans = defaultdict(float)
+        self.queries = 0
+
+    def add(self, name, seconds):
+        self.spans[name] += seconds
+
+    def time_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting and timing the queries of the request.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('db', time.perf_counter() - start)
+
+
+@contextmanager
+def span(name):
+    """
+    Add the time of the body of a ``with`` block to the span of the current request, if any.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with span('template'):
+            return self.template.render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend, timing every render for the current request.
+    Included templates are part of the render of the page that includes them.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def server_timing(total, timings):
+    """
+    Return the value of the Server-Timing header for the request.
+    """
+    entries = [f'total;dur={total * 1000:.1f}']
+    for name in SPANS:
+        if name in timings.spans:
+            description = f';desc="{timings.queries} queries"' if name == 'db' else ''
+            entries.append(f'{name};dur={timings.spans[name] * 1000:.1f}{description}')
+    return ', '.join(entries)
+
+
+def report_path(directory=None):
+    return os.path.join(directory or settings.INSTRUMENTATION_DIR, f'{os.getpid()}.json')
+
+
+def flush(directory=None):
+    """
+    Write the aggregates of this process to its file in INSTRUMENTATION_DIR.
+    """
+    path = report_path(directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {'pid': os.getpid(), 'written_at': time.time(), **metrics.snapshot('requests.')}
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path) # The report command never reads a partly written file
+
+
+class InstrumentationMiddleware:
+    """
+    See the module docstring. Put it first in MIDDLEWARE so the other middleware is timed too.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.flushed_at = time.monotonic()
+        atexit.register(flush, settings.INSTRUMENTATION_DIR) # Keep what was measured since the last flush
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        match = request.resolver_match
+        prefix = f"requests.{match.view_name if match else 'unresolved'}"
+        metrics.record(f'{prefix}.total', total)
+        metrics.record(f'{prefix}.db', timings.spans.get('db', 0.0)) # Views without queries count as 0
+        for name, seconds in timings.spans.items():
+            if name != 'db':
+                metrics.record(f'{prefix}.{name}', seconds)
+        metrics.observe(f'{prefix}.queries', timings.queries)
+        response['Server-Timing'] = server_timing(total, timings)
+        if time.monotonic() - self.flushed_at > settings.INSTRUMENTATION_FLUSH_SECONDS:
+            self.flushed_at = time.monotonic()
+            flush()
+        return response
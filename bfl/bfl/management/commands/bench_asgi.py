@@ -0,0 +1,100 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, AsyncClient, override_settings
+from django.urls import reverse
+from bfl.bench import format_table
+from bfl.metrics import Timing
+from log.bench import create_bench_user, populate_history
+
+USERNAME = 'bench-asgi'
+PAGES = ['user_home', 'profile', 'history']
+
+# (name, URL configuration, whether requests go through the ASGI handler)
+MODES = [
+    ('wsgi', 'bfl.urls', False),
+    ('asgi, sync views', 'bfl.urls', True),
+    ('asgi, async views', 'bfl.asgi_urls', True),
+]
+
+class Command(BaseCommand):
+    help = 'Compare throughput and latency of the read-only pages under WSGI and ASGI at increasing concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=600, help='Requests per mode and concurrency level.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64], help='Numbers of requests in flight.')
+        parser.add_argument('--sets', type=int, default=2000, help='Sets in the history of the benchmark user.')
+
+    def handle(self, *args, **options):
+        # The requests run on other threads with their own connections, so the data is committed and deleted afterwards
+        User.objects.filter(username=USERNAME).delete()
+        user = create_bench_user(USERNAME)
+        populate_history(user, options['sets'])
+        rows = []
+        try:
+            for mode, urlconf, asgi in MODES:
+                with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=['testserver']): # The host name of the test clients
+                    urls = [reverse(name) for name in PAGES]
+                    for concurrency in options['concurrency']:
+                        run = self.run_asgi if asgi else self.run_wsgi
+                        run(user, urls, concurrency, len(urls) * 2) # Warm up the caches
+                        timing, elapsed = run(user, urls, concurrency, options['requests'])
+                        stats = timing.as_dict()
+                        rows.append({
+                            'mode': mode,
+                            'concurrency': concurrency,
+                            'requests/s': round(stats['count'] / elapsed, 1),
+                            'p50_ms': stats['p50_ms'],
+                            'p99_ms': stats['p99_ms'],
+                        })
+        finally:
+            User.objects.filter(username=USERNAME).delete()
+        self.stdout.write(format_table(rows, ['mode', 'concurrency', 'requests/s', 'p50_ms', 'p99_ms']))
+
+    def run_wsgi(self, user, urls, concurrency, requests):
+        """
+        Send the requests from a pool of threads, like a threaded WSGI server.
+        """
+        login = Client()
+        login.force_login(user)
+        timing = Timing()
+
+        def get(i):
+            client = Client()
+            client.cookies = login.cookies
+            start = time.perf_counter()
+            response = client.get(urls[i % len(urls)])
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            for seconds in pool.map(get, range(requests)):
+                timing.add(seconds)
+        return timing, time.perf_counter() - start
+
+    def run_asgi(self, user, urls, concurrency, requests):
+        """
+        Send the requests through the ASGI handler on one event loop, like an ASGI server.
+        """
+        client = AsyncClient()
+        client.force_login(user)
+        timing = Timing()
+
+        async def main():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def get(i):
+                async with slots:
+                    start = time.perf_counter()
+                    response = await client.get(urls[i % len(urls)])
+                    assert response.status_code == 200, response.status_code
+                    timing.add(time.perf_counter() - start)
+
+            await asyncio.gather(*(get(i) for i in range(requests)))
+
+        start = time.perf_counter()
+        asyncio.run(main())
+        return timing, time.perf_counter() - start
@@ -0,0 +1,64 @@
+import copy
+import logging
+from crispy_forms.templatetags import crispy_forms_filters
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+from bfl import rendering
+from bfl.bench import rolled_back, measure, format_table
+from log.bench import create_bench_user, populate_history
+
+# (route, logged in)
+PAGES = [
+    ('login', False),
+    ('register', False),
+    ('change_password', True),
+    ('edit_profile', True),
+    ('profile', True),
+    ('settings', True),
+    ('history', True),
+]
+
+def templates(cached):
+    """
+    Return the TEMPLATES setting with or without the cached loader.
+    """
+    value = copy.deepcopy(settings.TEMPLATES)
+    loaders = settings.TEMPLATE_LOADERS
+    value[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', loaders)] if cached else loaders
+    return value
+
+class Command(BaseCommand):
+    help = 'Time the rendering of the form and account pages without and with the production rendering mode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100, help='Number of timed requests per page and mode.')
+
+    def handle(self, *args, **options):
+        modes = [
+            ('app directories', {'TEMPLATES': templates(False), 'TEMPLATE_CACHE': False}),
+            ('cached loader', {'TEMPLATES': templates(True), 'TEMPLATE_CACHE': False}),
+            ('cached + crispy memo', {'TEMPLATES': templates(True), 'TEMPLATE_CACHE': True}),
+        ]
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        results = {}
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver'], FRAGMENT_CACHE_TIMEOUT=0): # Render every time
+            user = create_bench_user()
+            populate_history(user, 500)
+            for mode, overrides in modes:
+                with override_settings(**overrides):
+                    crispy_forms_filters.uni_form_template.cache_clear() # Crispy keeps the template of the previous engine
+                    rendering.clear()
+                    rendering.prewarm()
+                    for name, logged_in in PAGES:
+                        client = Client()
+                        if logged_in:
+                            client.force_login(user)
+                        url = reverse(name)
+                        results.setdefault(name, {'page': name})[mode] = measure(lambda: client.get(url), options['repeat'])['p50_ms']
+        rows = list(results.values())
+        for row in rows:
+            row['change'] = f"{(row[modes[-1][0]] - row[modes[0][0]]) / row[modes[0][0]]:+.0%}"
+        self.stdout.write('p50 ms per request')
+        self.stdout.write(format_table(rows, ['page'] + [mode for mode, _ in modes] + ['change']))
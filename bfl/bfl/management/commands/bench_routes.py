@@ -0,0 +1,77 @@
+import json
+import logging
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from bfl.bench import rolled_back, measure, format_table
+from bfl.routes import named_routes, route_url
+from log.bench import create_bench_user, populate_history
+
+COLUMNS = ['route', 'user', 'status', 'queries', 'p50_ms', 'p95_ms', 'p99_ms']
+
+class Command(BaseCommand):
+    help = (
+        'Time a GET of every named route, anonymous and logged in, with a populated database and '
+        'write the results as JSON to compare them between commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed requests per route.')
+        parser.add_argument('--sets', type=int, default=10000, help='Sets in the history of the benchmark user.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON file of an earlier run to show the change in p50 against.')
+        parser.add_argument('--label', default='', help='Stored with the results, e.g. the commit.')
+
+    def handle(self, *args, **options):
+        results = []
+        logging.getLogger('django.request').setLevel(logging.ERROR) # Every GET of a POST only route would be logged
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver']): # Nothing the benchmark creates is kept
+            user = create_bench_user()
+            exercise = populate_history(user, options['sets'])[0]
+            for name, params in named_routes().items():
+                url = route_url(name, params, {'exercise_id': exercise.pk})
+                for logged_in in (False, True):
+                    client = Client()
+                    if logged_in:
+                        client.force_login(user)
+                    cache.clear()
+                    connection.queries_log.clear() # The log is bounded and was filled by populating the history
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url) # The first request, with an empty fragment cache
+                    query_count = len(queries) # Read before the timed requests add to the query log
+                    if name == 'logout': # Logging out ends the session, time the first request only
+                        timing = measure(lambda: Client().get(url), options['repeat'])
+                    else:
+                        timing = measure(lambda: client.get(url), options['repeat'])
+                    results.append({
+                        'route': name,
+                        'user': 'logged in' if logged_in else 'anonymous',
+                        'status': response.status_code,
+                        'queries': query_count,
+                        'p50_ms': timing['p50_ms'],
+                        'p95_ms': timing['p95_ms'],
+                        'p99_ms': timing['p99_ms'],
+                    })
+        columns = COLUMNS
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = {(row['route'], row['user']): row for row in json.load(f)['results']}
+            for row in results:
+                before = previous.get((row['route'], row['user']))
+                if before and before['p50_ms']:
+                    row['p50 change'] = f"{(row['p50_ms'] - before['p50_ms']) / before['p50_ms']:+.0%}"
+                    row['queries change'] = f"{row['queries'] - before['queries']:+d}"
+            columns = COLUMNS + ['p50 change', 'queries change']
+        self.stdout.write(format_table(results, columns))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'label': options['label'],
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'sets': options['sets'],
+                    'repeat': options['repeat'],
+                    'results': results,
+                }, f, indent=2)
@@ -0,0 +1,34 @@
+import time
+from importlib import import_module
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+class Command(BaseCommand):
+    help = (
+        'Delete the expired sessions in small batches, so the session table is never locked '
+        'for long (unlike clearsessions, which deletes them in a single statement).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to wait between batches, to let requests through.')
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'): # Cookies and the cache expire by themselves
+            self.stdout.write(f'{settings.SESSION_ENGINE} does not store sessions in the database, nothing to clear.')
+            return
+        Session = store.get_model_class()
+        now = timezone.now() # Sessions that expire while the command runs are left for the next run
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:options['batch_size']])
+                if not keys:
+                    break
+                deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f'Deleted {deleted} expired sessions.')
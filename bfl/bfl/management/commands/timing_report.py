@@ -0,0 +1,93 @@
+import glob
+import json
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bfl.bench import format_table
+
+COLUMNS = [
+    'view', 'requests', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+    'db p95_ms', 'queries avg', 'queries max', 'template p95_ms', 'pillow p95_ms',
+]
+
+def merge(reports):
+    """
+    Combine the per view aggregates of several processes. Counts and averages are
+    exact, percentiles are the worst of the processes.
+    """
+    views = {}
+    for report in reports:
+        for kind in ('timings', 'distributions'):
+            for name, stats in report.get(kind, {}).items():
+                view, _, metric = name[len('requests.'):].rpartition('.')
+                merged = views.setdefault(view, {}).setdefault(metric, dict(stats, count=0))
+                avg_key = 'avg_ms' if kind == 'timings' else 'avg'
+                total = merged[avg_key] * merged['count'] + stats[avg_key] * stats['count']
+                merged['count'] += stats['count']
+                merged[avg_key] = total / merged['count'] if merged['count'] else 0.0
+                for key, value in stats.items():
+                    if key not in ('count', avg_key):
+                        merged[key] = max(merged[key], value)
+    return views
+
+class Command(BaseCommand):
+    help = 'Print the per view request timings written by the instrumentation middleware (BFL_INSTRUMENTATION=1).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.INSTRUMENTATION_DIR, help='Directory the processes write their reports to.')
+        parser.add_argument('--json', action='store_true', help='Print the merged report as JSON.')
+        parser.add_argument('--clear', action='store_true', help='Delete the reports after printing them.')
+        parser.add_argument(
+            '--max-age', type=float, default=24,
+            help='Skip the reports last written more than this many hours ago, by processes that are long gone. 0 reads every report.',
+        )
+        parser.add_argument('--prune', action='store_true', help='Delete the reports skipped for their age.')
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(os.path.join(options['dir'], '*.json')))
+        if not paths:
+            self.stderr.write(f"No reports in {options['dir']}, is BFL_INSTRUMENTATION=1 set on the server?")
+            return
+        cutoff = time.time() - options['max_age'] * 3600 if options['max_age'] > 0 else None
+        reports, stale = [], []
+        for path in paths:
+            with open(path) as f:
+                report = json.load(f)
+            if cutoff is not None and report.get('written_at', 0) < cutoff:
+                stale.append(path)
+            else:
+                reports.append(report)
+        if stale:
+            self.stderr.write(f"Skipped {len(stale)} report(s) older than {options['max_age']:g} hours{', deleted them' if options['prune'] else ''}.")
+            if options['prune']:
+                for path in stale:
+                    os.remove(path)
+        paths = [path for path in paths if path not in stale]
+        views = merge(reports)
+        if options['json']:
+            self.stdout.write(json.dumps(views, indent=2, sort_keys=True))
+        else:
+            rows = []
+            for view, stats in views.items():
+                total = stats.get('total', {})
+                queries = stats.get('queries', {})
+                rows.append({
+                    'view': view,
+                    'requests': total.get('count', 0),
+                    'p50_ms': total.get('p50_ms', ''),
+                    'p95_ms': total.get('p95_ms', ''),
+                    'p99_ms': total.get('p99_ms', ''),
+                    'max_ms': total.get('max_ms', ''),
+                    'db p95_ms': stats.get('db', {}).get('p95_ms', ''),
+                    'queries avg': round(queries.get('avg', 0), 1),
+                    'queries max': queries.get('max', ''),
+                    'template p95_ms': stats.get('template', {}).get('p95_ms', ''),
+                    'pillow p95_ms': stats.get('pillow', {}).get('p95_ms', ''),
+                })
+            rows.sort(key=lambda row: row['p95_ms'] or 0, reverse=True) # The slowest views first
+            self.stdout.write(f'{len(paths)} process(es)')
+            self.stdout.write(format_table(rows, COLUMNS))
+        if options['clear']:
+            for path in paths:
+                os.remove(path)
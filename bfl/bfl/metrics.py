@@ -0,0 +1,150 @@
+"""
+In-process metrics for the Billed Fitness Log.
+
+Counters, gauges, timings and distributions (of other values, e.g. queries per
+request) are kept in memory per process so that views,
+background jobs and management commands can report what they are doing without
+an external metrics service.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SAMPLE_SIZE = 1000 # How many of the most recent samples are kept per timing for percentiles
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+_distributions = {}
+
+
+class Timing:
+    """
+    Running statistics for a named duration, with a bounded window of recent
+    samples used to compute percentiles.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        """
+        Return the given percentile (0-100) of the recent samples in seconds.
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+        }
+
+
+class Distribution(Timing):
+    """
+    Running statistics for a named value that is not a duration.
+    """
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 3) if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+def incr(name, amount=1):
+    """
+    Increase the counter with the given name.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def gauge(name, value):
+    """
+    Set the current value of the gauge with the given name.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def record(name, seconds):
+    """
+    Add a duration sample (in seconds) to the timing with the given name.
+    """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = Timing()
+        timing.add(seconds)
+
+
+def observe(name, value):
+    """
+    Add a sample to the distribution with the given name.
+    """
+    with _lock:
+        distribution = _distributions.get(name)
+        if distribution is None:
+            distribution = _distributions[name] = Distribution()
+        distribution.add(value)
+
+
+@contextmanager
+def timer(name):
+    """
+    Time the body of a ``with`` block and record it under the given name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def snapshot(prefix=''):
+    """
+    Return a JSON serializable copy of every metric whose name starts with the prefix.
+    """
+    with _lock:
+        return {
+            'counters': {k: v for k, v in _counters.items() if k.startswith(prefix)},
+            'gauges': {k: v for k, v in _gauges.items() if k.startswith(prefix)},
+            'timings': {k: v.as_dict() for k, v in _timings.items() if k.startswith(prefix)},
+            'distributions': {k: v.as_dict() for k, v in _distributions.items() if k.startswith(prefix)},
+        }
+
+
+def reset():
+    """
+    Forget every metric, mostly useful in tests.
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
+        _distributions.clear()
@@ -0,0 +1,97 @@
+"""
+Production rendering mode, turned on with BFL_TEMPLATE_CACHE=1 (the default
+when DEBUG is off).
+
+* Templates are compiled once per process by the cached template loader.
+* ``prewarm`` compiles the templates of settings.TEMPLATE_PREWARM when the
+  WSGI or ASGI application starts, so the first requests do not pay for it.
+* Crispy forms are rendered once per form class while they are pristine
+  (unbound and without initial values, like the login and register forms of a
+  GET request) and the HTML is reused afterwards, see the ``cached_crispy``
+  template tag library. Forms with values or errors are rendered every time.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from crispy_forms.utils import TEMPLATE_PACK
+from django.apps import apps
+from django.conf import settings
+from django.forms import BaseForm
+from django.template import engines
+from django.utils.safestring import mark_safe
+from . import metrics
+
+MEMO_SIZE = 128 # Rendered forms kept per process
+
+
+def template_names(directory):
+    """
+    Return the names of the templates below the given template subdirectory of every app.
+    """
+    names = set()
+    for app_config in apps.get_app_configs():
+        root = os.path.join(app_config.path, 'templates')
+        for path, _, files in os.walk(os.path.join(root, directory)):
+            for filename in files:
+                if filename.endswith(('.html', '.txt')):
+                    names.add(os.path.relpath(os.path.join(path, filename), root).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def prewarm():
+    """
+    Compile the templates of settings.TEMPLATE_PREWARM into the cached loader and return their number.
+    """
+    if not settings.TEMPLATE_CACHE:
+        return 0
+    names = [name for directory in settings.TEMPLATE_PREWARM for name in template_names(directory)]
+    for engine in engines.all():
+        for name in names:
+            engine.get_template(name)
+    return len(names)
+
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _memo_key(form, template_pack, label_class, field_class):
+    """
+    Return the key of a pristine form's rendering, None if the form has values or errors.
+    """
+    if not isinstance(form, BaseForm) or form.is_bound or form.initial:
+        return None
+    if any(field.initial is not None or hasattr(field, 'queryset') for field in form.fields.values()): # Choices from the database can change
+        return None
+    cls = type(form)
+    return (cls.__module__, cls.__qualname__, tuple(form.fields), form.prefix, form.auto_id, template_pack, label_class, field_class)
+
+
+def render_crispy(form, template_pack=TEMPLATE_PACK, label_class='', field_class=''):
+    """
+    Render the form like crispy's ``crispy`` filter, reusing the HTML of pristine forms.
+    """
+    key = _memo_key(form, template_pack, label_class, field_class) if settings.TEMPLATE_CACHE else None
+    if key is None:
+        return as_crispy_form(form, template_pack, label_class, field_class)
+    with _memo_lock:
+        html = _memo.get(key)
+        if html is not None:
+            _memo.move_to_end(key)
+    if html is not None:
+        metrics.incr('crispy.hit')
+        return html
+    metrics.incr('crispy.miss')
+    html = mark_safe(as_crispy_form(form, template_pack, label_class, field_class))
+    with _memo_lock:
+        _memo[key] = html
+        if len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return html
+
+
+def clear():
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,34 @@
+"""
+The named routes of the site, walked by the query budget tests in bfl/tests.py
+and the ``bench_routes`` command.
+"""
+
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+SKIPPED_NAMESPACES = ('admin',) # Django's own pages, they have their own tests
+
+def named_routes(urlconf=None):
+    """
+    Return {route name: names of its URL parameters} for every named route.
+    """
+    routes = {}
+
+    def walk(patterns, namespace, params):
+        for pattern in patterns:
+            converters = list(getattr(pattern.pattern, 'converters', {}))
+            if isinstance(pattern, URLResolver):
+                if pattern.namespace in SKIPPED_NAMESPACES:
+                    continue
+                prefix = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+                walk(pattern.url_patterns, prefix, params + converters)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                routes.setdefault(f'{namespace}{pattern.name}', params + converters)
+
+    walk(get_resolver(urlconf).url_patterns, '', [])
+    return dict(sorted(routes.items()))
+
+def route_url(name, params, values):
+    """
+    Return the URL of a route, taking its parameters from the values dict.
+    """
+    return reverse(name, kwargs={param: values[param] for param in params})
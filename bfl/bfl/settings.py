@@ -32,6 +32,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    'bfl.apps.BflConfig',
     'users.apps.UsersConfig',
     'log.apps.LogConfig',
     'django_cleanup',
@@ -45,7 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bfl.instrumentation.InstrumentationMiddleware', # Only active with BFL_INSTRUMENTATION=1
     'django.middleware.security.SecurityMiddleware',
+    'bfl.static.StaticFilesMiddleware', # Only active with SERVE_STATIC
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,13 +57,31 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'bfl.urls'
+# Per request Server-Timing headers and per view aggregates, see bfl/instrumentation.py
+INSTRUMENTATION = os.environ.get('BFL_INSTRUMENTATION', '0') == '1'
+INSTRUMENTATION_DIR = os.environ.get('BFL_INSTRUMENTATION_DIR', os.path.join(BASE_DIR, 'instrumentation'))
+INSTRUMENTATION_FLUSH_SECONDS = 10 # How often each process writes its aggregates for timing_report
+
+# Serve the read-only pages with async views, bfl/asgi.py turns this on for the ASGI application
+ASYNC_VIEWS = os.environ.get('BFL_ASYNC_VIEWS', '0') == '1'
+
+ROOT_URLCONF = 'bfl.asgi_urls' if ASYNC_VIEWS else 'bfl.urls'
+
+# Production rendering mode, see bfl/rendering.py: templates are compiled once per process by
+# the cached loader (changes to them need a restart), the directories of TEMPLATE_PREWARM are
+# compiled when the server starts and pristine crispy forms are rendered once.
+TEMPLATE_CACHE = os.environ.get('BFL_TEMPLATE_CACHE', '0' if DEBUG else '1') == '1'
+TEMPLATE_PREWARM = ['users', 'log', 'bootstrap4']
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'bfl.instrumentation.DjangoTemplates', # Django's backend, timing renders for the instrumentation
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -68,6 +89,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)] if TEMPLATE_CACHE else TEMPLATE_LOADERS,
         },
     },
 ]
@@ -78,13 +100,164 @@ WSGI_APPLICATION = 'bfl.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# BFL_DB_ENGINE selects SQLite (default) or PostgreSQL. SQLite connections are tuned with
+# SQLITE_PRAGMAS and persistent PostgreSQL connections are health checked, see bfl/db.py.
+
+DATABASE_ENGINE = os.environ.get('BFL_DB_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BFL_DB_NAME', 'bfl'),
+            'USER': os.environ.get('BFL_DB_USER', ''),
+            'PASSWORD': os.environ.get('BFL_DB_PASSWORD', ''),
+            'HOST': os.environ.get('BFL_DB_HOST', ''),
+            'PORT': os.environ.get('BFL_DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('BFL_DB_CONN_MAX_AGE', 60)), # Seconds a connection is reused across requests
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BFL_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the writer and
+# synchronous=NORMAL is safe with WAL (a power loss can only lose the last commits).
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('BFL_SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': os.environ.get('BFL_SQLITE_SYNCHRONOUS', 'normal'),
+    'busy_timeout': int(os.environ.get('BFL_SQLITE_BUSY_TIMEOUT', 5000)), # ms a writer waits for the lock
+    'mmap_size': int(os.environ.get('BFL_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
 }
 
+# Check that a persistent connection still works before a request uses it
+DB_HEALTH_CHECKS = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# BFL_CACHE_BACKEND selects a per process memory cache (locmem) or a cache shared by
+# every worker on the machine (file, stored in BFL_CACHE_LOCATION).
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bfl',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('BFL_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    },
+}
+
+CACHE_BACKEND = os.environ.get('BFL_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+    # Always in process memory, for objects needed on every request (see USER_CACHE_TIMEOUT)
+    'local': CACHE_BACKENDS['locmem'],
+}
+
+# How long rendered page fragments are kept, see users/cache.py. 0 turns it off. Changes reach
+# the other workers through the version in the default cache, so like USER_CACHE_TIMEOUT it is
+# off by default with the locmem cache.
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('BFL_FRAGMENT_CACHE_TIMEOUT', 0 if CACHE_BACKEND == 'locmem' else 600))
+
+# Keep the logged in user and their profile in the local cache for this many seconds instead
+# of loading them on every request, see users/backends.py. 0 turns it off. Saving either of them
+# invalidates the entry through the version in the default cache, which only reaches the other
+# workers when that cache is shared, so it is off by default with the locmem cache.
+USER_CACHE_TIMEOUT = int(os.environ.get('BFL_USER_CACHE_TIMEOUT', 0 if CACHE_BACKEND == 'locmem' else 300))
+
+# The exercise autocomplete indexes of each process are reloaded when their version in the default
+# cache changes, see log/catalog.py. With the locmem cache only the process that made a change sees
+# it, so by default the custom exercises of a user are then read on every search instead of kept,
+# and the shared catalog is reloaded after CATALOG_RELOAD_INTERVAL seconds.
+CATALOG_SHARED_VERSIONS = os.environ.get('BFL_CATALOG_SHARED_VERSIONS', '0' if CACHE_BACKEND == 'locmem' else '1') == '1'
+CATALOG_RELOAD_INTERVAL = 60
+
+
+# Sessions
+# https://docs.djangoproject.com/en/3.1/topics/http/sessions/
+# BFL_SESSION_BACKEND selects where sessions are stored:
+# db              one query per request
+# cached_db       read from the default cache, written through to the database
+# cache           only in the default cache, sessions are lost when it is cleared
+# signed_cookies  in the cookie itself, no storage, but a logout cannot revoke a copy of the cookie
+# The cached backends need a cache shared by every worker (BFL_CACHE_BACKEND=file) when there is
+# more than one, otherwise a worker can read a session another one has already ended.
+
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+SESSION_ENGINE = SESSION_BACKENDS[os.environ.get('BFL_SESSION_BACKEND', 'db' if CACHE_BACKEND == 'locmem' else 'cached_db')]
+
+
+# Rate limiting of login and registration attempts, see users/ratelimit.py
+# BFL_RATELIMIT_STORE keeps the token buckets in this process (memory) or in the cache
+# RATELIMIT_CACHE_ALIAS, which is shared by the workers when it is a file or database cache.
+RATELIMIT_ENABLED = os.environ.get('BFL_RATELIMIT', '1') == '1'
+RATELIMIT_STORE = os.environ.get('BFL_RATELIMIT_STORE', 'memory' if CACHE_BACKEND == 'locmem' else 'cache')
+RATELIMIT_CACHE_ALIAS = 'default'
+RATELIMIT_MEMORY_KEYS = 100000 # Buckets kept by the memory store
+RATELIMIT_IP_HEADER = os.environ.get('BFL_RATELIMIT_IP_HEADER') # e.g. HTTP_X_FORWARDED_FOR behind a proxy
+RATELIMIT_PROXY_COUNT = int(os.environ.get('BFL_RATELIMIT_PROXY_COUNT', '1')) # Proxies that append to RATELIMIT_IP_HEADER
+
+# Attempts allowed in a burst and the period in seconds over which they refill
+RATELIMITS = {
+    'login.ip': (20, 60),
+    'login.username': (10, 300),
+    'register.ip': (5, 3600),
+}
+
+
+# Data retention, see users/retention.py
+# Deactivated accounts are deleted by manage.py purge_deactivated after this many days.
+DEACTIVATION_GRACE_DAYS = int(os.environ.get('BFL_DEACTIVATION_GRACE_DAYS', 30))
+RETENTION_CHECKPOINT = os.environ.get('BFL_RETENTION_CHECKPOINT', os.path.join(BASE_DIR, 'retention-checkpoint.json'))
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.1/topics/auth/passwords/
+# BFL_PASSWORD_HASHER selects the hasher for new passwords: pbkdf2, scrypt or argon2 (needs
+# argon2-cffi). Passwords hashed with another hasher or cost are rehashed on the next login.
+
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+}
+
+PASSWORD_HASHER = os.environ.get('BFL_PASSWORD_HASHER', 'pbkdf2')
+
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+# Cost of each hasher, see users/hashers.py
+PBKDF2_ITERATIONS = int(os.environ.get('BFL_PBKDF2_ITERATIONS', 216000))
+SCRYPT_WORK_FACTOR = int(os.environ.get('BFL_SCRYPT_WORK_FACTOR', 2 ** 14)) # N, a power of 2
+SCRYPT_BLOCK_SIZE = int(os.environ.get('BFL_SCRYPT_BLOCK_SIZE', 8))
+SCRYPT_PARALLELISM = int(os.environ.get('BFL_SCRYPT_PARALLELISM', 1))
+ARGON2_TIME_COST = int(os.environ.get('BFL_ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('BFL_ARGON2_MEMORY_COST', 102400)) # KiB
+ARGON2_PARALLELISM = int(os.environ.get('BFL_ARGON2_PARALLELISM', 8))
+
+
+# Loads the user of a session from the local cache, see USER_CACHE_TIMEOUT
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -122,11 +295,34 @@ USE_TZ = True
 # Static files (CSS, JavaScript)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 STATIC_URL = '/static/'
+STATIC_ROOT = os.environ.get('BFL_STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+
+# With BFL_STATIC_MANIFEST=1 (the default when DEBUG is off) collectstatic fingerprints,
+# pre-compresses and resizes the static files, see bfl/storage.py. The templates then link
+# to the fingerprinted names, so collectstatic has to run before the server starts.
+STATIC_MANIFEST = os.environ.get('BFL_STATIC_MANIFEST', '0' if DEBUG else '1') == '1'
+
+if STATIC_MANIFEST:
+    STATICFILES_STORAGE = 'bfl.storage.CompressedManifestStaticFilesStorage'
+
+# Widths of the resized variants written by collectstatic for the large images
+STATIC_IMAGE_VARIANTS = {
+    'users/images/gym-weight.jpg': (640, 1280, 1920, 2560),
+    'users/images/logo/bfl-logo_800x800.png': (64, 128),
+    'users/images/logo/bfl-logo_1800x1800.jpg': (192, 512),
+}
+
+# Serve STATIC_ROOT from the application with far-future cache headers, see bfl/static.py
+SERVE_STATIC = os.environ.get('BFL_SERVE_STATIC', '1' if STATIC_MANIFEST else '0') == '1'
 
 # Media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Number of background threads that crop and resize uploaded profile pictures.
+# Set to 0 to process uploads synchronously inside the request.
+AVATAR_WORKERS = int(os.environ.get('BFL_AVATAR_WORKERS', 2))
+
 # Crispy Forms to use Bootstrap v4
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
@@ -0,0 +1,63 @@
+"""
+Serving of the collected static files by the application itself, for
+deployments without a web server in front that could do it.
+
+Files whose name contains the hash of their content (the values of the
+staticfiles manifest, see bfl/storage.py) never change and are served with
+far-future, immutable cache headers. The pre-compressed brotli or gzip copy
+of a file is sent when the browser accepts it.
+"""
+
+import mimetypes
+import os
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse
+from django.utils._os import safe_join
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60' # Unhashed names can change with the next deployment
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz')) # In order of preference
+
+class StaticFilesMiddleware:
+    """
+    Put it right after SecurityMiddleware, so static files skip the session and authentication middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVE_STATIC:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.root = str(settings.STATIC_ROOT)
+        self.hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        accepted = {token.split(';')[0].strip() for token in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+        encoding = None
+        for candidate, suffix in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = IMMUTABLE if name in self.hashed else REVALIDATE
+        return response
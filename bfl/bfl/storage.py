@@ -0,0 +1,115 @@
+"""
+Static files storage used by ``collectstatic`` when BFL_STATIC_MANIFEST is on.
+
+On top of Django's manifest storage, which adds the hash of their content to
+the file names so they can be cached forever, it
+
+* writes resized WebP and optimized variants of the large images listed in
+  settings.STATIC_IMAGE_VARIANTS (see the static_image tag in
+  users/templatetags/static_images.py), before the files are hashed so the
+  variants are fingerprinted too, and
+* pre-compresses every text file with gzip, and brotli when the brotli
+  package is installed, so bfl/static.py can serve them without compressing
+  on every request.
+"""
+
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from PIL import Image
+
+try:
+    import brotli
+except ImportError: # brotli is optional, browsers get gzip instead
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.ico')
+MIN_COMPRESS_SIZE = 256 # Smaller files do not get any faster
+
+def variant_name(name, width, ext):
+    """
+    Return the name of a variant of a static image, e.g. ``users/images/gym-weight.640w.webp``.
+    """
+    return f'{os.path.splitext(name)[0]}.{width}w.{ext}'
+
+def variant_widths(name):
+    """
+    Return the widths of the variants of a static image, empty if it has none.
+    """
+    return settings.STATIC_IMAGE_VARIANTS.get(name, ())
+
+def fallback_ext(name):
+    """
+    Return the extension of the variants for browsers without WebP support.
+    """
+    return 'png' if name.lower().endswith('.png') else 'jpg'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+        paths = dict(paths)
+        for name in self.create_variants(paths):
+            paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run, **options)
+        # The manifest maps every file to its final (hashed) name, those are the ones served
+        with ThreadPoolExecutor() as pool: # zlib and brotli release the GIL
+            list(pool.map(self.compress, set(self.hashed_files.values())))
+
+    def create_variants(self, paths):
+        """
+        Write the variants of the collected images and return their names.
+        """
+        created = []
+        for name, widths in settings.STATIC_IMAGE_VARIANTS.items():
+            if name not in paths:
+                continue
+            with Image.open(self.path(name)) as original:
+                original.load()
+            for width in widths:
+                if width >= original.width: # Never upscale
+                    continue
+                img = original.copy()
+                img.thumbnail((width, round(original.height * width / original.width)), Image.LANCZOS)
+                for ext in ('webp', fallback_ext(name)):
+                    buffer = io.BytesIO()
+                    if ext == 'webp':
+                        img.save(buffer, 'WEBP', quality=80, method=6)
+                    elif ext == 'png':
+                        img.save(buffer, 'PNG', optimize=True)
+                    else:
+                        img.convert('RGB').save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+                    created.append(self.replace(variant_name(name, width, ext), buffer.getvalue()))
+        return created
+
+    def compress(self, name):
+        """
+        Write the gzip (and brotli) compressed copies of a file next to it.
+        """
+        if not name.lower().endswith(COMPRESSIBLE):
+            return
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        compressed = {'gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(content, quality=11)
+        for suffix, data in compressed.items():
+            if len(data) < len(content):
+                self.replace(f'{name}.{suffix}', data)
+
+    def replace(self, name, content):
+        """
+        Save the content under exactly this name, replacing an older file.
+        """
+        if self.exists(name):
+            self.delete(name)
+        return self._save(name, ContentFile(content))
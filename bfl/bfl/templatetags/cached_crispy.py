@@ -0,0 +1,13 @@
+from django import template
+from crispy_forms.utils import TEMPLATE_PACK
+from .. import rendering
+
+register = template.Library()
+
+@register.filter(name='crispy')
+def crispy(form, template_pack=TEMPLATE_PACK):
+    """
+    crispy_forms' ``crispy`` filter, reusing the HTML of pristine forms in the
+    production rendering mode, see bfl/rendering.py. Usage: {{ form|crispy }}
+    """
+    return rendering.render_crispy(form, template_pack)
@@ -0,0 +1,236 @@
+import copy
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from django.conf import settings
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db import connection
+from django.core.cache import cache
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import empty
+from log.models import Exercise, Workout, WorkoutSet
+from . import db, instrumentation, metrics, rendering
+from .routes import named_routes, route_url
+
+class DatabaseTuningTests(TestCase):
+
+    def test_sqlite_pragmas_are_applied(self):
+        """
+        Every SQLite connection should be opened with the configured PRAGMAs.
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1) # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_unusable_persistent_connection_is_closed(self):
+        """
+        A persistent connection the server dropped should be closed when the next request starts.
+        """
+        connection.ensure_connection()
+        with mock.patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 60}), \
+                mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close, \
+                mock.patch.object(connection, 'in_atomic_block', False):
+            db.check_persistent_connections(sender=None)
+        close.assert_called()
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.report_dir)
+        user = User.objects.create_user('myuser', 'myemail@test.com', 'mypassword')
+        self.client.force_login(user)
+
+    def test_server_timing_and_report(self):
+        """
+        Instrumented responses should carry Server-Timing and the aggregates should show up in the report.
+        """
+        with override_settings(INSTRUMENTATION=True, INSTRUMENTATION_DIR=self.report_dir), \
+                mock.patch.object(instrumentation.atexit, 'register'): # The report directory is gone by then
+            requests = metrics.snapshot('requests.user_home.')['timings'].get('requests.user_home.total', {}).get('count', 0)
+            response = self.client.get(reverse('user_home'))
+            self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", template;dur=')
+            snapshot = metrics.snapshot('requests.user_home.')
+            self.assertEqual(snapshot['timings']['requests.user_home.total']['count'], requests + 1)
+            self.assertGreater(snapshot['distributions']['requests.user_home.queries']['max'], 0)
+            instrumentation.flush()
+            out = io.StringIO()
+            call_command('timing_report', stdout=out)
+            self.assertIn('user_home', out.getvalue())
+            old = os.path.join(self.report_dir, '1.json') # Written by a process that is long gone
+            with open(old, 'w') as f:
+                json.dump({'pid': 1, 'written_at': time.time() - 48 * 3600, 'timings': {'requests.stale_view.total': {'count': 1, 'avg_ms': 1.0}}}, f)
+            out = io.StringIO()
+            call_command('timing_report', prune=True, stdout=out, stderr=io.StringIO())
+            self.assertNotIn('stale_view', out.getvalue())
+            self.assertFalse(os.path.exists(old))
+
+    def test_disabled_by_default(self):
+        """
+        Without BFL_INSTRUMENTATION the middleware should not be used.
+        """
+        response = self.client.get(reverse('user_home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+# Queries made by a GET of every named route with an empty fragment cache: (anonymous, logged in).
+# Lower a budget when a change saves queries, raising one needs a good reason.
+QUERY_BUDGETS = {
+    'change_password': (0, 2), # session, user with profile
+    'deactivate': (0, 2),
+    'edit_profile': (0, 2),
+    'exercise_autocomplete': (0, 4), # + catalog and custom exercises, reloaded since the cache was cleared
+    'exercise_history': (0, 4), # + exercise, page of sets
+    'export_history': (0, 2), # the sets are read while the response is sent
+    'history': (0, 4), # + page of workouts, their sets with exercises
+    'import_workouts': (0, 2), # POST only
+    'landing': (0, 2), # redirects logged in users
+    'login': (0, 2),
+    'logout': (0, 4),
+    'profile': (0, 2),
+    'progress_data': (0, 4), # + sets, muscle groups
+    'register': (0, 2),
+    'search': (0, 2), # the index is only read for a query
+    'settings': (0, 2),
+    'sync': (0, 2), # POST only
+    'user_home': (0, 4), # + exercise stats, weekly volume
+}
+
+class RouteQueryBudgetTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('myuser', 'myemail@test.com', 'mypassword')
+        self.exercise = Exercise.objects.create(name='Squat', muscle_group='legs')
+        for _ in range(3):
+            workout = Workout.objects.create(user=self.user, performed_at=timezone.now())
+            for _ in range(3):
+                WorkoutSet.objects.create(workout=workout, exercise=self.exercise, reps=5, weight=100, performed_at=workout.performed_at)
+
+    def test_every_route_has_a_budget(self):
+        """
+        A new route should come with its query budget.
+        """
+        self.assertEqual(set(named_routes()), set(QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        """
+        No route should make more queries than its budget, whether the user is logged in or not.
+        """
+        for name, params in named_routes().items():
+            url = route_url(name, params, {'exercise_id': self.exercise.pk})
+            for logged_in, budget in zip((False, True), QUERY_BUDGETS.get(name, (0, 0))):
+                with self.subTest(route=name, logged_in=logged_in):
+                    self.client.logout()
+                    if logged_in:
+                        self.client.force_login(self.user)
+                    cache.clear() # Budgets are for the first request, before any fragment is cached
+                    with self.assertNumQueries(budget):
+                        response = self.client.get(url)
+                    self.assertLess(response.status_code, 500)
+
+
+
+class StaticPipelineTests(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+
+    def collect(self):
+        settings = override_settings(
+            STATIC_ROOT=self.static_root,
+            STATIC_MANIFEST=True,
+            SERVE_STATIC=True,
+            STATICFILES_STORAGE='bfl.storage.CompressedManifestStaticFilesStorage',
+            STATIC_IMAGE_VARIANTS={'users/images/logo/bfl-logo_800x800.png': (64, 128, 1600)},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        staticfiles_storage._wrapped = empty # The storage is created once, from the settings at the time
+        self.addCleanup(setattr, staticfiles_storage, '_wrapped', empty)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic(self):
+        """
+        Collected files should be fingerprinted and compressed, and large images should get smaller variants.
+        """
+        self.collect()
+        css = staticfiles_storage.stored_name('users/main.css')
+        self.assertRegex(css, r'^users/main\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, f'{css}.gz')))
+        for width in (64, 128):
+            for ext in ('webp', 'png'):
+                variant = staticfiles_storage.stored_name(f'users/images/logo/bfl-logo_800x800.{width}w.{ext}')
+                self.assertTrue(os.path.exists(os.path.join(self.static_root, variant)))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'users/images/logo/bfl-logo_800x800.1600w.webp'))) # Never upscaled
+        landing = self.client.get(reverse('landing')).content.decode()
+        self.assertIn('type="image/webp"', landing)
+        self.assertIn(f'/static/{css}', landing)
+
+    def test_serving(self):
+        """
+        Fingerprinted files should be served compressed with far-future cache headers.
+        """
+        self.collect()
+        css = staticfiles_storage.stored_name('users/main.css')
+        response = self.client.get(f'/static/{css}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content))[:20], staticfiles_storage.open(css).read()[:20])
+        response = self.client.get('/static/users/main.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+
+class RenderingTests(TestCase):
+
+    def setUp(self):
+        rendering.clear()
+        self.addCleanup(rendering.clear)
+
+    def test_pristine_forms_are_rendered_once(self):
+        """
+        An unbound form should be rendered once and reused, forms with data or errors every time.
+        """
+        with override_settings(TEMPLATE_CACHE=True):
+            hits = metrics.snapshot('crispy.')['counters'].get('crispy.hit', 0)
+            first = rendering.render_crispy(AuthenticationForm())
+            second = rendering.render_crispy(AuthenticationForm())
+            self.assertEqual(metrics.snapshot('crispy.')['counters']['crispy.hit'], hits + 1)
+            bound = rendering.render_crispy(AuthenticationForm(data={'username': 'someone', 'password': ''}))
+        self.assertEqual(first, second)
+        self.assertEqual(first, as_crispy_form(AuthenticationForm()))
+        self.assertIn('value="someone"', bound)
+        self.assertIn('This field is required', bound)
+
+    def test_prewarm(self):
+        """
+        Prewarming should compile every template of the listed directories into the cached loader.
+        """
+        templates = copy.deepcopy(settings.TEMPLATES)
+        templates[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', settings.TEMPLATE_LOADERS)]
+        with override_settings(TEMPLATES=templates, TEMPLATE_CACHE=True, TEMPLATE_PREWARM=['users']):
+            self.assertEqual(rendering.prewarm(), len(rendering.template_names('users')))
+            cached = engines.all()[0].engine.template_loaders[0].get_template_cache
+            self.assertIn('users/base.html', cached)
+            self.assertIn('users/login.html', cached)
+        response = self.client.get(reverse('login'))
+        self.assertContains(response, 'id="id_username"')
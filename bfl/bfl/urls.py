@@ -23,6 +23,7 @@ urlpatterns = [
     path('deactivate/', user_views.deactivate, name='deactivate'),
     path('change-password/', user_views.change_password, name='change_password'),
     path('login/', user_views.login, name='login'),
+    path('log/', include('log.urls')),
     path('logout/', auth_views.LogoutView.as_view(template_name='users/logout.html'), name='logout'),
 ]
 
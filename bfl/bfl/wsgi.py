@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bfl.settings')
 
 application = get_wsgi_application()
+
+from bfl import rendering # Needs the apps, which the application has set up
+from log import catalog
+rendering.prewarm() # Compile the templates before the first request, in the production rendering mode
+catalog.prewarm() # Build the autocomplete index of the exercise catalog
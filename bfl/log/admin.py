@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import Exercise, Workout, WorkoutSet, ExerciseStats, WeeklyVolume
 
-# Register your models here.
+admin.site.register(Exercise)
+admin.site.register(Workout)
+admin.site.register(WorkoutSet)
+admin.site.register(ExerciseStats)
+admin.site.register(WeeklyVolume)
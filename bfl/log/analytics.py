@@ -0,0 +1,157 @@
+"""
+Vectorized progress analytics over a user's sets.
+
+The columns needed are read with ``values_list`` straight into NumPy arrays
+and every statistic (resampling by week or month, rolling averages, linear
+trends and per muscle group volume) is computed on whole arrays instead of
+looping over model instances.
+"""
+
+import numpy as np
+from django.db.models import BigIntegerField, Func
+from django.utils import timezone
+from .models import Exercise, WorkoutSet
+
+BUCKETS = ('week', 'month')
+SECONDS_PER_DAY = 86400
+
+
+class EpochSeconds(Func):
+    """
+    Seconds since the Unix epoch of a datetime column, so rows are read as plain
+    integers instead of being parsed into datetime objects one by one.
+    """
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)", **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='UNIX_TIMESTAMP', **extra_context)
+
+
+def load_sets(user, exercise=None):
+    """
+    Return the sets of the user (optionally of one exercise) as a dict of arrays,
+    ordered by time: ``day`` (local datetime64[D]), ``reps``, ``weight`` and
+    ``group`` (index into the returned ``groups`` list of muscle groups).
+    """
+    sets = WorkoutSet.objects.filter(user=user)
+    if exercise is not None:
+        sets = sets.filter(exercise=exercise)
+    rows = list(sets.order_by('performed_at').values_list(EpochSeconds('performed_at'), 'reps', 'weight', 'exercise'))
+    seconds, reps, weights, exercises = zip(*rows) if rows else ((), (), (), ()) # One tuple per column
+    count = len(seconds)
+    # The offset of the current time zone is applied to every set, around a DST change a set
+    # logged within an hour of midnight can land in the neighbouring day
+    offset = int(timezone.localtime().utcoffset().total_seconds())
+    local_seconds = np.fromiter(seconds, dtype=np.int64, count=count) + offset
+    # Muscle groups are looked up per distinct exercise rather than joined onto every row
+    exercise_ids, exercise_index = np.unique(np.fromiter(exercises, dtype=np.int64, count=count), return_inverse=True)
+    muscle_groups = dict(Exercise.objects.filter(pk__in=exercise_ids.tolist()).values_list('pk', 'muscle_group'))
+    groups, exercise_group = np.unique(np.array([muscle_groups[pk] for pk in exercise_ids.tolist()], dtype=str), return_inverse=True)
+    return {
+        'day': (local_seconds // SECONDS_PER_DAY).astype('datetime64[D]'),
+        'reps': np.fromiter(reps, dtype=np.float64, count=count),
+        'weight': np.fromiter(weights, dtype=np.float64, count=count),
+        'group': exercise_group.reshape(-1)[exercise_index.reshape(-1)] if count else np.zeros(0, dtype=np.int64),
+        'groups': groups.tolist(),
+    }
+
+
+def bucket_start(days, bucket):
+    """
+    Return the first day of the week (Monday) or month each day falls in.
+    """
+    if bucket == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    numbers = days.astype(np.int64)
+    return (numbers - (numbers + 3) % 7).astype('datetime64[D]') # 1970-01-01 was a Thursday
+
+
+def estimated_1rm(reps, weight):
+    """
+    Vectorized version of models.estimated_1rm.
+    """
+    return np.where(reps == 1, weight, weight * (1 + reps / 30))
+
+
+def rolling_mean(values, window):
+    """
+    Return the mean of each value and the (up to) window - 1 values before it.
+    """
+    if not len(values):
+        return values
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def period_index(starts, bucket):
+    """
+    Return every period from the first to the last start (including periods without
+    sets) and the position of each start in it.
+    """
+    if not len(starts):
+        return starts, np.zeros(0, dtype=np.int64)
+    if bucket == 'month':
+        months = starts.astype('datetime64[M]')
+        index = (months - months[0]).astype(np.int64)
+        periods = (months[0] + np.arange(index[-1] + 1)).astype('datetime64[D]')
+    else:
+        index = (starts - starts[0]).astype(np.int64) // 7
+        periods = starts[0] + 7 * np.arange(index[-1] + 1)
+    return periods, index
+
+
+def linear_trend(x, y, at):
+    """
+    Fit a line through the points (x, y) and return (slope, intercept, values of the line at ``at``).
+    """
+    if len(x) < 2:
+        intercept = float(y[0]) if len(y) else 0.0
+        return 0.0, intercept, np.full(len(at), intercept)
+    slope, intercept = np.polyfit(x, y, 1)
+    return float(slope), float(intercept), slope * at + intercept
+
+
+def progress(user, exercise=None, bucket='week', window=4):
+    """
+    Return the chart data of the user's progress, optionally for one exercise, per week or
+    month. Trend slopes are per period.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+    sets = load_sets(user, exercise)
+    periods, index = period_index(bucket_start(sets['day'], bucket), bucket)
+    positions = np.arange(len(periods), dtype=np.float64)
+    volume_per_set = sets['reps'] * sets['weight']
+    volume = np.bincount(index, weights=volume_per_set, minlength=len(periods))
+    # The sets are ordered by time so the sets of a period are a contiguous run of the arrays
+    trained = np.flatnonzero(np.diff(index, prepend=-1)) # first set of every period with sets
+    best = np.maximum.reduceat(estimated_1rm(sets['reps'], sets['weight']), trained) if len(trained) else np.zeros(0)
+    best_1rm = np.full(len(periods), np.nan)
+    best_1rm[index[trained]] = best
+    # Volume per period and muscle group from a single bincount over a combined index
+    group_count = len(sets['groups'])
+    by_group = np.bincount(
+        index * group_count + sets['group'], weights=volume_per_set, minlength=len(periods) * group_count,
+    ).reshape(len(periods), group_count)
+    volume_slope, volume_intercept, volume_trend = linear_trend(positions, volume, positions)
+    best_slope, best_intercept, best_trend = linear_trend(index[trained].astype(np.float64), best, positions)
+    return {
+        'bucket': bucket,
+        'window': window,
+        'periods': [str(period) for period in periods],
+        'sets': np.bincount(index, minlength=len(periods)).tolist(),
+        'volume': volume.tolist(),
+        'rolling_volume': rolling_mean(volume, window).tolist(),
+        'volume_trend': {'slope': volume_slope, 'intercept': volume_intercept, 'values': volume_trend.tolist()},
+        'best_1rm': [None if np.isnan(value) else value for value in best_1rm.tolist()], # periods without sets have no record
+        'best_1rm_trend': {'slope': best_slope, 'intercept': best_intercept, 'values': best_trend.tolist()},
+        'muscle_groups': {name: by_group[:, i].tolist() for i, name in enumerate(sets['groups'])},
+    }
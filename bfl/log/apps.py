@@ -2,3 +2,6 @@ from django.apps import AppConfig
 
 class LogConfig(AppConfig):
     name = 'log'
+
+    def ready(self):
+        from . import checks, signals # Register the system checks and connect the signal handlers
@@ -0,0 +1,17 @@
+"""
+Async versions of the history pages, served by the ASGI application (see bfl/asgi_urls.py).
+"""
+
+from asgiref.sync import sync_to_async
+from bfl.async_utils import async_login_required, arender
+from . import views
+
+@async_login_required
+async def history(request):
+    context = await sync_to_async(views.history_context)(request)
+    return await arender(request, 'log/history.html', context)
+
+@async_login_required
+async def exercise_history(request, exercise_id):
+    context = await sync_to_async(views.exercise_history_context)(request, exercise_id)
+    return await arender(request, 'log/exercise-history.html', context)
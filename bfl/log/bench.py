@@ -0,0 +1,79 @@
+"""
+Synthetic training history used by the benchmarks of the log app.
+"""
+
+import random
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .models import Exercise, Workout, WorkoutSet
+
+BENCH_EXERCISES = [
+    ('Bench Press', 'chest'),
+    ('Squat', 'legs'),
+    ('Deadlift', 'back'),
+    ('Overhead Press', 'shoulders'),
+    ('Barbell Row', 'back'),
+    ('Pull Up', 'back'),
+    ('Dip', 'chest'),
+    ('Barbell Curl', 'arms'),
+    ('Lunge', 'legs'),
+    ('Plank', 'core'),
+]
+
+def create_bench_user(username='bench-user'):
+    return User.objects.create_user(username, f'{username}@bench.invalid', 'bench-password')
+
+def populate_history(user, sets, sets_per_workout=20, batch_size=5000, seed=0):
+    """
+    Insert ``sets`` sets for the user spread over one workout per day, ending today,
+    and return the exercises that were used.
+    """
+    rng = random.Random(seed)
+    Exercise.objects.bulk_create(Exercise(name=name, muscle_group=group, user=user) for name, group in BENCH_EXERCISES)
+    exercises = list(Exercise.objects.filter(user=user).order_by('pk')) # SQLite does not return primary keys from bulk_create
+    workout_count = -(-sets // sets_per_workout)
+    start = timezone.now() - timedelta(days=workout_count)
+    Workout.objects.bulk_create(
+        (Workout(user=user, performed_at=start + timedelta(days=day)) for day in range(workout_count)),
+        batch_size=batch_size,
+    )
+    workouts = list(Workout.objects.filter(user=user).order_by('performed_at'))
+    batch = []
+    for i in range(sets):
+        workout = workouts[i // sets_per_workout]
+        exercise = exercises[(i // 4) % len(exercises)]
+        reps = rng.randint(3, 12)
+        weight = float(rng.randint(20, 120)) * 2.5
+        batch.append(WorkoutSet(
+            workout=workout, user=user, exercise=exercise, reps=reps, weight=weight,
+            performed_at=workout.performed_at + timedelta(minutes=i % sets_per_workout * 3),
+        ))
+        workout.set_count += 1
+        workout.total_reps += reps
+        workout.total_volume += reps * weight
+        if len(batch) >= batch_size:
+            WorkoutSet.objects.bulk_create(batch)
+            batch = []
+    WorkoutSet.objects.bulk_create(batch)
+    Workout.objects.bulk_update(workouts, ['set_count', 'total_reps', 'total_volume'], batch_size=batch_size)
+    return exercises
+
+VARIATIONS = ['Paused', 'Tempo', 'Deficit', 'Incline', 'Decline', 'Seated', 'Standing', 'Close Grip', 'Wide Grip', 'Single Arm']
+EQUIPMENT = ['Barbell', 'Dumbbell', 'Kettlebell', 'Cable', 'Machine', 'Band', 'Smith Machine', 'Landmine']
+
+def populate_catalog(entries, batch_size=5000, seed=0):
+    """
+    Insert ``entries`` catalog exercises with names made of a variation, equipment and movement.
+    """
+    rng = random.Random(seed)
+    groups = [group for group, _ in Exercise.MUSCLE_GROUPS]
+    batch = []
+    for i in range(entries):
+        movement, group = BENCH_EXERCISES[i % len(BENCH_EXERCISES)]
+        name = f'{rng.choice(VARIATIONS)} {rng.choice(EQUIPMENT)} {movement} {i // len(BENCH_EXERCISES)}'
+        batch.append(Exercise(name=name, muscle_group=group if rng.random() < 0.9 else rng.choice(groups)))
+        if len(batch) >= batch_size:
+            Exercise.objects.bulk_create(batch)
+            batch = []
+    Exercise.objects.bulk_create(batch)
@@ -0,0 +1,263 @@
+"""
+In-process prefix index of the exercises for autocomplete.
+
+Every exercise is indexed under its name and under the start of each later
+word of it ("Back Squat" under "back squat", then "squat"), in sorted arrays
+searched with ``bisect``, so a lookup costs a binary search plus the results
+instead of a ``LIKE '%term%'`` scan of the table per keystroke.
+
+The shared catalog (exercises without a user) has one index per process,
+built by ``prewarm`` when the WSGI or ASGI application starts. The custom
+exercises of a user get a small index of their own, loaded when the user
+first searches and kept for the most recently active users.
+
+Every index has a version in the cache, bumped when a change to its exercises
+commits. The process that made the change updates its index in place, the
+others see the new version and reload on their next search. Exercises inserted with
+``bulk_create`` send no signals, the code that inserts them calls
+``exercises_created``.
+
+The versions only reach the other processes when the default cache is shared
+by them (settings.CATALOG_SHARED_VERSIONS). Otherwise no index of a user is
+kept between searches and the shared catalog is reloaded every
+settings.CATALOG_RELOAD_INTERVAL seconds.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from bfl import metrics
+from .models import Exercise
+
+MAX_USERS = 1000 # Indexes of custom exercises kept per process
+MAX_RESULTS = 50
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    return ' '.join(_WORD.findall(text.casefold()))
+
+
+def word_keys(name):
+    """
+    Return the keys a name is found under besides itself: the name from the start of each later word.
+    """
+    words = normalize(name).split(' ')
+    return {' '.join(words[i:]) for i in range(1, len(words))}
+
+
+def _scan(keys, prefix, found, limit):
+    """
+    Add the ids of keys starting with the prefix to found until it holds limit ids.
+    """
+    i = bisect_left(keys, (prefix,))
+    while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+        if keys[i][1] not in found: # Found under several of its words
+            found.append(keys[i][1])
+        i += 1
+
+
+class PrefixIndex:
+    """
+    Sorted arrays of (name, exercise id) and (later word key, exercise id), with the exercises by id.
+    """
+
+    def __init__(self, exercises=()):
+        self.exercises = {pk: (name, muscle_group) for pk, name, muscle_group in exercises}
+        self.names = sorted((normalize(name), pk) for pk, (name, _) in self.exercises.items())
+        self.words = sorted((key, pk) for pk, (name, _) in self.exercises.items() for key in word_keys(name))
+
+    def __len__(self):
+        return len(self.exercises)
+
+    def keys(self, name):
+        return [(self.names, normalize(name))] + [(self.words, key) for key in word_keys(name)]
+
+    def add(self, pk, name, muscle_group):
+        self.remove(pk) # A renamed exercise moves to its new keys
+        self.exercises[pk] = (name, muscle_group)
+        for keys, key in self.keys(name):
+            insort(keys, (key, pk))
+
+    def remove(self, pk):
+        if pk not in self.exercises:
+            return
+        name, _ = self.exercises.pop(pk)
+        for keys, key in self.keys(name):
+            i = bisect_left(keys, (key, pk))
+            if i < len(keys) and keys[i] == (key, pk):
+                del keys[i]
+
+    def search(self, term, limit):
+        """
+        Return (id, name, muscle group) of up to limit exercises with a word starting
+        with the term, the ones whose name starts with it first.
+        """
+        prefix = normalize(term)
+        found = []
+        if prefix:
+            _scan(self.names, prefix, found, limit)
+            _scan(self.words, prefix, found, limit)
+        return [(pk, *self.exercises[pk]) for pk in found]
+
+
+def _version_key(owner):
+    return f'catalog-version:{owner}'
+
+
+def catalog_version(owner):
+    """
+    Return the current version of the index of the owner, a user id or 'shared' for the catalog.
+    """
+    version = cache.get(_version_key(owner))
+    if version is None:
+        # From the clock, so an evicted version never comes back and every process reloads
+        version = time.time_ns()
+        cache.add(_version_key(owner), version, timeout=None)
+        version = cache.get(_version_key(owner), version)
+    return version
+
+
+def bump_catalog_version(owner):
+    try:
+        return cache.incr(_version_key(owner))
+    except ValueError: # No version yet
+        version = time.time_ns()
+        cache.set(_version_key(owner), version, timeout=None)
+        return version
+
+
+def load(owner):
+    exercises = Exercise.objects.filter(user=None if owner == 'shared' else owner)
+    return PrefixIndex(exercises.order_by().values_list('id', 'name', 'muscle_group'))
+
+
+class Catalog:
+    def __init__(self):
+        self.indexes = OrderedDict() # owner -> (version or time loaded, PrefixIndex), the shared catalog is never evicted
+        self.lock = threading.Lock()
+
+    def index(self, owner):
+        """
+        Return the index of the owner, reloading it if another process changed it.
+        """
+        if not settings.CATALOG_SHARED_VERSIONS:
+            return self.local_index(owner)
+        version = catalog_version(owner)
+        with self.lock:
+            current = self.indexes.get(owner)
+            if current is not None and current[0] == version:
+                self.indexes.move_to_end(owner)
+                return current[1]
+        metrics.incr('catalog.reload')
+        index = load(owner)
+        with self.lock:
+            self.indexes[owner] = (version, index)
+            self.indexes.move_to_end(owner)
+            users = [key for key in self.indexes if key != 'shared']
+            for key in users[:max(0, len(users) - MAX_USERS)]: # The least recently used
+                del self.indexes[key]
+        return index
+
+    def local_index(self, owner):
+        """
+        Return the index of the owner when changes made by other processes cannot be
+        seen: a new index of the user's exercises, or the shared catalog reloaded at
+        most every CATALOG_RELOAD_INTERVAL seconds.
+        """
+        if owner != 'shared':
+            return load(owner) # A user has a few custom exercises, one indexed query
+        now = time.monotonic()
+        with self.lock:
+            current = self.indexes.get(owner)
+            if current is not None and now - current[0] < settings.CATALOG_RELOAD_INTERVAL:
+                return current[1]
+        metrics.incr('catalog.reload')
+        index = load(owner)
+        with self.lock:
+            self.indexes[owner] = (now, index)
+        return index
+
+    def changed(self, owner, update):
+        """
+        Bump the version of the owner's index and apply update to the index of this
+        process, so only the other processes reload it.
+        """
+        with self.lock:
+            current = self.indexes.get(owner)
+            if not settings.CATALOG_SHARED_VERSIONS:
+                if current is not None: # Loaded at (see local_index)
+                    update(current[1])
+                return
+            version = bump_catalog_version(owner)
+            if current is not None:
+                if current[0] == version - 1: # Nobody else changed it in the meantime
+                    update(current[1])
+                    self.indexes[owner] = (version, current[1])
+                else:
+                    del self.indexes[owner]
+
+    def search(self, user, term, limit=10):
+        """
+        Return [{'id', 'name', 'muscle_group', 'custom'}] of the catalog and custom
+        exercises of the user matching the term, custom exercises first.
+        """
+        limit = min(limit, MAX_RESULTS)
+        results = [
+            {'id': pk, 'name': name, 'muscle_group': muscle_group, 'custom': True}
+            for pk, name, muscle_group in self.index(user.pk).search(term, limit)
+        ]
+        results += [
+            {'id': pk, 'name': name, 'muscle_group': muscle_group, 'custom': False}
+            for pk, name, muscle_group in self.index('shared').search(term, limit - len(results))
+        ]
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+
+catalog = Catalog()
+
+
+def owner_of(exercise):
+    return 'shared' if exercise.user_id is None else exercise.user_id
+
+
+# Applied on commit: a process that reloads earlier would otherwise miss the change for good
+
+def exercise_saved(exercise):
+    update = lambda index: index.add(exercise.pk, exercise.name, exercise.muscle_group)
+    transaction.on_commit(lambda: catalog.changed(owner_of(exercise), update))
+
+
+def exercise_deleted(exercise):
+    transaction.on_commit(lambda: catalog.changed(owner_of(exercise), lambda index: index.remove(exercise.pk)))
+
+
+def exercises_created(user_id):
+    """
+    Make every process reload the custom exercises of the user, after a bulk_create.
+    """
+    transaction.on_commit(lambda: bump_catalog_version(user_id))
+
+
+def search(user, term, limit=10):
+    return catalog.search(user, term, limit)
+
+
+def prewarm():
+    """
+    Build the index of the shared catalog and return its size.
+    """
+    try:
+        return len(catalog.index('shared'))
+    except DatabaseError: # Not migrated yet, the first search builds it
+        return 0
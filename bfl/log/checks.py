@@ -0,0 +1,48 @@
+"""
+System checks of the database objects the migrations create outside of the models.
+"""
+
+from django.core import checks
+from django.db import connections
+
+# The triggers of migration 0004_search keeping the full-text index up to date. SQLite drops the
+# triggers of a table it rebuilds (e.g. for an AlterField), and the search would silently go stale.
+SEARCH_TRIGGERS = {
+    'sqlite': [
+        'log_search_workout_insert', 'log_search_workout_update', 'log_search_workout_delete',
+        'log_search_set_insert', 'log_search_set_update', 'log_search_set_delete',
+        'log_search_exercise_update',
+    ],
+    'postgresql': ['log_search_workout', 'log_search_set', 'log_search_exercise'],
+}
+
+TRIGGER_NAMES = {
+    'sqlite': "SELECT name FROM sqlite_master WHERE type = 'trigger'",
+    'postgresql': 'SELECT tgname FROM pg_trigger WHERE NOT tgisinternal',
+}
+
+
+def missing_search_triggers(connection):
+    """
+    Return the names of the search index triggers missing from the database, none if it has no index.
+    """
+    if connection.vendor not in SEARCH_TRIGGERS or 'log_search' not in connection.introspection.table_names():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(TRIGGER_NAMES[connection.vendor])
+        names = {name for name, in cursor.fetchall()}
+    return [name for name in SEARCH_TRIGGERS[connection.vendor] if name not in names]
+
+
+@checks.register(checks.Tags.database)
+def check_search_triggers(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or []:
+        missing = missing_search_triggers(connections[alias])
+        if missing:
+            errors.append(checks.Error(
+                f'The triggers keeping the search index up to date are missing: {", ".join(missing)}.',
+                hint='A migration rebuilt log_workout, log_workoutset or log_exercise, recreate them as in log/migrations/0004_search.py.',
+                id='log.E001',
+            ))
+    return errors
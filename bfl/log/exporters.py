@@ -0,0 +1,101 @@
+"""
+Export of a user's full training history.
+
+The sets are read with a server-side cursor (``iterator(chunk_size=...)``) and
+written as CSV or newline delimited JSON while the response is being sent, so
+memory use depends on the chunk size and not on the length of the history.
+The records have the fields read by log/importers.py, so an export can be
+imported again.
+"""
+
+import csv
+import json
+import zlib
+from django.utils import timezone
+from .models import WorkoutSet
+
+FORMATS = ('csv', 'ndjson')
+FIELDS = ('performed_at', 'exercise', 'reps', 'weight', 'notes')
+CHUNK_SIZE = 2000 # Rows fetched from the database at a time
+WRITE_SIZE = 64 * 1024 # Characters collected before a piece of the response is sent
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Line:
+    """
+    File-like object for csv.writer that returns the written line instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(user, chunk_size=CHUNK_SIZE):
+    """
+    Yield (performed_at, exercise name, reps, weight, notes) of every set of the
+    user, oldest first. Tuples instead of models keep the cost per row low.
+    """
+    tz = timezone.get_current_timezone()
+    rows = (
+        WorkoutSet.objects.filter(user=user).order_by('performed_at', 'id')
+        .values_list('performed_at', 'exercise__name', 'reps', 'weight', 'notes')
+        .iterator(chunk_size=chunk_size)
+    )
+    for performed_at, exercise, reps, weight, notes in rows:
+        yield timezone.localtime(performed_at, tz).isoformat(), exercise, reps, weight, notes
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_ndjson(rows):
+    encoder = json.JSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(FIELDS, row))) + '\n'
+
+
+def buffered(lines, size):
+    """
+    Join the lines into pieces of about size characters, a piece per row would
+    mean a write (and a gzip flush) per row.
+    """
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gzipped(pieces):
+    """
+    Compress a stream of byte strings into a gzip file, piece by piece.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits 31: gzip header and trailer
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(user, fmt, compress=False, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator over the bytes of the export of the user's history.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported format "{fmt}".')
+    lines = (iter_csv if fmt == 'csv' else iter_ndjson)(export_rows(user, chunk_size))
+    pieces = (piece.encode() for piece in buffered(lines, WRITE_SIZE))
+    return gzipped(pieces) if compress else pieces
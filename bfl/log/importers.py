@@ -0,0 +1,269 @@
+"""
+Bulk import of sets exported from other trackers.
+
+Files are read as a stream of records (CSV, a JSON array or newline delimited
+JSON), validated in chunks and written with ``bulk_create`` in one transaction
+per chunk, so memory use is bounded by the chunk size rather than the file size.
+
+Every record is one set with the fields ``performed_at`` (an ISO date or
+datetime), ``exercise``, ``reps`` and optionally ``weight`` and ``notes``. The
+sets of each day are grouped into a new workout. Exercise names that are not in
+the catalog become custom exercises of the user.
+"""
+
+import codecs
+import csv
+import json
+import math
+import re
+import time
+from datetime import datetime, time as dt_time
+from itertools import islice
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Exercise, Workout, WorkoutSet
+from . import catalog, services
+
+FORMATS = ('csv', 'json')
+BATCH_SIZE = 1000 # Number of records validated and written per transaction
+MAX_ERRORS = 100 # Stop reporting invalid records after this many
+READ_SIZE = 64 * 1024
+MAX_RECORD_SIZE = 1024 * 1024 # A JSON record that is still incomplete after this many characters is rejected
+MAX_REPS = 10000
+MAX_WEIGHT = 10000.0
+
+_WHITESPACE = re.compile(r'[\s,]*') # Separators between the objects of a JSON array or lines of NDJSON
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0 # Records read from the file
+        self.created = 0 # Sets written to the database
+        self.errors = [] # (row number, message) of the first MAX_ERRORS invalid records
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'invalid': self.rows - self.created,
+            'errors': [{'row': row, 'message': message} for row, message in self.errors],
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def format_for(filename, default='csv'):
+    """
+    Guess the format of a file from its name.
+    """
+    if filename.lower().endswith(('.json', '.jsonl', '.ndjson')):
+        return 'json'
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_csv(stream):
+    """
+    Yield the rows of a binary CSV stream with a header row as dicts.
+    """
+    yield from csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+
+
+def iter_json(stream):
+    """
+    Yield the objects of a binary stream holding either a JSON array or
+    newline delimited JSON, without reading the whole stream into memory.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof, array = '', 0, False, None
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if array is None and pos < len(buffer):
+            array = buffer[pos] == '['
+            if array:
+                pos += 1
+            continue
+        if array and buffer.startswith(']', pos):
+            return
+        if pos < len(buffer):
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f'Invalid JSON near character {pos} of the current chunk.')
+            else:
+                yield obj
+                continue
+        elif eof:
+            if array:
+                raise ValueError('The JSON array is not closed.')
+            return
+        if len(buffer) - pos > MAX_RECORD_SIZE:
+            raise ValueError('Invalid JSON or a record that is too large.')
+        chunk = stream.read(READ_SIZE) # The next object is incomplete, read more of the stream
+        eof = not chunk
+        buffer = buffer[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+
+
+def iter_records(stream, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported format "{fmt}".')
+    return iter_csv(stream) if fmt == 'csv' else iter_json(stream)
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of up to size items from the iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_record(record, tz=None):
+    """
+    Validate a record and return (performed_at, exercise name, reps, weight, notes).
+    Naive datetimes are interpreted in the given time zone, the current one by default.
+    Raises ValueError with a message for the user if the record is invalid.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Expected an object with the fields of a set.')
+    value = str(record.get('performed_at') or '').strip()
+    performed_at = parse_datetime(value)
+    if performed_at is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError('"performed_at" must be an ISO date or datetime.')
+        performed_at = datetime.combine(day, dt_time())
+    if timezone.is_naive(performed_at):
+        performed_at = timezone.make_aware(performed_at, tz)
+    exercise = str(record.get('exercise') or '').strip()
+    if not exercise or len(exercise) > Exercise._meta.get_field('name').max_length:
+        raise ValueError('"exercise" must be a name of at most 100 characters.')
+    try:
+        reps = int(record.get('reps'))
+        weight = float(record.get('weight') or 0)
+    except (TypeError, ValueError, OverflowError): # OverflowError for an infinite reps in JSON
+        raise ValueError('"reps" and "weight" must be numbers.')
+    if not 0 < reps <= MAX_REPS:
+        raise ValueError(f'"reps" must be between 1 and {MAX_REPS}.')
+    if not math.isfinite(weight) or not 0 <= weight <= MAX_WEIGHT: # NaN would be stored as NULL
+        raise ValueError(f'"weight" must be between 0 and {MAX_WEIGHT:g}.')
+    notes = str(record.get('notes') or '')
+    if len(notes) > WorkoutSet._meta.get_field('notes').max_length:
+        raise ValueError('"notes" must be at most 255 characters.')
+    return performed_at, exercise, reps, weight, notes
+
+
+class SetImporter:
+    """
+    Import the sets of a stream for a user, see the module docstring for the format.
+    """
+
+    def __init__(self, user, batch_size=BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.exercises = None # lower case name -> exercise id, loaded on first use
+        self.workouts = {} # day -> id of the workout created by this import
+        self.tz = timezone.get_current_timezone() # Looked up once, it is needed for every record
+
+    def run(self, stream, fmt='csv'):
+        result = ImportResult()
+        start = time.perf_counter()
+        records = iter_records(stream, fmt)
+        try:
+            for chunk in chunked(records, self.batch_size):
+                self.import_chunk(chunk, result)
+        except ValueError as e: # The stream itself is malformed, keep what was imported so far
+            self.add_error(result, result.rows + 1, str(e))
+        except csv.Error as e:
+            self.add_error(result, result.rows + 1, f'Invalid CSV: {e}')
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def add_error(self, result, row, message):
+        if len(result.errors) < MAX_ERRORS:
+            result.errors.append((row, message))
+
+    def import_chunk(self, chunk, result):
+        parsed = []
+        for record in chunk:
+            result.rows += 1
+            try:
+                performed_at, name, reps, weight, notes = parse_record(record, self.tz)
+            except ValueError as e:
+                self.add_error(result, result.rows, str(e))
+            else:
+                parsed.append((performed_at, performed_at.astimezone(self.tz).date(), name, reps, weight, notes))
+        if not parsed:
+            return
+        with transaction.atomic(): # One transaction per chunk keeps the write lock short and the number of commits low
+            exercise_ids = self.exercise_ids({name for _, _, name, _, _, _ in parsed})
+            workout_ids = self.workout_ids(parsed)
+            sets = [
+                WorkoutSet(
+                    workout_id=workout_ids[day], user=self.user, exercise_id=exercise_ids[name.lower()],
+                    performed_at=performed_at, reps=reps, weight=weight, notes=notes,
+                )
+                for performed_at, day, name, reps, weight, notes in parsed
+            ]
+            WorkoutSet.objects.bulk_create(sets, batch_size=self.batch_size)
+            services.sets_created(sets)
+        result.created += len(sets)
+
+    def exercise_ids(self, names):
+        """
+        Return {lower case name: id} for the names, creating the ones the user does not have.
+        """
+        if self.exercises is None:
+            self.exercises = {}
+            # Exercises of the user win over catalog exercises with the same name
+            for name, pk in Exercise.objects.filter(Q(user=None) | Q(user=self.user)).order_by('user').values_list('name', 'id'):
+                self.exercises.setdefault(name.lower(), pk)
+        missing = {}
+        for name in names:
+            if name.lower() not in self.exercises:
+                missing.setdefault(name.lower(), name)
+        if missing:
+            Exercise.objects.bulk_create(Exercise(name=name, user=self.user) for name in missing.values())
+            catalog.exercises_created(self.user.pk)
+            for name, pk in Exercise.objects.filter(user=self.user, name__in=missing.values()).values_list('name', 'id'):
+                self.exercises[name.lower()] = pk
+        return self.exercises
+
+    def workout_ids(self, parsed):
+        """
+        Return {day: workout id} for the days of the parsed records, creating a workout for each new day.
+        """
+        first_set = {}
+        for performed_at, day, _, _, _, _ in parsed:
+            if day not in self.workouts and (day not in first_set or performed_at < first_set[day]):
+                first_set[day] = performed_at
+        if first_set:
+            last_id = Workout.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            Workout.objects.bulk_create(Workout(user=self.user, performed_at=performed_at) for performed_at in first_set.values())
+            # SQLite does not return primary keys from bulk_create, read them back
+            created = Workout.objects.filter(user=self.user, id__gt=last_id, performed_at__in=first_set.values())
+            for performed_at, pk in created.values_list('performed_at', 'id'):
+                self.workouts[performed_at.astimezone(self.tz).date()] = pk
+        return self.workouts
+
+
+def import_sets(user, stream, fmt='csv', batch_size=BATCH_SIZE):
+    """
+    Import the sets of a binary stream for the user and return an ImportResult.
+    """
+    return SetImporter(user, batch_size).run(stream, fmt)
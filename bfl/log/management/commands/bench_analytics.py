@@ -0,0 +1,79 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bfl.bench import rolled_back, measure, format_table
+from log import analytics
+from log.bench import create_bench_user, populate_history
+from log.models import WorkoutSet
+
+def naive_weekly_progress(user, window=4):
+    """
+    The per object implementation the analytics module replaces: loop over model
+    instances and accumulate the statistics in dicts.
+    """
+    volume = defaultdict(float)
+    best = {}
+    groups = defaultdict(lambda: defaultdict(float))
+    for workout_set in WorkoutSet.objects.filter(user=user).select_related('exercise').order_by('performed_at'):
+        day = timezone.localtime(workout_set.performed_at).date()
+        week = day - timedelta(days=day.weekday())
+        volume[week] += workout_set.volume
+        best[week] = max(best.get(week, 0), workout_set.estimated_1rm)
+        groups[workout_set.exercise.muscle_group][week] += workout_set.volume
+    weeks = []
+    if volume:
+        week = min(volume)
+        while week <= max(volume):
+            weeks.append(week)
+            week += timedelta(days=7)
+    values = [volume.get(week, 0.0) for week in weeks]
+    rolling = []
+    for i in range(len(values)):
+        previous = values[max(0, i - window + 1):i + 1]
+        rolling.append(sum(previous) / len(previous))
+    n = len(values)
+    mean_x = (n - 1) / 2 if n else 0
+    mean_y = sum(values) / n if n else 0
+    denominator = sum((x - mean_x) ** 2 for x in range(n)) or 1
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / denominator
+    return {
+        'periods': [str(week) for week in weeks],
+        'volume': values,
+        'rolling_volume': rolling,
+        'volume_slope': slope,
+        'best_1rm': [best.get(week) for week in weeks],
+        'muscle_groups': {group: [by_week.get(week, 0.0) for week in weeks] for group, by_week in groups.items()},
+    }
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized progress analytics with a per object implementation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sets', type=int, nargs='+', default=[10000, 100000], help='History sizes to measure.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = []
+        for sets in options['sets']:
+            with rolled_back():
+                user = create_bench_user()
+                populate_history(user, sets)
+                vectorized = analytics.progress(user)
+                naive = naive_weekly_progress(user)
+                same = (
+                    vectorized['periods'] == naive['periods']
+                    and all(abs(a - b) < 1e-6 for a, b in zip(vectorized['volume'], naive['volume']))
+                    and all(abs(a - b) < 1e-6 for a, b in zip(vectorized['rolling_volume'], naive['rolling_volume']))
+                    and abs(vectorized['volume_trend']['slope'] - naive['volume_slope']) < 1e-6
+                )
+                vectorized_ms = measure(lambda: analytics.progress(user), options['repeat'], warmup=1)['p50_ms']
+                naive_ms = measure(lambda: naive_weekly_progress(user), options['repeat'], warmup=1)['p50_ms']
+                rows.append({
+                    'sets': sets,
+                    'vectorized p50 ms': vectorized_ms,
+                    'naive p50 ms': naive_ms,
+                    'speedup': f'{naive_ms / vectorized_ms:.1f}x',
+                    'same results': same,
+                })
+        self.stdout.write(format_table(rows, ['sets', 'vectorized p50 ms', 'naive p50 ms', 'speedup', 'same results']))
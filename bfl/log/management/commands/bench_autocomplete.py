@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.test import Client, override_settings
+from django.urls import reverse
+from bfl.bench import rolled_back, measure, format_table
+from log import catalog
+from log.bench import create_bench_user, populate_catalog
+from log.models import Exercise
+
+TERMS = ['s', 'sq', 'squa', 'press', 'dumbbell b', 'paused barbell squat 12', 'xyz']
+
+class Command(BaseCommand):
+    help = 'Time exercise autocomplete from the prefix index against LIKE queries on a large catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=50000, help='Exercises in the catalog.')
+        parser.add_argument('--repeat', type=int, default=200, help='Number of timed lookups per term.')
+
+    def handle(self, *args, **options):
+        rows = []
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver']): # Nothing the benchmark creates is kept
+            user = create_bench_user()
+            populate_catalog(options['entries'])
+            catalog.catalog.clear()
+            start = time.perf_counter()
+            catalog.prewarm()
+            self.stdout.write(f"Index of {options['entries']} exercises built in {(time.perf_counter() - start) * 1000:.0f} ms")
+            visible = Exercise.objects.filter(Q(user=None) | Q(user=user))
+            client = Client()
+            client.force_login(user)
+            url = reverse('exercise_autocomplete')
+            for term in TERMS:
+                repeat = options['repeat']
+                rows.append({
+                    'term': term,
+                    'results': len(catalog.search(user, term)),
+                    'index ms': measure(lambda: catalog.search(user, term), repeat)['p50_ms'],
+                    'endpoint ms': measure(lambda: client.get(url, {'q': term}), repeat // 4)['p50_ms'],
+                    'contains ms': measure(lambda: list(visible.filter(name__icontains=term)[:10]), repeat // 4)['p50_ms'],
+                    'startswith ms': measure(lambda: list(visible.filter(name__istartswith=term)[:10]), repeat // 4)['p50_ms'],
+                })
+        catalog.catalog.clear() # The index holds the exercises that were rolled back
+        self.stdout.write('p50 per lookup of 10 suggestions')
+        self.stdout.write(format_table(rows, ['term', 'results', 'index ms', 'endpoint ms', 'contains ms', 'startswith ms']))
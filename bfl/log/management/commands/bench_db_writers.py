@@ -0,0 +1,97 @@
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.test import override_settings
+from bfl.bench import format_table
+from bfl.metrics import Timing
+from log.models import Exercise, Workout, WorkoutSet
+
+PREFIX = 'bench-writer-'
+EXERCISE = 'Bench Writer Squat'
+
+# SQLite's own defaults, to compare the tuned PRAGMAs against
+SQLITE_DEFAULTS = {
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'busy_timeout': 5000,
+    'mmap_size': 0,
+}
+
+class Command(BaseCommand):
+    help = 'Measure throughput and latency of many threads logging sets at the same time on the configured database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 16], help='Numbers of concurrent writers to run.')
+        parser.add_argument('--sets', type=int, default=200, help='Sets logged by each writer.')
+        parser.add_argument('--compare-defaults', action='store_true', help='On SQLite, also run with the default journaling.')
+
+    def handle(self, *args, **options):
+        profiles = [('configured', settings.SQLITE_PRAGMAS if connection.vendor == 'sqlite' else None)]
+        if options['compare_defaults'] and connection.vendor == 'sqlite':
+            profiles.insert(0, ('sqlite defaults', SQLITE_DEFAULTS))
+        # Writes are committed like real ones, so the data is deleted afterwards
+        User.objects.filter(username__startswith=PREFIX).delete()
+        rows = []
+        try:
+            for profile, pragmas in profiles:
+                with override_settings(**({'SQLITE_PRAGMAS': pragmas} if pragmas is not None else {})):
+                    connection.close() # Reopen with the PRAGMAs of the profile, journal_mode is stored in the file
+                    for writers in options['writers']:
+                        rows.append({'backend': connection.vendor, 'profile': profile, **self.run(writers, options['sets'])})
+        finally:
+            connection.close()
+            User.objects.filter(username__startswith=PREFIX).delete()
+            Exercise.objects.filter(name=EXERCISE, user=None).delete()
+        self.stdout.write(format_table(rows, ['backend', 'profile', 'writers', 'sets/s', 'p50_ms', 'p99_ms', 'max_ms', 'errors']))
+
+    def run(self, writers, sets):
+        exercise, _ = Exercise.objects.get_or_create(name=EXERCISE, user=None, defaults={'muscle_group': 'legs'})
+        workouts = []
+        for i in range(writers):
+            user, _ = User.objects.get_or_create(username=f'{PREFIX}{i}', defaults={'email': f'{PREFIX}{i}@bench.invalid'})
+            workouts.append(Workout.objects.create(user=user))
+        timing = Timing()
+        errors = []
+        lock = threading.Lock()
+        start_line = threading.Barrier(writers)
+
+        def write(workout):
+            latencies = []
+            failed = 0
+            try:
+                start_line.wait()
+                for i in range(sets):
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic(): # A set and the statistics it updates, like a request logging it
+                            WorkoutSet.objects.create(workout=workout, user_id=workout.user_id, exercise=exercise, reps=5, weight=100 + i % 10)
+                    except OperationalError: # database is locked
+                        failed += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close() # Every thread has its own connection
+                with lock:
+                    for latency in latencies:
+                        timing.add(latency)
+                    errors.append(failed)
+
+        threads = [threading.Thread(target=write, args=(workout,)) for workout in workouts]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = timing.as_dict()
+        return {
+            'writers': writers,
+            'sets/s': round(stats['count'] / elapsed, 1),
+            'p50_ms': stats['p50_ms'],
+            'p99_ms': stats['p99_ms'],
+            'max_ms': stats['max_ms'],
+            'errors': sum(errors),
+        }
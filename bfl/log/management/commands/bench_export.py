@@ -0,0 +1,51 @@
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import reverse
+from bfl.bench import rolled_back, format_table
+from log.bench import create_bench_user, populate_history
+from log.exporters import export
+from log.views import export_history
+
+class Command(BaseCommand):
+    help = 'Measure time and peak memory of exporting histories of growing length, streamed and built in memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sets', type=int, nargs='+', default=[1000, 10000, 100000], help='History lengths to export.')
+        parser.add_argument('--format', default='csv', choices=['csv', 'ndjson'])
+        parser.add_argument('--gzip', action='store_true', help='Compress the exports.')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        rows = []
+        for sets in options['sets']:
+            with rolled_back(): # Nothing the benchmark creates is kept
+                user = create_bench_user()
+                populate_history(user, sets)
+                query = f"?format={options['format']}{'&compress=gzip' if options['gzip'] else ''}"
+                request = factory.get(reverse('export_history') + query)
+                request.user = user
+
+                def streamed():
+                    return sum(len(piece) for piece in export_history(request).streaming_content)
+
+                def in_memory(): # The whole file as one response body, like an HttpResponse would hold it
+                    return len(b''.join(export(user, options['format'], compress=options['gzip'])))
+
+                for name, func in (('streamed', streamed), ('in memory', in_memory)):
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    size = func()
+                    elapsed = time.perf_counter() - start
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    rows.append({
+                        'sets': sets,
+                        'response': name,
+                        'MB sent': round(size / 2 ** 20, 2),
+                        'seconds': round(elapsed, 2),
+                        'rows/s': round(sets / elapsed),
+                        'peak MB': round(peak / 2 ** 20, 2),
+                    })
+        self.stdout.write(format_table(rows, ['sets', 'response', 'MB sent', 'seconds', 'rows/s', 'peak MB']))
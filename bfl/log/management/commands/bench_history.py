@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import reverse
+from bfl.bench import rolled_back, measure, format_table
+from log.bench import create_bench_user, populate_history
+from log.models import Workout, WorkoutSet
+from log.pagination import KeysetPaginator, encode_cursor
+from log.views import history, exercise_history, HISTORY_PAGE_SIZE
+
+class Command(BaseCommand):
+    help = 'Measure history page latency at increasing depths for a user with a long history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sets', type=int, default=100000, help='Number of sets logged by the benchmark user.')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed requests per page.')
+
+    def handle(self, *args, **options):
+        with rolled_back(): # Nothing the benchmark creates is kept
+            user = create_bench_user()
+            self.stdout.write(f"Logging {options['sets']} sets...")
+            exercise = populate_history(user, options['sets'])[0]
+            pages = [
+                ('history', history, {}, Workout.objects.filter(user=user)),
+                ('exercise_history', exercise_history, {'exercise_id': exercise.pk}, WorkoutSet.objects.filter(user=user, exercise=exercise)),
+                ('every set', None, {}, WorkoutSet.objects.filter(user=user)), # No page lists all sets yet, only the queries are timed
+            ]
+            factory = RequestFactory()
+            rows = []
+            for name, view, kwargs, queryset in pages:
+                ordered = queryset.order_by('-performed_at', '-pk')
+                total = ordered.count()
+                for depth in (0, 0.5, 0.99):
+                    offset = int(total * depth) // HISTORY_PAGE_SIZE * HISTORY_PAGE_SIZE
+                    cursor = encode_cursor(ordered[offset - 1]) if offset else None
+                    paginator = KeysetPaginator(queryset, HISTORY_PAGE_SIZE)
+                    view_ms = '-'
+                    if view is not None:
+                        request = factory.get(reverse(name, kwargs=kwargs), {'cursor': cursor} if cursor else {})
+                        request.user = user
+                        view_ms = measure(lambda: view(request, **kwargs), options['repeat'])['p50_ms']
+                    rows.append({
+                        'page': name,
+                        'rows': total,
+                        'offset': offset,
+                        'view p50 ms': view_ms,
+                        'keyset p50 ms': measure(lambda: paginator.page(cursor), options['repeat'])['p50_ms'],
+                        'OFFSET p50 ms': measure(lambda: list(ordered[offset:offset + HISTORY_PAGE_SIZE + 1]), options['repeat'])['p50_ms'],
+                    })
+            self.stdout.write(format_table(rows, ['page', 'rows', 'offset', 'view p50 ms', 'keyset p50 ms', 'OFFSET p50 ms']))
@@ -0,0 +1,31 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from log.importers import BATCH_SIZE, FORMATS, format_for, import_sets
+
+class Command(BaseCommand):
+    help = 'Import sets for a user from a CSV or JSON file, see log/importers.py for the format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help='File to import, or - to read standard input.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the extension of the file, or csv.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Records validated and written per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User \"{options['username']}\" does not exist.")
+        fmt = options['format'] or format_for(options['path'])
+        if options['path'] == '-':
+            result = import_sets(user, sys.stdin.buffer, fmt, options['batch_size'])
+        else:
+            with open(options['path'], 'rb') as stream:
+                result = import_sets(user, stream, fmt, options['batch_size'])
+        for row, message in result.errors:
+            self.stderr.write(f'Row {row}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} of {result.rows} rows in {result.seconds:.2f}s '
+            f'({result.rows_per_second:.0f} rows/s).'
+        ))
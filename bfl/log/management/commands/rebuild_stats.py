@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from log import services
+from log.models import WorkoutSet
+
+class Command(BaseCommand):
+    help = 'Recompute the training statistics of every user (or the given users) from their sets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild the statistics of these users.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f'Unknown users: {", ".join(sorted(missing))}')
+        else:
+            users = users.filter(pk__in=WorkoutSet.objects.values('user')) # Users without sets have no statistics
+        count = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            services.rebuild_user_stats(user_id) # One transaction per user keeps the write lock short
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the statistics of {count} users.'))
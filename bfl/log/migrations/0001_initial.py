@@ -0,0 +1,73 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Exercise',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('muscle_group', models.CharField(choices=[('chest', 'Chest'), ('back', 'Back'), ('legs', 'Legs'), ('shoulders', 'Shoulders'), ('arms', 'Arms'), ('core', 'Core'), ('full_body', 'Full Body'), ('other', 'Other')], default='other', max_length=20)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercises', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Workout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('performed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notes', models.TextField(blank=True)),
+                ('set_count', models.PositiveIntegerField(default=0)),
+                ('total_reps', models.PositiveIntegerField(default=0)),
+                ('total_volume', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workouts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-performed_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkoutSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('performed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reps', models.PositiveIntegerField()),
+                ('weight', models.FloatField(default=0)),
+                ('notes', models.CharField(blank=True, max_length=255)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='sets', to='log.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('workout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sets', to='log.workout')),
+            ],
+            options={
+                'ordering': ['-performed_at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='workoutset',
+            index=models.Index(fields=['user', 'performed_at'], name='log_set_user_time'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutset',
+            index=models.Index(fields=['user', 'exercise', 'performed_at'], name='log_set_user_exercise_time'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'performed_at'], name='log_workout_user_time'),
+        ),
+    ]
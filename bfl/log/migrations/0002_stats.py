@@ -0,0 +1,61 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('log', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workoutset',
+            name='exercise',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='sets', to='log.exercise'),
+        ),
+        migrations.CreateModel(
+            name='WeeklyVolume',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('set_count', models.PositiveIntegerField(default=0)),
+                ('total_reps', models.PositiveIntegerField(default=0)),
+                ('total_volume', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_volume', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['week'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExerciseStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('set_count', models.PositiveIntegerField(default=0)),
+                ('total_reps', models.PositiveIntegerField(default=0)),
+                ('total_volume', models.FloatField(default=0)),
+                ('best_weight', models.FloatField(default=0)),
+                ('best_1rm', models.FloatField(default=0)),
+                ('last_performed_at', models.DateTimeField(null=True)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='log.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyvolume',
+            constraint=models.UniqueConstraint(fields=('user', 'week'), name='log_weeklyvolume_user_week'),
+        ),
+        migrations.AddIndex(
+            model_name='exercisestats',
+            index=models.Index(fields=['user', 'last_performed_at'], name='log_exercisestats_user_time'),
+        ),
+        migrations.AddConstraint(
+            model_name='exercisestats',
+            constraint=models.UniqueConstraint(fields=('user', 'exercise'), name='log_exercisestats_user_exercise'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+"""
+Ids, versions and modification times for syncing workouts and sets with
+offline clients, and tombstones for deletions (see log/sync.py).
+
+The ids are added empty, filled in a batch at a time and only then made
+unique, since a default on AddField is computed once and shared by every row.
+"""
+
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+
+
+def fill_uuids(apps, schema_editor):
+    for model_name in ('Workout', 'WorkoutSet'):
+        model = apps.get_model('log', model_name)
+        last_pk = 0
+        while True:
+            objs = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk')[:BATCH_SIZE])
+            if not objs:
+                break
+            for obj in objs:
+                obj.uuid = uuid.uuid4()
+            model.objects.bulk_update(objs, ['uuid'])
+            last_pk = objs[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('log', '0002_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='workoutset',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='workout',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='workoutset',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='workoutset',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='workoutset',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'updated_at'], name='log_workout_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutset',
+            index=models.Index(fields=['user', 'updated_at'], name='log_set_user_updated'),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('workout', 'Workout'), ('set', 'Set')], max_length=10)),
+                ('uuid', models.UUIDField()),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'updated_at'], name='log_tombstone_user_updated'),
+        ),
+        migrations.AddConstraint(
+            model_name='tombstone',
+            constraint=models.UniqueConstraint(fields=('kind', 'uuid'), name='log_tombstone_kind_uuid'),
+        ),
+    ]
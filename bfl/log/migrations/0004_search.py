@@ -0,0 +1,144 @@
+"""
+Full-text index of the workout notes and the sets (exercise name and notes),
+searched by log/search.py.
+
+The index is the table log_search, kept up to date by triggers in the
+database, so bulk inserts, queryset updates and raw deletes are indexed like
+single saves. Workouts are stored under the row id ``2 * id`` and sets under
+``2 * id + 1``, which lets the triggers find their row by primary key.
+
+SQLite    an FTS5 table with the owner as the token ``u<user id>`` in its own
+          column, so the owner is matched in the index along with the words.
+PostgreSQL  a table with a generated tsvector column and a GIN index.
+"""
+
+from django.db import migrations
+
+SQLITE = [
+    """CREATE VIRTUAL TABLE log_search USING fts5(owner, body, workout_id UNINDEXED, tokenize = 'porter unicode61')""",
+    """CREATE TRIGGER log_search_workout_insert AFTER INSERT ON log_workout WHEN new.notes != '' BEGIN
+        INSERT INTO log_search (rowid, owner, body, workout_id) VALUES (new.id * 2, 'u' || new.user_id, new.notes, new.id);
+    END""",
+    """CREATE TRIGGER log_search_workout_update AFTER UPDATE OF notes, user_id ON log_workout BEGIN
+        DELETE FROM log_search WHERE rowid = old.id * 2;
+        INSERT INTO log_search (rowid, owner, body, workout_id) SELECT new.id * 2, 'u' || new.user_id, new.notes, new.id WHERE new.notes != '';
+    END""",
+    """CREATE TRIGGER log_search_workout_delete AFTER DELETE ON log_workout BEGIN
+        DELETE FROM log_search WHERE rowid = old.id * 2;
+    END""",
+    """CREATE TRIGGER log_search_set_insert AFTER INSERT ON log_workoutset BEGIN
+        INSERT INTO log_search (rowid, owner, body, workout_id)
+        SELECT new.id * 2 + 1, 'u' || new.user_id, name || ' ' || new.notes, new.workout_id FROM log_exercise WHERE id = new.exercise_id;
+    END""",
+    """CREATE TRIGGER log_search_set_update AFTER UPDATE OF notes, exercise_id, workout_id, user_id ON log_workoutset BEGIN
+        DELETE FROM log_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO log_search (rowid, owner, body, workout_id)
+        SELECT new.id * 2 + 1, 'u' || new.user_id, name || ' ' || new.notes, new.workout_id FROM log_exercise WHERE id = new.exercise_id;
+    END""",
+    """CREATE TRIGGER log_search_set_delete AFTER DELETE ON log_workoutset BEGIN
+        DELETE FROM log_search WHERE rowid = old.id * 2 + 1;
+    END""",
+    """CREATE TRIGGER log_search_exercise_update AFTER UPDATE OF name ON log_exercise BEGIN
+        UPDATE log_search SET body = new.name || ' ' || (SELECT notes FROM log_workoutset WHERE id = log_search.rowid / 2)
+        WHERE rowid IN (SELECT id * 2 + 1 FROM log_workoutset WHERE exercise_id = new.id);
+    END""",
+    """INSERT INTO log_search (rowid, owner, body, workout_id)
+    SELECT id * 2, 'u' || user_id, notes, id FROM log_workout WHERE notes != ''""",
+    """INSERT INTO log_search (rowid, owner, body, workout_id)
+    SELECT s.id * 2 + 1, 'u' || s.user_id, e.name || ' ' || s.notes, s.workout_id FROM log_workoutset s JOIN log_exercise e ON e.id = s.exercise_id""",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER log_search_workout_insert',
+    'DROP TRIGGER log_search_workout_update',
+    'DROP TRIGGER log_search_workout_delete',
+    'DROP TRIGGER log_search_set_insert',
+    'DROP TRIGGER log_search_set_update',
+    'DROP TRIGGER log_search_set_delete',
+    'DROP TRIGGER log_search_exercise_update',
+    'DROP TABLE log_search',
+]
+
+POSTGRESQL = [
+    """CREATE TABLE log_search (
+        id bigint PRIMARY KEY,
+        user_id integer NOT NULL,
+        workout_id integer NOT NULL,
+        body text NOT NULL,
+        document tsvector GENERATED ALWAYS AS (to_tsvector('english', body)) STORED
+    )""",
+    'CREATE INDEX log_search_document ON log_search USING GIN (document)',
+    'CREATE INDEX log_search_user ON log_search (user_id)',
+    """CREATE FUNCTION log_search_workout() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM log_search WHERE id = OLD.id * 2;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.notes <> '' THEN
+            INSERT INTO log_search (id, user_id, workout_id, body) VALUES (NEW.id * 2, NEW.user_id, NEW.id, NEW.notes);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER log_search_workout AFTER INSERT OR DELETE OR UPDATE OF notes, user_id ON log_workout
+    FOR EACH ROW EXECUTE FUNCTION log_search_workout()""",
+    """CREATE FUNCTION log_search_set() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM log_search WHERE id = OLD.id * 2 + 1;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO log_search (id, user_id, workout_id, body)
+            SELECT NEW.id * 2 + 1, NEW.user_id, NEW.workout_id, name || ' ' || NEW.notes FROM log_exercise WHERE id = NEW.exercise_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER log_search_set AFTER INSERT OR DELETE OR UPDATE OF notes, exercise_id, workout_id, user_id ON log_workoutset
+    FOR EACH ROW EXECUTE FUNCTION log_search_set()""",
+    """CREATE FUNCTION log_search_exercise() RETURNS trigger AS $$
+    BEGIN
+        UPDATE log_search SET body = NEW.name || ' ' || s.notes FROM log_workoutset s
+        WHERE s.exercise_id = NEW.id AND log_search.id = s.id * 2 + 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER log_search_exercise AFTER UPDATE OF name ON log_exercise
+    FOR EACH ROW EXECUTE FUNCTION log_search_exercise()""",
+    """INSERT INTO log_search (id, user_id, workout_id, body)
+    SELECT id * 2, user_id, id, notes FROM log_workout WHERE notes <> ''""",
+    """INSERT INTO log_search (id, user_id, workout_id, body)
+    SELECT s.id * 2 + 1, s.user_id, s.workout_id, e.name || ' ' || s.notes FROM log_workoutset s JOIN log_exercise e ON e.id = s.exercise_id""",
+]
+
+POSTGRESQL_REVERSE = [
+    'DROP TRIGGER log_search_workout ON log_workout',
+    'DROP TRIGGER log_search_set ON log_workoutset',
+    'DROP TRIGGER log_search_exercise ON log_exercise',
+    'DROP FUNCTION log_search_workout()',
+    'DROP FUNCTION log_search_set()',
+    'DROP FUNCTION log_search_exercise()',
+    'DROP TABLE log_search',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []): # Other databases have no full-text index
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log', '0003_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE, 'postgresql': POSTGRESQL}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log', '0004_search'),
+    ]
+
+    operations = [
+        # Only the default changes, which is not in the schema. On SQLite an AlterField would
+        # rebuild the table and drop the triggers of the search index.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='workoutset',
+                name='performed_at',
+                field=models.DateTimeField(blank=True),
+            ),
+        ]),
+    ]
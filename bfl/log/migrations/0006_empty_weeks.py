@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:20
+
+from django.db import migrations
+
+
+def delete_empty_weeks(apps, schema_editor):
+    # Left behind when the last set of a week was deleted or moved, before services._apply removed them
+    apps.get_model('log', 'WeeklyVolume').objects.filter(set_count=0).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log', '0005_set_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_empty_weeks, migrations.RunPython.noop),
+    ]
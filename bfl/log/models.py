@@ -1,3 +1,189 @@
+from uuid import uuid4
 from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
 
-# Create your models here.
+def estimated_1rm(reps, weight):
+    """
+    Estimate the one rep max from a set with the Epley formula.
+    """
+    return weight if reps == 1 else weight * (1 + reps / 30)
+
+class Exercise(models.Model):
+    MUSCLE_GROUPS = [
+        ('chest', 'Chest'),
+        ('back', 'Back'),
+        ('legs', 'Legs'),
+        ('shoulders', 'Shoulders'),
+        ('arms', 'Arms'),
+        ('core', 'Core'),
+        ('full_body', 'Full Body'),
+        ('other', 'Other'),
+    ]
+    name = models.CharField(max_length=100)
+    muscle_group = models.CharField(max_length=20, choices=MUSCLE_GROUPS, default='other')
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='exercises') # empty for the shared catalog, set for exercises a user created
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class Workout(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workouts')
+    performed_at = models.DateTimeField(default=timezone.now)
+    notes = models.TextField(blank=True)
+    # Summary of the sets in the workout so lists never have to aggregate the sets, kept up to date by log/services.py
+    set_count = models.PositiveIntegerField(default=0)
+    total_reps = models.PositiveIntegerField(default=0)
+    total_volume = models.FloatField(default=0) # sum of reps * weight over every set
+    # Offline clients create workouts and sets with their own ids and count their versions, see log/sync.py
+    uuid = models.UUIDField(default=uuid4, unique=True, editable=False)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-performed_at', '-id']
+        indexes = [
+            models.Index(fields=['user', 'performed_at'], name='log_workout_user_time'),
+            models.Index(fields=['user', 'updated_at'], name='log_workout_user_updated'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} Workout ({self.performed_at:%Y-%m-%d})'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_time() # Lets the sets be moved along when the workout is moved
+        return instance
+
+    def remember_time(self):
+        self._saved_performed_at = self.__dict__.get('performed_at')
+
+class WorkoutSet(models.Model):
+    workout = models.ForeignKey(Workout, on_delete=models.CASCADE, related_name='sets')
+    # user and performed_at are copied from the workout so a user's history can be read from this table alone,
+    # performed_at unless the set has a time of its own, and the sets move along when the workout is moved
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    exercise = models.ForeignKey(Exercise, on_delete=models.RESTRICT, related_name='sets') # custom exercises can only be deleted along with their sets
+    performed_at = models.DateTimeField(blank=True)
+    reps = models.PositiveIntegerField()
+    weight = models.FloatField(default=0)
+    notes = models.CharField(max_length=255, blank=True)
+    uuid = models.UUIDField(default=uuid4, unique=True, editable=False)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-performed_at', '-id']
+        indexes = [
+            models.Index(fields=['user', 'performed_at'], name='log_set_user_time'),
+            models.Index(fields=['user', 'exercise', 'performed_at'], name='log_set_user_exercise_time'),
+            models.Index(fields=['user', 'updated_at'], name='log_set_user_updated'),
+        ]
+
+    def __str__(self):
+        return f'{self.exercise} {self.reps} x {self.weight:g}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_values() # Lets the summaries apply only the difference when the set is changed
+        return instance
+
+    @property
+    def volume(self):
+        return self.reps * self.weight
+
+    @property
+    def estimated_1rm(self):
+        return estimated_1rm(self.reps, self.weight)
+
+    def tracked_values(self):
+        """
+        Return the values the summaries and statistics are computed from.
+        """
+        return {name: self.__dict__.get(name) for name in ('workout_id', 'user_id', 'exercise_id', 'performed_at', 'reps', 'weight')}
+
+    def remember_values(self):
+        """
+        Remember the values the summaries and statistics currently account for.
+        """
+        self._saved_values = self.tracked_values()
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.workout.user_id
+        if self.performed_at is None:
+            self.performed_at = self.workout.performed_at
+        super().save(*args, **kwargs)
+
+class ExerciseStats(models.Model):
+    """
+    Running totals and personal records of a user for an exercise, kept up to date by log/services.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exercise_stats')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='+')
+    set_count = models.PositiveIntegerField(default=0)
+    total_reps = models.PositiveIntegerField(default=0)
+    total_volume = models.FloatField(default=0)
+    best_weight = models.FloatField(default=0)
+    best_1rm = models.FloatField(default=0) # best estimated one rep max
+    last_performed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='log_exercisestats_user_exercise'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'last_performed_at'], name='log_exercisestats_user_time'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} {self.exercise} Stats'
+
+class WeeklyVolume(models.Model):
+    """
+    Totals of a user for a week starting on Monday, kept up to date by log/services.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weekly_volume')
+    week = models.DateField()
+    set_count = models.PositiveIntegerField(default=0)
+    total_reps = models.PositiveIntegerField(default=0)
+    total_volume = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['week']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'week'], name='log_weeklyvolume_user_week'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} Week of {self.week}'
+
+class Tombstone(models.Model):
+    """
+    Record of a deleted workout or set, so the clients that still have it learn of the deletion when they sync.
+    """
+    KINDS = [
+        ('workout', 'Workout'),
+        ('set', 'Set'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    uuid = models.UUIDField()
+    version = models.PositiveIntegerField(default=1) # Version of the deletion, an older change cannot bring the object back
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'uuid'], name='log_tombstone_kind_uuid'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='log_tombstone_user_updated'),
+        ]
+
+    def __str__(self):
+        return f'Deleted {self.kind} {self.uuid}'
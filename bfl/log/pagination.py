@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination for a user's history.
+
+Pages are read with ``WHERE (performed_at, id) < (cursor)`` on an indexed
+ordering instead of ``OFFSET``, so every page costs the same no matter how
+deep into the history it is.
+"""
+
+import base64
+from django.utils.dateparse import parse_datetime
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(obj, field='performed_at'):
+    """
+    Return an opaque cursor pointing right after the given object.
+    """
+    value = f'{getattr(obj, field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Return the (datetime, primary key) pair encoded in the cursor.
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = value.split('|')
+        performed_at = parse_datetime(timestamp)
+        pk = int(pk)
+    except ValueError as e: # binascii.Error and UnicodeDecodeError are both ValueErrors
+        raise InvalidCursor(cursor) from e
+    if performed_at is None:
+        raise InvalidCursor(cursor)
+    return performed_at, pk
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+class KeysetPaginator:
+    """
+    Paginate a queryset from the newest to the oldest object by the given datetime field.
+    """
+
+    def __init__(self, queryset, per_page, field='performed_at'):
+        self.queryset = queryset.order_by(f'-{field}', '-pk')
+        self.per_page = per_page
+        self.field = field
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            value, pk = decode_cursor(cursor)
+            # Written as a range on the indexed field so the database can seek in the index instead of scanning it
+            queryset = queryset.filter(**{f'{self.field}__lte': value}).exclude(**{self.field: value, 'pk__gte': pk})
+        object_list = list(queryset[:self.per_page + 1]) # One extra row tells us if there is a next page
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = encode_cursor(object_list[-1], self.field)
+        return KeysetPage(object_list, next_cursor)
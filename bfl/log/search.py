@@ -0,0 +1,118 @@
+"""
+Full-text search over a user's workout notes and sets (exercise names and
+set notes), in the index built by migration 0004_search.
+
+Every word of the query has to match, the last one as a prefix so results
+show up while typing, and words are matched by their stem ("squats" finds
+"squat"). Matches are grouped by workout and ranked by their best matching
+note or set: BM25 on SQLite (FTS5), ts_rank on PostgreSQL (tsvector).
+"""
+
+import re
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import Workout
+
+PAGE_SIZE = 20
+MAX_PAGE = 50 # Ranked results are read with OFFSET, deep pages are not served
+MAX_WORDS = 10
+
+START, STOP = '\ue000', '\ue001' # Marks of the matched words in snippets, never in user text once escaped
+
+_WORD = re.compile(r'\w+')
+
+SQLITE_QUERY = f"""
+    WITH hits AS (
+        SELECT workout_id, bm25(log_search, 0.0, 1.0) AS score,
+               snippet(log_search, 1, '{START}', '{STOP}', '…', 12) AS snippet
+        FROM log_search WHERE log_search MATCH %s
+        LIMIT -1 -- Keeps the subquery from being flattened, FTS5 functions cannot be used in an aggregate
+    )
+    -- The snippet is read from the row with the minimum (best) score of the workout
+    SELECT workout_id, -MIN(score), snippet FROM hits
+    GROUP BY workout_id ORDER BY MIN(score), workout_id DESC LIMIT %s OFFSET %s
+"""
+
+POSTGRESQL_QUERY = """
+    WITH hits AS (
+        SELECT DISTINCT ON (workout_id) workout_id, ts_rank(document, query) AS score, body, query
+        FROM log_search, to_tsquery('english', %s) AS query
+        WHERE user_id = %s AND document @@ query
+        ORDER BY workout_id, score DESC
+    )
+    SELECT workout_id, score, ts_headline('english', body, query, %s) FROM hits
+    ORDER BY score DESC, workout_id DESC LIMIT %s OFFSET %s
+"""
+
+
+def query_words(text):
+    return _WORD.findall(text.lower())[:MAX_WORDS]
+
+
+def sqlite_params(user, words, limit, offset):
+    # Quoted words cannot be read as FTS5 syntax, the owner column restricts the match to the user
+    terms = ' AND '.join(f'"{word}"' for word in words) + '*'
+    return SQLITE_QUERY, [f'owner:"u{user.pk}" AND body:({terms})', limit, offset]
+
+
+def postgresql_params(user, words, limit, offset):
+    terms = ' & '.join(words) + ':*' # Only word characters, nothing tsquery would parse as an operator
+    options = f'StartSel={START}, StopSel={STOP}, MaxFragments=1, MaxWords=12, MinWords=4'
+    return POSTGRESQL_QUERY, [terms, user.pk, options, limit, offset]
+
+
+BACKENDS = {
+    'sqlite': sqlite_params,
+    'postgresql': postgresql_params,
+}
+
+
+def highlight(snippet):
+    """
+    Return the snippet as HTML with the matched words in <mark> elements.
+    """
+    return mark_safe(escape(snippet.strip()).replace(START, '<mark>').replace(STOP, '</mark>'))
+
+
+def is_supported():
+    return connection.vendor in BACKENDS
+
+
+class SearchPage:
+    def __init__(self, workouts, number, has_next):
+        self.object_list = workouts # Workouts with the snippet and score of their best match
+        self.number = number
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+
+def search(user, text, page=1, per_page=PAGE_SIZE):
+    """
+    Return the SearchPage of the user's workouts matching the text.
+    """
+    words = query_words(text)
+    if not words or not 1 <= page <= MAX_PAGE or not is_supported():
+        return SearchPage([], page, False)
+    sql, params = BACKENDS[connection.vendor](user, words, per_page + 1, (page - 1) * per_page) # One extra row tells if there is a next page
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        hits = cursor.fetchall()
+    workouts = Workout.objects.filter(user=user).in_bulk([workout_id for workout_id, _, _ in hits[:per_page]])
+    results = []
+    for workout_id, score, snippet in hits[:per_page]:
+        workout = workouts.get(workout_id)
+        if workout is not None: # Deleted since the search
+            workout.score = score
+            workout.snippet = highlight(snippet)
+            results.append(workout)
+    return SearchPage(results, page, len(hits) > per_page and page < MAX_PAGE) # Deeper pages are not served
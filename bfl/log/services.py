@@ -0,0 +1,281 @@
+"""
+Service layer that keeps the denormalized data of the log app in sync with
+the sets: the summary of each workout and the per user statistics (totals and
+personal records per exercise, totals per week).
+
+Signals in log/signals.py call it for single saves and deletes and bulk
+operations call it directly since bulk_create does not send signals. Every
+change is applied as a difference, so its cost does not depend on how much
+history a user has.
+"""
+
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Value, Count, Sum, Max, Case, When, ExpressionWrapper, FloatField
+from django.db.models.functions import Greatest, TruncWeek
+from django.utils import timezone
+from users.cache import bump_user_version
+from .models import Exercise, Workout, WorkoutSet, ExerciseStats, WeeklyVolume, Tombstone, estimated_1rm
+
+VOLUME = ExpressionWrapper(F('reps') * F('weight'), output_field=FloatField())
+ESTIMATED_1RM = Case( # Same formula as models.estimated_1rm
+    When(reps=1, then=F('weight')),
+    default=ExpressionWrapper(F('weight') * (1 + F('reps') / 30.0), output_field=FloatField()),
+    output_field=FloatField(),
+)
+
+def week_of(performed_at):
+    """
+    Return the Monday of the local week the datetime falls in.
+    """
+    day = timezone.localdate(performed_at)
+    return day - timedelta(days=day.weekday())
+
+class Totals:
+    """
+    The combined contribution of some sets to one summary or statistics row.
+    """
+
+    def __init__(self):
+        self.sets = 0
+        self.reps = 0
+        self.volume = 0.0
+        self.best_weight = 0.0
+        self.best_1rm = 0.0
+        self.last_performed_at = None
+
+    def add(self, values, sign=1):
+        self.sets += sign
+        self.reps += sign * values['reps']
+        self.volume += sign * values['reps'] * values['weight']
+        self.best_weight = max(self.best_weight, values['weight'])
+        self.best_1rm = max(self.best_1rm, estimated_1rm(values['reps'], values['weight']))
+        if self.last_performed_at is None or values['performed_at'] > self.last_performed_at:
+            self.last_performed_at = values['performed_at']
+        return self
+
+def _apply(values_list, sign):
+    """
+    Add (sign=1) or remove (sign=-1) the contribution of sets, given as the dicts of
+    WorkoutSet.tracked_values(), with one UPDATE per affected row.
+    """
+    now = timezone.now()
+    workouts = defaultdict(Totals)
+    exercises = defaultdict(Totals)
+    weeks = defaultdict(Totals)
+    for values in values_list:
+        workouts[values['workout_id']].add(values, sign)
+        exercises[values['user_id'], values['exercise_id']].add(values, sign)
+        weeks[values['user_id'], week_of(values['performed_at'])].add(values, sign)
+    for workout_id, totals in workouts.items():
+        Workout.objects.filter(pk=workout_id).update(
+            set_count=F('set_count') + totals.sets,
+            total_reps=F('total_reps') + totals.reps,
+            total_volume=F('total_volume') + totals.volume,
+            updated_at=now, # update() skips auto_now, synced clients have to get the new summary
+        )
+    for (user_id, exercise_id), totals in exercises.items():
+        stats = ExerciseStats.objects.filter(user_id=user_id, exercise_id=exercise_id)
+        if sign > 0:
+            ExerciseStats.objects.get_or_create(
+                user_id=user_id, exercise_id=exercise_id, defaults={'last_performed_at': totals.last_performed_at},
+            )
+            stats.update(
+                set_count=F('set_count') + totals.sets,
+                total_reps=F('total_reps') + totals.reps,
+                total_volume=F('total_volume') + totals.volume,
+                best_weight=Greatest('best_weight', Value(totals.best_weight)),
+                best_1rm=Greatest('best_1rm', Value(totals.best_1rm)),
+                last_performed_at=Greatest('last_performed_at', Value(totals.last_performed_at)),
+            )
+        else:
+            current = stats.values('best_weight', 'best_1rm', 'last_performed_at').first()
+            stats.update(
+                set_count=F('set_count') + totals.sets,
+                total_reps=F('total_reps') + totals.reps,
+                total_volume=F('total_volume') + totals.volume,
+            )
+            # Only when a removed set held a record do the records have to be read back from the sets
+            if current and (
+                totals.best_weight >= current['best_weight'] or totals.best_1rm >= current['best_1rm']
+                or totals.last_performed_at >= current['last_performed_at']
+            ):
+                refresh_records(user_id, exercise_id)
+    for (user_id, week), totals in weeks.items():
+        if sign > 0:
+            WeeklyVolume.objects.get_or_create(user_id=user_id, week=week)
+        WeeklyVolume.objects.filter(user_id=user_id, week=week).update(
+            set_count=F('set_count') + totals.sets,
+            total_reps=F('total_reps') + totals.reps,
+            total_volume=F('total_volume') + totals.volume,
+        )
+    if sign < 0: # Weeks left without sets would show up as empty weeks
+        emptied = defaultdict(list)
+        for user_id, week in weeks:
+            emptied[user_id].append(week)
+        for user_id, user_weeks in emptied.items():
+            WeeklyVolume.objects.filter(user_id=user_id, week__in=user_weeks, set_count=0).delete()
+    for user_id in {user_id for user_id, _ in weeks}:
+        bump_user_version(user_id) # The home page shows the statistics
+
+def set_saved(workout_set, created):
+    """
+    Account for a set that was created or changed.
+    """
+    old = getattr(workout_set, '_saved_values', None)
+    new = workout_set.tracked_values()
+    if created:
+        _apply([new], 1)
+    elif old is None: # We do not know what the summaries currently account for
+        refresh_workout(workout_set.workout_id)
+        rebuild_user_stats(workout_set.user_id)
+    elif old != new:
+        _apply([old], -1)
+        _apply([new], 1)
+    workout_set.remember_values()
+
+def set_deleted(workout_set):
+    """
+    Remove a deleted set from the summaries and statistics.
+    """
+    old = getattr(workout_set, '_saved_values', None)
+    if old is None:
+        refresh_workout(workout_set.workout_id)
+        rebuild_user_stats(workout_set.user_id)
+    else:
+        _apply([old], -1)
+
+def workout_saved(workout, created):
+    """
+    Move the sets of a workout that was moved to another time by as much as the workout.
+    """
+    old = getattr(workout, '_saved_performed_at', None)
+    if not created and old is not None and old != workout.performed_at:
+        delta = workout.performed_at - old
+        sets = WorkoutSet.objects.filter(workout_id=workout.pk)
+        moved = list(sets.values('workout_id', 'user_id', 'exercise_id', 'performed_at', 'reps', 'weight'))
+        if moved:
+            sets.update(performed_at=F('performed_at') + delta, updated_at=timezone.now())
+            _apply(moved, -1)
+            _apply([dict(values, performed_at=values['performed_at'] + delta) for values in moved], 1)
+    workout.remember_time()
+
+_deleting = threading.local()
+
+def deleting_users():
+    """
+    Return the ids of the users this thread is deleting, see log/signals.py.
+    """
+    if not hasattr(_deleting, 'user_ids'):
+        _deleting.user_ids = set()
+    return _deleting.user_ids
+
+def record_deletion(kind, obj):
+    """
+    Leave a tombstone for a deleted workout or set, so clients that synced it delete it too.
+    """
+    if obj.user_id in deleting_users(): # Their history goes along with them, a tombstone would point at a deleted user
+        return
+    Tombstone.objects.update_or_create(kind=kind, uuid=obj.uuid, defaults={'user_id': obj.user_id, 'version': obj.version})
+
+def sets_created(workout_sets):
+    """
+    Account for sets that were inserted with bulk_create.
+    """
+    _apply([workout_set.tracked_values() for workout_set in workout_sets], 1)
+
+def refresh_workout(workout_id):
+    """
+    Recompute the summary of the workout from its sets.
+    """
+    summary = WorkoutSet.objects.filter(workout_id=workout_id).aggregate(
+        set_count=Count('id'),
+        total_reps=Sum('reps'),
+        total_volume=Sum(VOLUME),
+    )
+    Workout.objects.filter(pk=workout_id).update(
+        set_count=summary['set_count'],
+        total_reps=summary['total_reps'] or 0,
+        total_volume=summary['total_volume'] or 0,
+        updated_at=timezone.now(),
+    )
+
+def refresh_records(user_id, exercise_id):
+    """
+    Recompute the personal records of the user for the exercise from the sets.
+    """
+    records = WorkoutSet.objects.filter(user_id=user_id, exercise_id=exercise_id).aggregate(
+        best_weight=Max('weight'),
+        best_1rm=Max(ESTIMATED_1RM),
+        last_performed_at=Max('performed_at'),
+    )
+    stats = ExerciseStats.objects.filter(user_id=user_id, exercise_id=exercise_id)
+    if records['last_performed_at'] is None: # No sets of the exercise are left
+        stats.delete()
+    else:
+        stats.update(**records)
+
+def rebuild_user_stats(user_id):
+    """
+    Recompute every statistics row of the user from their sets.
+    """
+    sets = WorkoutSet.objects.filter(user_id=user_id)
+    exercises = sets.values('exercise').annotate(
+        set_count=Count('id'),
+        total_reps=Sum('reps'),
+        total_volume=Sum(VOLUME),
+        best_weight=Max('weight'),
+        best_1rm=Max(ESTIMATED_1RM),
+        last_performed_at=Max('performed_at'),
+    ).order_by()
+    weeks = sets.annotate(week=TruncWeek('performed_at')).values('week').annotate(
+        set_count=Count('id'),
+        total_reps=Sum('reps'),
+        total_volume=Sum(VOLUME),
+    ).order_by()
+    with transaction.atomic():
+        ExerciseStats.objects.filter(user_id=user_id).delete()
+        WeeklyVolume.objects.filter(user_id=user_id).delete()
+        ExerciseStats.objects.bulk_create(
+            ExerciseStats(user_id=user_id, exercise_id=row.pop('exercise'), **row) for row in exercises
+        )
+        WeeklyVolume.objects.bulk_create(
+            WeeklyVolume(user_id=user_id, week=timezone.localdate(row.pop('week')), **row) for row in weeks
+        )
+    bump_user_version(user_id)
+
+# Deleted by delete_history in this order, the rows referencing a table go before it. The
+# exercises are the custom ones of the users, only their own sets used them.
+HISTORY_MODELS = (WorkoutSet, ExerciseStats, WeeklyVolume, Tombstone, Workout, Exercise)
+
+def check_history_relations():
+    """
+    Raise ImproperlyConfigured if a model outside of HISTORY_MODELS has a foreign key to one
+    of them: delete_history would leave its rows pointing at deleted ones.
+    """
+    for model in HISTORY_MODELS:
+        for relation in model._meta.related_objects:
+            if relation.related_model not in HISTORY_MODELS:
+                raise ImproperlyConfigured(
+                    f'{relation.related_model.__name__}.{relation.field.name} references {model.__name__}, '
+                    'delete its rows in log.services.delete_history before the history.'
+                )
+
+def delete_history(user_ids):
+    """
+    Delete everything the users logged, for users that are being deleted. The summaries
+    and statistics go too, so the sets are deleted with one statement per table instead
+    of the signal of every set updating them one by one.
+
+    QuerySet.delete() would load every set to send its signals and collect its cascades,
+    so the rows are deleted with _raw_delete, which does neither. That is only safe because
+    no other table references these, which check_history_relations makes sure of.
+    """
+    check_history_relations()
+    with transaction.atomic():
+        for model in HISTORY_MODELS:
+            queryset = model.objects.filter(user_id__in=user_ids)
+            queryset._raw_delete(queryset.db) # No signals, no cascade collection
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Exercise, Workout, WorkoutSet
+from . import catalog, services
+
+@receiver(post_save, sender=WorkoutSet)
+def workout_set_saved(sender, instance, created, raw=False, **kwargs):
+    if raw: # Fixtures are loaded with their summaries already filled in
+        return
+    services.set_saved(instance, created)
+
+@receiver(post_delete, sender=WorkoutSet)
+def workout_set_deleted(sender, instance, **kwargs):
+    services.set_deleted(instance)
+    services.record_deletion('set', instance)
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Sent before the cascade deletes the user's workouts and sets
+    services.deleting_users().add(instance.pk)
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    services.deleting_users().discard(instance.pk)
+
+@receiver(post_save, sender=Workout)
+def workout_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    services.workout_saved(instance, created)
+
+@receiver(post_delete, sender=Workout)
+def workout_deleted(sender, instance, **kwargs):
+    services.record_deletion('workout', instance)
+
+@receiver(post_save, sender=Exercise)
+def exercise_saved(sender, instance, raw=False, **kwargs):
+    catalog.exercise_saved(instance)
+
+@receiver(post_delete, sender=Exercise)
+def exercise_deleted(sender, instance, **kwargs):
+    catalog.exercise_deleted(instance)
@@ -0,0 +1,374 @@
+"""
+Batched sync of workouts and sets with offline-first clients.
+
+Clients log a whole workout without a connection and send every change in one
+request to ``log/sync/``::
+
+    {
+        "token": "<token of the previous sync, null the first time>",
+        "changes": [
+            {"type": "workout", "id": "<uuid>", "version": 1, "performed_at": "...", "notes": ""},
+            {"type": "set", "id": "<uuid>", "version": 1, "workout": "<uuid>",
+             "performed_at": "...", "exercise": "Squat", "reps": 5, "weight": 100, "notes": ""},
+            {"type": "set", "id": "<uuid>", "version": 3, "deleted": true}
+        ]
+    }
+
+Ids are generated by the client and every change carries the version it gives
+the object, one more than the version it changed. A change is applied only if
+its version is newer than the server's (or the tombstone's, for deleted
+objects), so a batch that is sent again after a lost response changes nothing
+and the first of two conflicting changes wins. A set whose workout was deleted
+meanwhile is reported as a conflict and not saved. Sets use the fields of
+log/importers.py. The batch is applied in one transaction, a malformed change
+rejects the whole batch.
+
+The response reports what happened to every change and holds the delta since
+the token: the workouts, sets and deletions changed since, read in pages of
+PAGE_SIZE with keyset cursors on ``(updated_at, id)``. ``more`` tells the client
+to sync again (with no changes) for the next page. The token of the last page
+stays OVERLAP behind the clock, so a change committed late with an earlier
+modification time is still delivered; objects can be delivered twice and are
+recognized by their version.
+"""
+
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .importers import SetImporter, parse_record
+from .models import Workout, WorkoutSet, Tombstone
+from . import services
+
+MAX_CHANGES = 500 # Changes accepted in one batch
+PAGE_SIZE = 500 # Objects of each kind sent back in one response
+OVERLAP = timedelta(seconds=5) # How far the token of the last page stays behind the clock
+
+STREAMS = ('workouts', 'sets', 'deleted')
+
+
+class SyncError(ValueError):
+    """
+    The batch is invalid, ``errors`` holds (index of the change, message) pairs.
+    """
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f'{index}: {message}' for index, message in errors))
+        self.errors = errors
+
+
+class SyncResult:
+    def __init__(self):
+        self.results = [] # {'type', 'id', 'status', 'version'} of every change, status applied, ignored or conflict
+        self.delta = {}
+        self.token = None
+        self.more = False
+
+    def as_dict(self):
+        return {
+            'token': self.token,
+            'more': self.more,
+            'results': self.results,
+            **self.delta,
+        }
+
+
+def encode_token(cursors):
+    """
+    Return an opaque token for the (updated_at, id) cursor of every stream.
+    """
+    value = json.dumps([[updated_at.isoformat(), pk] for updated_at, pk in cursors])
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    Return the cursor of every stream encoded in the token, the start of every stream for no token.
+    """
+    if not token:
+        return [(EPOCH, 0)] * len(STREAMS)
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode())
+        cursors = [(parse_datetime(updated_at), int(pk)) for updated_at, pk in value]
+    except (ValueError, TypeError) as e: # binascii.Error, UnicodeDecodeError and JSONDecodeError are ValueErrors
+        raise SyncError([(None, 'Invalid token.')]) from e
+    if len(cursors) != len(STREAMS) or any(updated_at is None for updated_at, _ in cursors):
+        raise SyncError([(None, 'Invalid token.')])
+    return cursors
+
+
+class Change:
+    def __init__(self, index, kind, id, version, deleted, fields):
+        self.index = index # Position in the batch, for the error messages
+        self.kind = kind # 'workout' or 'set'
+        self.id = id
+        self.version = version
+        self.deleted = deleted
+        self.fields = fields # Parsed values of an upsert
+
+
+def parse_change(index, change, tz):
+    """
+    Validate a change and return it as a Change. Raises ValueError with a message for the user.
+    """
+    if not isinstance(change, dict) or change.get('type') not in ('workout', 'set'):
+        raise ValueError('Expected an object with "type" workout or set.')
+    try:
+        id = uuid.UUID(str(change.get('id')))
+    except ValueError:
+        raise ValueError('"id" must be a UUID.')
+    version = change.get('version')
+    if not isinstance(version, int) or isinstance(version, bool) or version < 1:
+        raise ValueError('"version" must be a positive integer.')
+    deleted = change.get('deleted') is True
+    fields = {}
+    if deleted:
+        pass
+    elif change['type'] == 'workout':
+        performed_at = parse_datetime(str(change.get('performed_at') or ''))
+        if performed_at is None:
+            raise ValueError('"performed_at" must be an ISO datetime.')
+        if timezone.is_naive(performed_at):
+            performed_at = timezone.make_aware(performed_at, tz)
+        notes = change.get('notes') or ''
+        if not isinstance(notes, str):
+            raise ValueError('"notes" must be a string.')
+        fields = {'performed_at': performed_at, 'notes': notes}
+    else:
+        try:
+            workout = uuid.UUID(str(change.get('workout')))
+        except ValueError:
+            raise ValueError('"workout" must be the UUID of a workout.')
+        performed_at, exercise, reps, weight, notes = parse_record(change, tz)
+        fields = {'workout': workout, 'performed_at': performed_at, 'exercise': exercise, 'reps': reps, 'weight': weight, 'notes': notes}
+    return Change(index, change['type'], id, version, deleted, fields)
+
+
+def parse_changes(changes):
+    """
+    Validate a batch and return its Changes, only the newest version of each object.
+    """
+    if not isinstance(changes, list):
+        raise SyncError([(None, '"changes" must be a list.')])
+    if len(changes) > MAX_CHANGES:
+        raise SyncError([(None, f'At most {MAX_CHANGES} changes can be sent at a time.')])
+    tz = timezone.get_current_timezone()
+    parsed, errors = {}, []
+    for index, change in enumerate(changes):
+        try:
+            change = parse_change(index, change, tz)
+        except ValueError as e:
+            errors.append((index, str(e)))
+            continue
+        key = (change.kind, change.id)
+        if key not in parsed or change.version >= parsed[key].version:
+            parsed[key] = change
+    if errors:
+        raise SyncError(errors)
+    return list(parsed.values())
+
+
+class Batch:
+    """
+    Apply the changes of a batch for a user, see the module docstring.
+    """
+
+    def __init__(self, user, changes):
+        self.user = user
+        self.changes = changes
+        self.results = []
+        self.applied = set() # (type, id) of the objects the client now has in the newest version
+        self.errors = []
+
+    def load(self, model, kind, ids):
+        """
+        Return {id: object} of the objects and {id: version} of the tombstones with the ids.
+        """
+        objects = {obj.uuid: obj for obj in model.objects.filter(uuid__in=ids)}
+        tombstones = dict(Tombstone.objects.filter(kind=kind, uuid__in=ids).values_list('uuid', 'version'))
+        for change in self.changes:
+            if change.kind == kind and change.id in objects and objects[change.id].user_id != self.user.pk:
+                self.errors.append((change.index, f'The id of the {kind} is taken.'))
+        return objects, tombstones
+
+    def report(self, change, status, version):
+        self.results.append({'type': change.kind, 'id': str(change.id), 'status': status, 'version': version})
+        if status == 'applied':
+            self.applied.add((change.kind, change.id))
+
+    def current_version(self, change, objects, tombstones):
+        return objects[change.id].version if change.id in objects else tombstones.get(change.id, 0)
+
+    def is_newer(self, change, objects, tombstones):
+        """
+        Return whether the change is newer than the object or its tombstone, else report it as ignored.
+        """
+        version = self.current_version(change, objects, tombstones)
+        if change.version > version:
+            return True
+        self.report(change, 'ignored', version) # Sent before, or a conflicting change won
+        return False
+
+    def delete(self, change, objects):
+        obj = objects.pop(change.id, None)
+        if obj is None: # Never synced, the tombstone keeps an older change from creating it later
+            Tombstone.objects.update_or_create(kind=change.kind, uuid=change.id, defaults={'user': self.user, 'version': change.version})
+        else:
+            obj.version = change.version # The tombstone records the version of the deletion
+            obj.delete()
+        self.report(change, 'applied', change.version)
+
+    def revive(self, change, tombstones):
+        if change.id in tombstones: # Deleted before, brought back by a newer change
+            Tombstone.objects.filter(kind=change.kind, uuid=change.id).delete()
+
+    def run(self):
+        workout_changes = [change for change in self.changes if change.kind == 'workout']
+        set_changes = [change for change in self.changes if change.kind == 'set']
+        workouts, workout_tombstones = self.load(Workout, 'workout', {change.id for change in workout_changes} | {
+            change.fields['workout'] for change in set_changes if not change.deleted
+        })
+        if self.errors:
+            raise SyncError(self.errors)
+
+        deleted_workouts = []
+        for change in workout_changes: # Workouts first, the sets may belong to new ones
+            if not self.is_newer(change, workouts, workout_tombstones):
+                continue
+            if change.deleted:
+                deleted_workouts.append(change) # Last, a set may be moved out of the workout first
+                continue
+            workout = workouts.get(change.id) or Workout(uuid=change.id, user=self.user)
+            workout.performed_at = change.fields['performed_at']
+            workout.notes = change.fields['notes']
+            workout.version = change.version
+            workout.save()
+            workouts[change.id] = workout
+            self.revive(change, workout_tombstones)
+            self.report(change, 'applied', change.version)
+
+        # Read after the workouts are saved, their sets move along with them (see services.workout_saved)
+        sets, set_tombstones = self.load(WorkoutSet, 'set', {change.id for change in set_changes})
+        if self.errors:
+            raise SyncError(self.errors)
+        upserts = []
+        for change in set_changes:
+            if not self.is_newer(change, sets, set_tombstones):
+                continue
+            if change.deleted:
+                self.delete(change, sets)
+                continue
+            workout = workouts.get(change.fields['workout'])
+            if workout is None and change.fields['workout'] in workout_tombstones:
+                # Deleted on another device, the set is dropped and the rest of the batch still applied
+                self.report(change, 'conflict', self.current_version(change, sets, set_tombstones))
+            elif workout is None or workout.user_id != self.user.pk:
+                self.errors.append((change.index, 'The workout of the set does not exist.'))
+            else:
+                upserts.append((change, workout))
+        if self.errors:
+            raise SyncError(self.errors)
+
+        if upserts:
+            exercise_ids = SetImporter(self.user).exercise_ids({change.fields['exercise'] for change, _ in upserts})
+        new_sets = []
+        for change, workout in upserts:
+            workout_set = sets.get(change.id) or WorkoutSet(uuid=change.id, user=self.user)
+            workout_set.workout = workout
+            workout_set.exercise_id = exercise_ids[change.fields['exercise'].lower()]
+            for name in ('performed_at', 'reps', 'weight', 'notes'):
+                setattr(workout_set, name, change.fields[name])
+            workout_set.version = change.version
+            if workout_set.pk is None:
+                new_sets.append(workout_set)
+            else:
+                workout_set.save() # The signal applies the difference to the summaries
+            self.revive(change, set_tombstones)
+            self.report(change, 'applied', change.version)
+        if new_sets:
+            WorkoutSet.objects.bulk_create(new_sets) # One INSERT for the sets of a workout instead of one each
+            services.sets_created(new_sets)
+
+        for change in deleted_workouts:
+            self.delete(change, workouts) # Its sets go too and get their tombstones
+        return self.results
+
+
+EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc) # Cursor of a client that never synced
+
+DELTA_FIELDS = {
+    'workouts': ('uuid', 'version', 'performed_at', 'notes', 'set_count', 'total_reps', 'total_volume'),
+    'sets': ('uuid', 'version', 'workout__uuid', 'performed_at', 'exercise__name', 'reps', 'weight', 'notes'),
+    'deleted': ('uuid', 'version', 'kind'),
+}
+
+
+def delta_querysets(user):
+    return {
+        'workouts': Workout.objects.filter(user=user),
+        'sets': WorkoutSet.objects.filter(user=user),
+        'deleted': Tombstone.objects.filter(user=user),
+    }
+
+
+def serialize(stream, row, tz):
+    record = dict(zip(DELTA_FIELDS[stream], row))
+    record['id'] = str(record.pop('uuid'))
+    if stream == 'sets':
+        record['workout'] = str(record.pop('workout__uuid'))
+        record['exercise'] = record.pop('exercise__name')
+    elif stream == 'deleted':
+        record['type'] = record.pop('kind')
+    if 'performed_at' in record:
+        record['performed_at'] = timezone.localtime(record['performed_at'], tz).isoformat()
+    return record
+
+
+def read_delta(user, cursors, skip=(), page_size=PAGE_SIZE):
+    """
+    Return the delta after the cursors as {stream: records}, the cursors of the
+    next sync and whether there is more to read. Objects whose (type, id) is in
+    skip are left out, the client already has them.
+    """
+    tz = timezone.get_current_timezone()
+    horizon = (timezone.now() - OVERLAP, 0)
+    delta, next_cursors, more = {}, [], False
+    for stream, (updated_at, pk) in zip(STREAMS, cursors):
+        queryset = delta_querysets(user)[stream]
+        # A range on the indexed (user, updated_at) so the database seeks to the cursor
+        queryset = queryset.filter(updated_at__gte=updated_at).exclude(updated_at=updated_at, pk__lte=pk)
+        rows = list(queryset.order_by('updated_at', 'pk').values_list('updated_at', 'pk', *DELTA_FIELDS[stream])[:page_size + 1])
+        cursor = (updated_at, pk)
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            cursor = rows[-1][:2]
+            more = True
+        elif rows:
+            # Stay OVERLAP behind the clock: changes committed late with an earlier time are read again next time
+            cursor = rows[-1][:2] if rows[-1][0] <= horizon[0] else max(cursor, horizon)
+        kind = {'workouts': 'workout', 'sets': 'set'}.get(stream)
+        delta[stream] = [
+            serialize(stream, row[2:], tz) for row in rows
+            if (kind or row[4], row[2]) not in skip # row[4] is the kind of a tombstone
+        ]
+        next_cursors.append(cursor)
+    return delta, next_cursors, more
+
+
+def sync(user, token, changes):
+    """
+    Apply a batch of changes for the user and return a SyncResult with the delta since the token.
+    Raises SyncError if the token or a change is invalid, nothing is applied then.
+    """
+    cursors = decode_token(token)
+    changes = parse_changes(changes)
+    result = SyncResult()
+    batch = Batch(user, changes)
+    with transaction.atomic():
+        result.results = batch.run()
+    result.delta, cursors, result.more = read_delta(user, cursors, batch.applied, PAGE_SIZE)
+    result.token = encode_token(cursors)
+    return result
@@ -1,3 +1,653 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import uuid
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .models import Exercise, Workout, WorkoutSet, ExerciseStats, WeeklyVolume, Tombstone
+from .pagination import KeysetPaginator
+from bfl import metrics
+from . import analytics, catalog, checks, exporters, importers, search, services, sync
 
-# Create your tests here.
+password = 'mypassword' # Global password to be used in tests
+
+def create_user(username='myuser', email='myemail@test.com'):
+    """
+    Create a new user with the given username and email.
+    """
+    return User.objects.create_user(username, email, password)
+
+def create_workout(user, days_ago=0):
+    """
+    Create a workout for the user that was performed the given number of days ago.
+    """
+    return Workout.objects.create(user=user, performed_at=timezone.now() - timedelta(days=days_ago))
+
+def create_set(workout, exercise, reps=5, weight=100):
+    """
+    Log a set of the exercise in the workout.
+    """
+    return WorkoutSet.objects.create(workout=workout, exercise=exercise, reps=reps, weight=weight, performed_at=workout.performed_at)
+
+class WorkoutSummaryTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.exercise = Exercise.objects.create(name='Squat', muscle_group='legs')
+        self.workout = create_workout(self.user)
+
+    def assertSummary(self, set_count, total_reps, total_volume):
+        self.workout.refresh_from_db()
+        self.assertEqual(self.workout.set_count, set_count)
+        self.assertEqual(self.workout.total_reps, total_reps)
+        self.assertEqual(self.workout.total_volume, total_volume)
+
+    def test_summary_follows_sets(self):
+        """
+        The workout summary should be updated when sets are created, changed and deleted.
+        """
+        first = create_set(self.workout, self.exercise, reps=5, weight=100)
+        create_set(self.workout, self.exercise, reps=3, weight=120)
+        self.assertSummary(2, 8, 860)
+        first = WorkoutSet.objects.get(pk=first.pk)
+        first.reps = 10
+        first.save()
+        self.assertSummary(2, 13, 1360)
+        first.delete()
+        self.assertSummary(1, 3, 360)
+
+    def test_set_copies_user_from_workout(self):
+        """
+        A set should belong to the user of its workout.
+        """
+        workout_set = create_set(self.workout, self.exercise)
+        self.assertEqual(workout_set.user, self.user)
+
+    def test_set_moves_with_workout(self):
+        """
+        A set should take the time of its workout unless given one, and move along when the workout is moved.
+        """
+        workout_set = WorkoutSet.objects.create(workout=self.workout, exercise=self.exercise, reps=5, weight=100)
+        self.assertEqual(workout_set.performed_at, self.workout.performed_at)
+        workout = Workout.objects.get(pk=self.workout.pk)
+        workout.performed_at -= timedelta(days=10)
+        workout.save()
+        workout_set.refresh_from_db()
+        self.assertEqual(workout_set.performed_at, workout.performed_at)
+        self.assertEqual(ExerciseStats.objects.get(user=self.user).last_performed_at, workout.performed_at)
+        weeks = WeeklyVolume.objects.filter(user=self.user).values_list('week', flat=True)
+        self.assertEqual(list(weeks), [services.week_of(workout.performed_at)])
+
+class KeysetPaginationTests(TestCase):
+
+    def test_pages_cover_every_workout_once(self):
+        """
+        Following the cursors should return every workout exactly once from the newest to the oldest.
+        """
+        user = create_user()
+        same_time = timezone.now()
+        workouts = [create_workout(user, days_ago=i) for i in range(7)]
+        workouts += [Workout.objects.create(user=user, performed_at=same_time) for _ in range(3)] # Ties are broken by id
+        expected = list(Workout.objects.filter(user=user).order_by('-performed_at', '-pk'))
+        paginator = KeysetPaginator(Workout.objects.filter(user=user), per_page=3)
+        seen = []
+        cursor = None
+        while True:
+            page = paginator.page(cursor)
+            seen += page.object_list
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+class HistoryViewsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.exercise = Exercise.objects.create(name='Squat', muscle_group='legs')
+        create_set(create_workout(self.user), self.exercise)
+
+    def test_authenticated_user_able_to_access_history(self):
+        """
+        The user should be able to see their workouts and the sets of an exercise.
+        """
+        self.client.login(username=self.user.username, password=password)
+        response = self.client.get(reverse('history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Squat')
+        response = self.client.get(reverse('exercise_history', args=[self.exercise.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unauthenticated_user_unable_to_access_history(self):
+        """
+        An unauthenticated user should not be able to access the history.
+        """
+        response = self.client.get(reverse('history'))
+        self.assertFalse(response.status_code==200)
+
+    def test_invalid_cursor(self):
+        """
+        A cursor that was not produced by the paginator should not be accepted.
+        """
+        self.client.login(username=self.user.username, password=password)
+        response = self.client.get(reverse('history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ROOT_URLCONF='bfl.asgi_urls')
+    async def test_async_history(self):
+        """
+        The async history pages served under ASGI should show the same sets.
+        """
+        await sync_to_async(self.client.force_login)(self.user)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse('history'))
+        self.assertContains(response, 'Squat')
+        response = await self.async_client.get(reverse('exercise_history', args=[self.exercise.pk]))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('history') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+CSV_HISTORY = """performed_at,exercise,reps,weight,notes
+2020-09-01T08:00:00,Squat,5,100,
+2020-09-01T08:05:00,squat,5,105,paused
+2020-09-02,Bench Press,8,60,
+2020-09-02,Bench Press,many,60,
+"""
+
+class ImportTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.squat = Exercise.objects.create(name='Squat', muscle_group='legs')
+
+    def test_import_csv(self):
+        """
+        Valid rows should be imported into one workout per day and invalid rows reported.
+        """
+        result = importers.import_sets(self.user, io.BytesIO(CSV_HISTORY.encode()), 'csv', batch_size=2)
+        self.assertEqual((result.rows, result.created), (4, 3))
+        self.assertEqual(result.errors[0][0], 4) # The row number of the invalid row
+        self.assertEqual(WorkoutSet.objects.filter(user=self.user, exercise=self.squat).count(), 2) # Names are matched case insensitively
+        self.assertEqual(Exercise.objects.get(name='Bench Press').user, self.user) # Unknown exercises become custom exercises
+        workouts = Workout.objects.filter(user=self.user).order_by('performed_at')
+        self.assertEqual([w.set_count for w in workouts], [2, 1])
+        self.assertEqual(workouts[0].total_volume, 5 * 100 + 5 * 105)
+
+    def test_iter_json(self):
+        """
+        JSON arrays and newline delimited JSON should be read incrementally, across read boundaries.
+        """
+        records = [{'performed_at': '2020-09-01', 'exercise': 'Squat', 'reps': i + 1} for i in range(20)]
+        with mock.patch.object(importers, 'READ_SIZE', 7):
+            array = list(importers.iter_json(io.BytesIO(json.dumps(records).encode())))
+            lines = list(importers.iter_json(io.BytesIO('\n'.join(json.dumps(r) for r in records).encode())))
+        self.assertEqual(array, records)
+        self.assertEqual(lines, records)
+        with self.assertRaises(ValueError):
+            list(importers.iter_json(io.BytesIO(b'[{"reps": 1}, {"reps"')))
+
+    def test_out_of_range_numbers_are_row_errors(self):
+        """
+        Weights that are not finite and reps or weights out of range should be reported as invalid rows.
+        """
+        rows = 'performed_at,exercise,reps,weight\n' + ''.join(
+            f'2020-09-01,Squat,{reps},{weight}\n' for reps, weight in (
+                (5, 'nan'), (5, 'inf'), (99999999999999999999999, 100), (0, 100), (5, 1e9), (5, 100),
+            )
+        )
+        result = importers.import_sets(self.user, io.BytesIO(rows.encode()), 'csv')
+        self.assertEqual(result.created, 1)
+        self.assertEqual([row for row, _ in result.errors], [1, 2, 3, 4, 5])
+        records = b'[{"performed_at": "2020-09-01", "exercise": "Squat", "reps": Infinity}, {"performed_at": "2020-09-01", "exercise": "Squat", "reps": 5, "weight": NaN}]'
+        result = importers.import_sets(self.user, io.BytesIO(records), 'json')
+        self.assertEqual((result.created, len(result.errors)), (0, 2))
+
+    def test_import_view(self):
+        """
+        The import endpoint should import an uploaded file and report the results as JSON.
+        """
+        self.client.login(username=self.user.username, password=password)
+        upload = SimpleUploadedFile('history.csv', CSV_HISTORY.encode(), content_type='text/csv')
+        response = self.client.post(reverse('import_workouts'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 3)
+        self.assertIn('rows_per_second', response.json())
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        squat = Exercise.objects.create(name='Squat', muscle_group='legs')
+        for days_ago in (2, 1):
+            create_set(create_workout(self.user, days_ago), squat, reps=days_ago, weight=102.5)
+        other = create_user('other', 'other@test.com')
+        create_set(create_workout(other), squat)
+        self.client.login(username=self.user.username, password=password)
+
+    def test_export_csv_round_trip(self):
+        """
+        The CSV export should list the user's sets oldest first and be importable again.
+        """
+        response = self.client.get(f"{reverse('export_history')}?format=csv")
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = b''.join(response.streaming_content)
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], 'performed_at,exercise,reps,weight,notes')
+        self.assertEqual(len(lines), 3) # Not the set of the other user
+        self.assertTrue(lines[1].endswith(',Squat,2,102.5,'))
+        other = create_user('importer', 'importer@test.com')
+        result = importers.import_sets(other, io.BytesIO(content), 'csv')
+        self.assertEqual((result.created, result.errors), (2, []))
+
+    def test_export_ndjson_gzip(self):
+        """
+        The NDJSON export should be sent in pieces and decompress to one JSON object per set when gzipped.
+        """
+        with mock.patch.object(exporters, 'WRITE_SIZE', 10):
+            pieces = list(self.client.get(f"{reverse('export_history')}?format=ndjson").streaming_content)
+        self.assertEqual(len(pieces), 2) # Sent as they are produced
+        response = self.client.get(f"{reverse('export_history')}?format=ndjson&compress=gzip")
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bfl-history-myuser.ndjson.gz"')
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()]
+        self.assertEqual([record['reps'] for record in records], [2, 1])
+        self.assertEqual(records[0]['weight'], 102.5)
+        self.assertEqual(self.client.get(f"{reverse('export_history')}?format=xml").status_code, 400)
+
+class StatsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.squat = Exercise.objects.create(name='Squat', muscle_group='legs')
+        self.bench = Exercise.objects.create(name='Bench Press', muscle_group='chest')
+
+    def snapshot(self):
+        exercises = ExerciseStats.objects.filter(user=self.user).order_by('exercise').values_list(
+            'exercise', 'set_count', 'total_reps', 'total_volume', 'best_weight', 'best_1rm', 'last_performed_at')
+        weeks = WeeklyVolume.objects.filter(user=self.user).order_by('week').values_list(
+            'week', 'set_count', 'total_reps', 'total_volume')
+        return list(exercises), list(weeks)
+
+    def test_records_follow_sets(self):
+        """
+        Personal records should be raised by new sets and recomputed when the record set is deleted.
+        """
+        workout = create_workout(self.user)
+        create_set(workout, self.squat, reps=5, weight=100)
+        record = create_set(workout, self.squat, reps=1, weight=140)
+        stats = ExerciseStats.objects.get(user=self.user, exercise=self.squat)
+        self.assertEqual((stats.set_count, stats.best_weight, stats.best_1rm), (2, 140, 140))
+        record.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.set_count, stats.best_weight), (1, 100))
+        self.assertAlmostEqual(stats.best_1rm, 100 * (1 + 5 / 30))
+
+    def test_incremental_stats_match_rebuild(self):
+        """
+        Statistics maintained set by set should equal the ones rebuilt from scratch.
+        """
+        for days_ago in (0, 3, 9, 20):
+            workout = create_workout(self.user, days_ago=days_ago)
+            create_set(workout, self.squat, reps=5, weight=100 + days_ago)
+            changed = create_set(workout, self.bench, reps=8, weight=60)
+        changed = WorkoutSet.objects.get(pk=changed.pk)
+        changed.exercise = self.squat
+        changed.save()
+        WorkoutSet.objects.filter(user=self.user).first().delete()
+        for workout_set in WorkoutSet.objects.filter(workout=workout): # The only sets of their week
+            workout_set.delete()
+        incremental = self.snapshot()
+        self.assertNotIn(services.week_of(workout.performed_at), [week for week, *_ in incremental[1]])
+        services.rebuild_user_stats(self.user.pk)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_home_queries_do_not_grow_with_history(self):
+        """
+        The home page should use the same number of queries for a short and a long history.
+        """
+        self.client.login(username=self.user.username, password=password)
+        create_set(create_workout(self.user), self.squat)
+        with self.assertNumQueries(4): # session, user with profile, exercise stats and weekly volume
+            self.client.get(reverse('user_home'))
+        for days_ago in range(1, 30):
+            workout = create_workout(self.user, days_ago=days_ago)
+            create_set(workout, self.squat)
+            create_set(workout, self.bench)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('user_home'))
+        self.assertContains(response, 'Bench Press')
+
+class AnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.squat = Exercise.objects.create(name='Squat', muscle_group='legs')
+        self.bench = Exercise.objects.create(name='Bench Press', muscle_group='chest')
+
+    def test_weekly_progress(self):
+        """
+        Volume should be summed per week, including weeks without sets, and split by muscle group.
+        """
+        for days_ago, exercise, weight in ((21, self.squat, 100), (21, self.bench, 50), (0, self.squat, 110)):
+            create_set(create_workout(self.user, days_ago=days_ago), exercise, reps=5, weight=weight)
+        data = analytics.progress(self.user, bucket='week', window=2)
+        self.assertEqual(len(data['periods']), 4)
+        self.assertEqual(data['volume'][0], 750)
+        self.assertEqual(data['volume'][-1], 550)
+        self.assertEqual(data['volume'][1], 0) # A week without sets
+        self.assertEqual(data['best_1rm'][1], None)
+        self.assertEqual(data['rolling_volume'][1], 375)
+        self.assertEqual(data['muscle_groups']['chest'][0], 250)
+        self.assertEqual(sum(data['sets']), 3)
+
+    def test_vectorized_helpers(self):
+        """
+        The rolling mean and the trend should match their definitions.
+        """
+        import numpy as np
+        self.assertEqual(analytics.rolling_mean(np.array([1.0, 3.0, 5.0, 7.0]), 2).tolist(), [1, 2, 4, 6])
+        slope, intercept, values = analytics.linear_trend(np.arange(3.0), np.array([1.0, 3.0, 5.0]), np.arange(4.0))
+        self.assertAlmostEqual(slope, 2)
+        self.assertAlmostEqual(values[-1], 7)
+
+    def test_progress_view(self):
+        """
+        The chart data should be served as JSON and invalid parameters rejected.
+        """
+        create_set(create_workout(self.user), self.squat)
+        self.client.login(username=self.user.username, password=password)
+        response = self.client.get(reverse('progress_data'), {'exercise': self.squat.pk, 'bucket': 'month'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['volume'], [500])
+        response = self.client.get(reverse('progress_data'), {'bucket': 'year'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('progress_data'), {'exercise': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+class SyncTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.squat = Exercise.objects.create(name='Squat', muscle_group='legs')
+        self.client.login(username=self.user.username, password=password)
+
+    def post(self, changes, token=None):
+        return self.client.post(reverse('sync'), json.dumps({'token': token, 'changes': changes}), content_type='application/json')
+
+    def workout_changes(self, sets=3, version=1):
+        workout = str(uuid.uuid4())
+        changes = [{'type': 'workout', 'id': workout, 'version': version, 'performed_at': '2026-10-18T08:00:00'}]
+        for reps in range(1, sets + 1):
+            changes.append({
+                'type': 'set', 'id': str(uuid.uuid4()), 'version': version, 'workout': workout,
+                'performed_at': '2026-10-18T08:00:00', 'exercise': 'Squat', 'reps': reps, 'weight': 100,
+            })
+        return changes
+
+    def test_batch_is_applied_once(self):
+        """
+        A workout with its sets should be saved in one request, and sending the batch again should change nothing.
+        """
+        changes = self.workout_changes()
+        response = self.post(changes)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['applied'] * 4)
+        self.assertEqual(response.json()['sets'], []) # The client already has them
+        workout = Workout.objects.get(uuid=changes[0]['id'])
+        self.assertEqual((workout.set_count, workout.total_reps), (3, 6))
+        self.assertEqual(ExerciseStats.objects.get(user=self.user).set_count, 3)
+        response = self.post(changes, response.json()['token'])
+        self.assertEqual([result['status'] for result in response.json()['results']], ['ignored'] * 4)
+        self.assertEqual(WorkoutSet.objects.filter(user=self.user).count(), 3)
+
+    def test_newer_versions_win(self):
+        """
+        A change should only be applied over an older version, and deletions should leave a tombstone.
+        """
+        changes = self.workout_changes(sets=1)
+        self.post(changes)
+        update = dict(changes[1], version=2, reps=8)
+        self.assertEqual(self.post([update]).json()['results'][0]['status'], 'applied')
+        results = self.post([dict(update, reps=3)]).json()['results'] # Another device changed version 1 too
+        self.assertEqual((results[0]['status'], results[0]['version']), ('ignored', 2))
+        self.assertEqual(Workout.objects.get(uuid=changes[0]['id']).total_reps, 8)
+        self.post([{'type': 'set', 'id': changes[1]['id'], 'version': 3, 'deleted': True}])
+        self.assertFalse(WorkoutSet.objects.filter(uuid=changes[1]['id']).exists())
+        self.assertEqual(Tombstone.objects.get(uuid=changes[1]['id']).version, 3)
+        self.assertEqual(Workout.objects.get(uuid=changes[0]['id']).set_count, 0)
+        results = self.post([dict(update, version=2)]).json()['results']
+        self.assertEqual((results[0]['status'], results[0]['version']), ('ignored', 3)) # Not brought back by an older change
+
+    def test_delta_since_token(self):
+        """
+        A sync should return what changed on the server since the token, in pages.
+        """
+        token = self.post([]).json()['token']
+        workout = create_workout(self.user)
+        sets = [create_set(workout, self.squat, reps=reps) for reps in (1, 2, 3)]
+        sets[0].delete()
+        with mock.patch.object(sync, 'PAGE_SIZE', 1):
+            first = self.post([], token).json()
+            second = self.post([], first['token']).json()
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        received = first['sets'] + second['sets']
+        self.assertEqual(sorted(record['reps'] for record in received), [2, 3])
+        self.assertEqual(received[0]['workout'], str(workout.uuid))
+        self.assertEqual(first['workouts'][0]['set_count'], 2)
+        self.assertEqual(first['deleted'], [{'id': str(sets[0].uuid), 'version': 1, 'type': 'set'}])
+
+    def test_summaries_reach_other_devices(self):
+        """
+        A set added on one device should send the workout with its new summary to the others.
+        """
+        changes = self.workout_changes(sets=0)
+        token = self.post(changes).json()['token']
+        with mock.patch.object(sync, 'OVERLAP', timedelta(0)): # Deliver only what changed after the token
+            token = self.post([], token).json()['token']
+            self.post([dict(self.workout_changes(sets=1)[1], workout=changes[0]['id'])]) # From another device
+            delta = self.post([], token).json()
+        self.assertEqual([workout['set_count'] for workout in delta['workouts']], [1])
+
+    def test_set_of_deleted_workout_conflicts(self):
+        """
+        A set logged offline into a workout deleted on another device should be reported, the rest applied.
+        """
+        changes = self.workout_changes(sets=1)
+        self.post(changes[:1])
+        self.post([{'type': 'workout', 'id': changes[0]['id'], 'version': 2, 'deleted': True}])
+        other = self.workout_changes(sets=0)
+        response = self.post(changes[1:] + other)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['applied', 'conflict'])
+        self.assertEqual(Workout.objects.get(user=self.user).uuid, uuid.UUID(other[0]['id']))
+        self.assertFalse(WorkoutSet.objects.exists())
+
+    def test_invalid_batch_changes_nothing(self):
+        """
+        A batch with an invalid change should be rejected as a whole.
+        """
+        changes = self.workout_changes(sets=2)
+        changes[2]['reps'] = 'many'
+        response = self.post(changes)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['change'], 2)
+        self.assertFalse(Workout.objects.filter(user=self.user).exists())
+        changes[2]['reps'] = 5
+        changes[1]['weight'] = float('nan') # Sent as NaN, which the JSON parser accepts
+        self.assertEqual(self.post(changes).json()['errors'][0]['change'], 1)
+        other = create_user('other', 'other@test.com')
+        workout = create_workout(other)
+        changes = self.workout_changes(sets=1)[1:]
+        changes[0]['workout'] = str(workout.uuid) # Sets cannot be added to the workouts of others
+        self.assertEqual(self.post(changes).status_code, 400)
+        self.assertEqual(self.post([], 'garbage').status_code, 400)
+
+class SyncDeletionTests(TransactionTestCase): # Foreign keys are only checked when a transaction commits
+
+    def test_history_relations_are_checked(self):
+        """
+        The raw deletes of the history should refuse to run when another table references it.
+        """
+        services.check_history_relations()
+        with mock.patch.object(services, 'HISTORY_MODELS', (Exercise,)): # As if the sets were not part of the history
+            with self.assertRaisesMessage(ImproperlyConfigured, 'WorkoutSet.exercise references Exercise'):
+                services.delete_history([1])
+
+    def test_delete_user_with_history(self):
+        """
+        Deleting a user who logged sets should not leave tombstones pointing at them.
+        """
+        user = create_user()
+        workout = create_workout(user)
+        create_set(workout, Exercise.objects.create(name='Squat', muscle_group='legs'))
+        user.delete()
+        self.assertFalse(User.objects.exists() or Tombstone.objects.exists())
+        other = create_user('other', 'other@test.com')
+        create_workout(other).delete()
+        self.assertEqual(Tombstone.objects.filter(user=other).count(), 1) # Single deletes still leave one
+
+@override_settings(CATALOG_SHARED_VERSIONS=True)
+class CatalogTests(TransactionTestCase): # The index is updated when a change commits
+
+    def setUp(self):
+        cache.clear()
+        catalog.catalog.clear()
+        self.user = create_user()
+        for name, muscle_group in (('Back Squat', 'legs'), ('Front Squat', 'legs'), ('Squat Jump', 'legs'), ('Bench Press', 'chest')):
+            Exercise.objects.create(name=name, muscle_group=muscle_group)
+        other = create_user('other', 'other@test.com')
+        Exercise.objects.create(name='Squat Secret', user=other)
+        self.client.login(username=self.user.username, password=password)
+
+    def autocomplete(self, q, **params):
+        return [result['name'] for result in self.client.get(reverse('exercise_autocomplete'), {'q': q, **params}).json()['results']]
+
+    def test_prefix_index(self):
+        """
+        Names should be found by the start of any of their words, names starting with the term first.
+        """
+        index = catalog.PrefixIndex([(1, 'Back Squat', 'legs'), (2, 'Squat Jump', 'legs'), (3, 'Bench Press', 'chest')])
+        self.assertEqual([name for _, name, _ in index.search('SQ', 10)], ['Squat Jump', 'Back Squat'])
+        self.assertEqual([name for _, name, _ in index.search('b', 1)], ['Back Squat'])
+        index.add(1, 'Pause Squat', 'legs')
+        index.remove(2)
+        self.assertEqual([name for _, name, _ in index.search('squat', 10)], ['Pause Squat'])
+        self.assertEqual(index.search('back', 10), [])
+        self.assertEqual(index.search(' ', 10), [])
+
+    def test_autocomplete(self):
+        """
+        The catalog and the user's own exercises should be suggested, their own first, not those of others.
+        """
+        self.assertEqual(self.autocomplete('squ'), ['Squat Jump', 'Back Squat', 'Front Squat'])
+        Exercise.objects.create(name='Paused Squat', user=self.user)
+        reloads = metrics.snapshot('catalog.')['counters'].get('catalog.reload', 0)
+        self.assertEqual(self.autocomplete('squ', limit=2), ['Paused Squat', 'Squat Jump'])
+        Exercise.objects.get(name='Front Squat').delete()
+        self.assertEqual(self.autocomplete('front'), [])
+        self.assertEqual(metrics.snapshot('catalog.')['counters'].get('catalog.reload', 0), reloads) # Updated in place
+        self.assertEqual(self.client.get(reverse('exercise_autocomplete'), {'q': 'a', 'limit': 500}).status_code, 400)
+
+    def test_other_process_changes(self):
+        """
+        Exercises created without signals should be found once the version of the index is bumped.
+        """
+        self.assertEqual(self.autocomplete('dead'), [])
+        importers.import_sets(self.user, io.BytesIO(b'performed_at,exercise,reps\n2020-09-01,Deadlift,5\n'), 'csv')
+        self.assertEqual(self.autocomplete('dead'), ['Deadlift'])
+
+    @override_settings(CATALOG_SHARED_VERSIONS=False)
+    def test_versions_of_this_process_only(self):
+        """
+        Without versions shared by the processes, changes made elsewhere should be seen on the next
+        search for custom exercises and after the reload interval for the catalog.
+        """
+        self.assertEqual(self.autocomplete('dead'), [])
+        Exercise.objects.bulk_create([Exercise(name='Deadlift', user=self.user), Exercise(name='Deficit Deadlift')]) # No signals
+        self.assertEqual(self.autocomplete('dead'), ['Deadlift'])
+        with override_settings(CATALOG_RELOAD_INTERVAL=0):
+            self.assertEqual(self.autocomplete('dead'), ['Deadlift', 'Deficit Deadlift'])
+        Exercise.objects.create(name='Bent Over Row')
+        self.assertEqual(self.autocomplete('row'), ['Bent Over Row']) # Changes of this process are applied in place
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.paused = Exercise.objects.create(name='Paused Squat', muscle_group='legs')
+        self.bench = Exercise.objects.create(name='Bench Press', muscle_group='chest')
+        self.client.login(username=self.user.username, password=password)
+
+    def found(self, text, user=None):
+        return [workout.pk for workout in search.search(user or self.user, text)]
+
+    def test_index_follows_changes(self):
+        """
+        Notes, exercise names and set notes should be searchable by stem and prefix as soon as they are saved.
+        """
+        workout = Workout.objects.create(user=self.user, notes='Squats <b>moved</b> fast')
+        workout_set = create_set(workout, self.bench)
+        importers.import_sets(self.user, io.BytesIO(b'performed_at,exercise,reps,notes\n2020-09-01,Paused Squat,5,slow tempo\n'), 'csv')
+        imported = Workout.objects.get(performed_at__date='2020-09-01')
+        self.assertCountEqual(self.found('squat'), [workout.pk, imported.pk]) # Notes and exercise names
+        self.assertEqual(self.found('paused squ'), [imported.pk])
+        self.assertEqual(self.found('tempo'), [imported.pk]) # The notes of a set
+        self.assertEqual(self.found('squat', create_user('other', 'other@test.com')), [])
+        self.assertEqual(str(search.search(self.user, 'moved').object_list[0].snippet), 'Squats &lt;b&gt;<mark>moved</mark>&lt;/b&gt; fast')
+        workout_set.notes = 'grindy'
+        workout_set.save()
+        self.assertEqual(self.found('grindy'), [workout.pk])
+        self.bench.name = 'Floor Press'
+        self.bench.save()
+        self.assertEqual(self.found('floor'), [workout.pk])
+        workout.delete()
+        self.assertEqual(self.found('grindy') + self.found('moved'), [])
+
+    def test_ranking_and_pages(self):
+        """
+        Results should be ranked by their best match and split into pages.
+        """
+        for days_ago in range(3):
+            create_set(create_workout(self.user, days_ago), self.bench)
+        best = Workout.objects.create(user=self.user, notes='bench bench bench')
+        self.assertEqual(self.found('bench')[0], best.pk)
+        first = search.search(self.user, 'bench', per_page=3)
+        second = search.search(self.user, 'bench', page=2, per_page=3)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual(len({workout.pk for workout in first} | {workout.pk for workout in second}), 4)
+        with mock.patch.object(search, 'MAX_PAGE', 2):
+            self.assertFalse(search.search(self.user, 'bench', page=2, per_page=1).has_next) # The last page served
+        self.assertEqual(self.found('"'), []) # Nothing FTS5 could read as syntax
+
+    def test_search_view(self):
+        """
+        The search page should list the matching workouts of the user with highlighted snippets.
+        """
+        create_set(create_workout(self.user), self.paused)
+        response = self.client.get(reverse('search'), {'q': 'paused'})
+        self.assertContains(response, '<mark>Paused</mark> Squat')
+        self.assertContains(self.client.get(reverse('search'), {'q': 'deadlift'}), 'No workouts match')
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'paused', 'page': 'x'}).status_code, 404)
+
+    def test_missing_triggers_fail_the_checks(self):
+        """
+        The system checks should report it when a migration dropped the triggers of the index.
+        """
+        self.assertEqual(checks.check_search_triggers(None, databases=['default']), [])
+        if connection.vendor != 'sqlite':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER log_search_set_insert') # Rolled back with the test
+        errors = checks.check_search_triggers(None, databases=['default'])
+        self.assertEqual([error.id for error in errors], ['log.E001'])
+        self.assertIn('log_search_set_insert', errors[0].msg)
@@ -1,2 +1,13 @@
 from django.urls import path
 from . import views
+
+urlpatterns = [
+    path('history/', views.history, name='history'),
+    path('history/exercise/<int:exercise_id>/', views.exercise_history, name='exercise_history'),
+    path('exercises/autocomplete/', views.exercise_autocomplete, name='exercise_autocomplete'),
+    path('search/', views.search, name='search'),
+    path('import/', views.import_workouts, name='import_workouts'),
+    path('export/', views.export_history, name='export_history'),
+    path('sync/', views.sync, name='sync'),
+    path('progress/', views.progress_data, name='progress_data'),
+]
@@ -1,2 +1,158 @@
-from django.shortcuts import render
-from django.http import HttpResponse
+import json
+from django.shortcuts import render, get_object_or_404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.db.models import Q, Prefetch
+from django.contrib.auth.decorators import login_required
+from .models import Exercise, Workout, WorkoutSet
+from .pagination import KeysetPaginator, InvalidCursor
+from .importers import FORMATS, format_for, import_sets
+from .sync import SyncError, sync as sync_changes
+from . import analytics, catalog, exporters, search as full_text
+
+HISTORY_PAGE_SIZE = 25
+
+def get_page(request, queryset):
+    """
+    Return the page of the queryset pointed to by the cursor in the query string.
+    """
+    try:
+        return KeysetPaginator(queryset, HISTORY_PAGE_SIZE).page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page.')
+
+def history_context(request):
+    """
+    Context of the history page, shared with the async view in log/async_views.py.
+    """
+    sets = WorkoutSet.objects.select_related('exercise').order_by('performed_at', 'id')
+    page = get_page(request, Workout.objects.filter(user=request.user).prefetch_related(Prefetch('sets', queryset=sets)))
+    return {
+        'title': 'History',
+        'page': page,
+    }
+
+@login_required
+def history(request):
+    return render(request, 'log/history.html', history_context(request))
+
+def exercise_history_context(request, exercise_id):
+    """
+    Context of the history of an exercise, shared with the async view in log/async_views.py.
+    """
+    exercise = get_object_or_404(Exercise, Q(user=None) | Q(user=request.user), pk=exercise_id)
+    page = get_page(request, WorkoutSet.objects.filter(user=request.user, exercise=exercise))
+    return {
+        'title': f'{exercise.name} History',
+        'exercise': exercise,
+        'page': page,
+    }
+
+@login_required
+def exercise_history(request, exercise_id):
+    return render(request, 'log/exercise-history.html', exercise_history_context(request, exercise_id))
+
+@login_required
+@require_POST
+def import_workouts(request):
+    """
+    Import the sets of an uploaded CSV or JSON file, see log/importers.py for the format.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Upload the file to import as "file".'}, status=400)
+    fmt = request.POST.get('format') or format_for(upload.name)
+    if fmt not in FORMATS:
+        return JsonResponse({'error': f'The format must be one of {", ".join(FORMATS)}.'}, status=400)
+    # Large uploads are streamed to a temporary file by Django, so the import reads them from disk chunk by chunk
+    result = import_sets(request.user, upload, fmt)
+    return JsonResponse(result.as_dict(), status=200 if result.created or not result.errors else 400)
+
+@login_required
+def export_history(request):
+    """
+    Download every set of the user as CSV or newline delimited JSON (?format=csv|ndjson),
+    gzipped with ?compress=gzip. The file is written while it is sent, see log/exporters.py.
+    """
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('compress', '')
+    if fmt not in exporters.FORMATS or compress not in ('', 'gzip'):
+        return JsonResponse({'error': f'The format must be one of {", ".join(exporters.FORMATS)} and compress empty or gzip.'}, status=400)
+    filename = f'bfl-history-{request.user.username}.{fmt}'
+    if compress:
+        filename += '.gz'
+    response = StreamingHttpResponse(
+        exporters.export(request.user, fmt, compress=bool(compress)),
+        content_type='application/gzip' if compress else exporters.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def search(request):
+    """
+    Workouts whose notes or sets match the words of ?q=, best matches first, see log/search.py.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404('Invalid page.')
+    if not 1 <= number <= full_text.MAX_PAGE:
+        raise Http404('Invalid page.')
+    return render(request, 'log/search.html', {
+        'title': 'Search',
+        'query': query,
+        'page': full_text.search(request.user, query, number) if query else None,
+    })
+
+@login_required
+def exercise_autocomplete(request):
+    """
+    Exercises of the catalog and of the user whose name has a word starting with ?q=, as JSON.
+    Served from the in-process index of log/catalog.py, so it can be called on every keystroke.
+    """
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= catalog.MAX_RESULTS:
+        return JsonResponse({'error': f'limit must be between 1 and {catalog.MAX_RESULTS}.'}, status=400)
+    return JsonResponse({'results': catalog.search(request.user, request.GET.get('q', ''), limit)})
+
+@login_required
+@require_POST
+def sync(request):
+    """
+    Apply a batch of changes made offline and return what changed on the server
+    since the client's last sync, see log/sync.py for the format.
+    """
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'The body must be a JSON object.'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'error': 'The body must be a JSON object.'}, status=400)
+    try:
+        result = sync_changes(request.user, body.get('token'), body.get('changes', []))
+    except SyncError as e:
+        return JsonResponse({'errors': [{'change': index, 'message': message} for index, message in e.errors]}, status=400)
+    return JsonResponse(result.as_dict())
+
+@login_required
+def progress_data(request):
+    """
+    Chart data of the user's progress as JSON, see log/analytics.py.
+    """
+    bucket = request.GET.get('bucket', 'week')
+    try:
+        window = int(request.GET.get('window', 4))
+        exercise_id = int(request.GET['exercise']) if request.GET.get('exercise') else None
+    except ValueError:
+        return JsonResponse({'error': 'exercise and window must be numbers.'}, status=400)
+    if bucket not in analytics.BUCKETS or not 1 <= window <= 52:
+        return JsonResponse({'error': 'bucket must be week or month and window between 1 and 52.'}, status=400)
+    exercise = None
+    if exercise_id is not None:
+        exercise = get_object_or_404(Exercise, Q(user=None) | Q(user=request.user), pk=exercise_id)
+    return JsonResponse(analytics.progress(request.user, exercise, bucket, window))
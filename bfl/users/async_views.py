@@ -0,0 +1,21 @@
+"""
+Async versions of the read-only pages, served by the ASGI application (see bfl/asgi_urls.py).
+"""
+
+from django.shortcuts import redirect
+from bfl.async_utils import aget_user, async_login_required, arender
+from . import views
+
+async def landing(request):
+    user = await aget_user(request)
+    if user.is_authenticated:
+        return redirect('user_home')
+    return await arender(request, 'users/landing.html')
+
+@async_login_required
+async def user_home(request):
+    return await arender(request, 'users/user-home.html', views.home_context(request.user))
+
+@async_login_required
+async def profile(request):
+    return await arender(request, 'users/profile.html', views.profile_context(request.user))
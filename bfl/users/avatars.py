@@ -0,0 +1,294 @@
+"""
+Background processing of uploaded profile pictures.
+
+The raw upload is staged on disk during the request and a small thread pool
+crops and resizes it afterwards, so the edit profile page returns right away
+and keeps showing the previous picture until the new one is ready.
+
+Every processed picture is stored as a set of renditions named after the hash
+of the uploaded content, e.g. ``profile_pics/<hash>_64.webp``. The names never
+change for the same content so the files can be cached forever, and a picture
+that was uploaded before is not processed again: the profiles share its files.
+Files no profile uses anymore are removed by ``manage.py gc_media``, see
+users/media_gc.py.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, features
+
+from bfl import metrics
+from bfl.instrumentation import span
+from .cache import bump_user_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AVATAR = 'default.jpeg' # The picture every profile starts with
+AVATAR_SIZE = 300 # Largest width and height of the largest rendition, which is what the image field points to
+AVATAR_SIZES = (300, 150, 64, 32) # Widths of the renditions, largest first
+AVATAR_FORMATS = [('jpg', 'JPEG')] + ([('webp', 'WEBP')] if features.check('webp') else []) # (extension, Pillow format)
+HASH_LENGTH = 20 # Number of hex digits of the content hash used in the file names
+UPLOAD_DIR = 'profile_pics'
+INCOMING_DIR = 'profile_pics/incoming' # Where raw uploads wait to be processed
+
+RENDITION_RE = re.compile(r'^(?P<stem>%s/[0-9a-f]{%d})_(?P<size>[0-9]+)\.jpg$' % (UPLOAD_DIR, HASH_LENGTH))
+
+
+def stage_upload(upload):
+    """
+    Store the raw upload where the workers can pick it up and return its storage name.
+    """
+    ext = os.path.splitext(upload.name)[1].lower()
+    return default_storage.save(f'{INCOMING_DIR}/{uuid.uuid4().hex}{ext}', upload)
+
+
+def content_hash(name):
+    """
+    Return the truncated SHA-256 hex digest of the stored file with the given name.
+    """
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def rendition_name(stem, size, ext='jpg'):
+    return f'{stem}_{size}.{ext}'
+
+
+def rendition_sizes(width):
+    """
+    Return the widths of the renditions of a picture whose largest rendition is
+    width pixels wide: the width itself, then the smaller AVATAR_SIZES.
+    """
+    return (width,) + tuple(size for size in AVATAR_SIZES if size < width)
+
+
+def renditions(name):
+    """
+    Return {(size, extension): storage name} for every rendition of the processed
+    picture with the given name, or an empty dict for the default picture and
+    pictures uploaded before renditions existed.
+    """
+    match = RENDITION_RE.match(name or '')
+    if match is None or not 0 < int(match.group('size')) <= AVATAR_SIZE:
+        return {}
+    stem = match.group('stem')
+    return {(size, ext): rendition_name(stem, size, ext) for size in rendition_sizes(int(match.group('size'))) for ext, _ in AVATAR_FORMATS}
+
+
+def delete_picture(name):
+    """
+    Delete the stored picture along with all of its renditions.
+    """
+    if not name or name == DEFAULT_AVATAR:
+        return
+    for rendition in set(renditions(name).values()) | {name}:
+        default_storage.delete(rendition)
+
+
+def delete_unused_pictures(names, workers=1):
+    """
+    Delete the pictures (with their renditions) that no profile uses anymore, on
+    a thread pool when there are many. Returns the names that were deleted.
+    """
+    from .models import Profile
+    names = set(names) - {'', DEFAULT_AVATAR}
+    unused = names - set(Profile.objects.filter(image__in=names).values_list('image', flat=True)) # Shared by other profiles
+    if workers > 1 and len(unused) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-delete') as pool:
+            list(pool.map(delete_picture, unused)) # Waits for every deletion, and raises the first error
+    else:
+        for name in unused:
+            delete_picture(name)
+    return unused
+
+
+_released = threading.local()
+
+@contextmanager
+def collect_released_pictures():
+    """
+    Collect the pictures of the profiles deleted in the body of a ``with`` block
+    into the returned set instead of deleting them one at a time, so the caller
+    can delete them together with delete_unused_pictures.
+    """
+    names = set()
+    _released.names = names
+    try:
+        yield names
+    finally:
+        del _released.names
+
+
+def release_picture(name):
+    """
+    The profile using the picture was deleted, delete the picture once the
+    transaction commits unless another profile uses it too.
+    """
+    names = getattr(_released, 'names', None)
+    if names is not None:
+        names.add(name)
+    else:
+        transaction.on_commit(lambda: delete_unused_pictures([name]))
+
+
+def _write(img, name, fmt):
+    path = default_storage.path(name)
+    tmp_path = f'{path}.tmp'
+    img.save(tmp_path, fmt, quality=85)
+    os.replace(tmp_path, path) # Only ever expose a completely written file
+
+
+def reuse_renditions(stem, width):
+    """
+    Return whether every rendition of the picture was written before, when the same
+    picture was uploaded again, and keep them from the garbage collector.
+    """
+    paths = [default_storage.path(rendition_name(stem, size, ext)) for size in rendition_sizes(width) for ext, _ in AVATAR_FORMATS]
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    for path in paths:
+        os.utime(path) # Fresh files are safe from the garbage collector until the profile points to them
+    metrics.incr('avatars.deduplicated')
+    return True
+
+
+def render_avatar(staged_name):
+    """
+    Crop the staged picture into a square, write every rendition of it and
+    return the storage name of the largest JPEG rendition.
+
+    Pictures smaller than AVATAR_SIZE are not enlarged: their largest rendition
+    is as wide as the picture and is named after that width, so the srcset only
+    lists the widths that exist.
+    """
+    stem = f'{UPLOAD_DIR}/{content_hash(staged_name)}'
+    if reuse_renditions(stem, AVATAR_SIZE): # Most pictures are that large, found without opening the upload
+        return rendition_name(stem, AVATAR_SIZE)
+    with span('pillow'), Image.open(default_storage.path(staged_name)) as img: # Counted in the request when processed inline
+        width = min(img.width, img.height, AVATAR_SIZE) # Read from the header, nothing is decoded yet
+        if width < AVATAR_SIZE and reuse_renditions(stem, width):
+            return rendition_name(stem, width)
+        os.makedirs(default_storage.path(UPLOAD_DIR), exist_ok=True)
+        # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding instead of
+        # decoding the full resolution bitmap. The result is never smaller than requested.
+        img.draft('RGB', (AVATAR_SIZE, AVATAR_SIZE))
+        img = img.convert('RGB')
+        # crop the top of the picture into a square depending on if the height is larger than the width or vice versa
+        side = min(img.width, img.height)
+        img = img.crop((0, 0, side, side))
+        img.thumbnail((AVATAR_SIZE, AVATAR_SIZE))
+        for size in rendition_sizes(width): # Each rendition is resized from the previous one, so the picture is only decoded once
+            if size < img.width:
+                img = img.resize((size, size), Image.LANCZOS)
+            for ext, fmt in AVATAR_FORMATS:
+                _write(img, rendition_name(stem, size, ext), fmt)
+    return rendition_name(stem, width)
+
+
+class AvatarQueue:
+    """
+    A local job queue that processes staged uploads on a thread pool.
+
+    ``settings.AVATAR_WORKERS`` controls the number of threads. When it is 0 the
+    job runs synchronously inside the request instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._depth = 0
+        self._latest = {} # profile id -> the most recently staged upload for that profile
+
+    def depth(self):
+        """
+        Return the number of jobs waiting or running.
+        """
+        return self._depth
+
+    def stats(self):
+        """
+        Return the queue depth along with the job counters and timings.
+        """
+        stats = metrics.snapshot('avatars.')
+        stats['depth'] = self.depth()
+        return stats
+
+    def submit(self, profile_id, staged_name):
+        """
+        Queue the staged upload to become the picture of the given profile.
+        """
+        workers = getattr(settings, 'AVATAR_WORKERS', 0)
+        if workers <= 0:
+            self._enqueue(profile_id, staged_name)
+            self._run(profile_id, staged_name)
+            return
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='avatars')
+
+        def start():
+            self._enqueue(profile_id, staged_name)
+            self._executor.submit(self._run, profile_id, staged_name, True)
+        transaction.on_commit(start) # Wait for the request to commit so the worker is guaranteed to see the profile row
+
+    def _enqueue(self, profile_id, staged_name):
+        with self._lock:
+            self._latest[profile_id] = staged_name
+            self._depth += 1
+            metrics.gauge('avatars.depth', self._depth)
+
+    def _run(self, profile_id, staged_name, background=False):
+        start = time.perf_counter()
+        try:
+            self._process(profile_id, staged_name)
+            metrics.incr('avatars.processed')
+        except Exception:
+            metrics.incr('avatars.failed')
+            logger.exception('Unable to process the profile picture %s', staged_name)
+        finally:
+            default_storage.delete(staged_name)
+            with self._lock:
+                if self._latest.get(profile_id) == staged_name:
+                    del self._latest[profile_id]
+                self._depth -= 1
+                metrics.gauge('avatars.depth', self._depth)
+            elapsed = time.perf_counter() - start
+            metrics.record('avatars.job', elapsed)
+            logger.info('Processed profile picture for profile %s in %.1f ms', profile_id, elapsed * 1000)
+            if background:
+                connection.close() # Worker threads do not go through the request cycle that closes connections
+
+    def _process(self, profile_id, staged_name):
+        from .models import Profile
+        name = render_avatar(staged_name)
+        with self._lock:
+            superseded = self._latest.get(profile_id) != staged_name
+        old_name = Profile.objects.filter(pk=profile_id).values_list('image', flat=True).first()
+        if superseded: # A newer upload for the same profile was queued while this one was processed
+            unused = name
+        elif Profile.objects.filter(pk=profile_id).update(image=name): # Swap the new picture in with a single UPDATE
+            unused = old_name
+            user_id = Profile.objects.filter(pk=profile_id).values_list('user_id', flat=True).first()
+            bump_user_version(user_id) # update() sends no post_save, drop the fragments showing the old picture
+        else: # The profile was deleted in the meantime
+            unused = name
+        if unused: # Profiles that uploaded the same picture share its files
+            delete_unused_pictures([unused])
+
+
+queue = AvatarQueue()
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from . import cache
+
+def load_user(user_id):
+    """
+    Load the user with their profile in a single query, None if there is no such user.
+    Every page shows the profile picture in the navbar.
+    """
+    try:
+        return User.objects.select_related('profile').get(pk=user_id)
+    except User.DoesNotExist:
+        return None
+
+class CachedModelBackend(ModelBackend):
+    """
+    The model backend, loading the user of the session with their profile, from the
+    local cache instead of the database when USER_CACHE_TIMEOUT is set.
+    """
+
+    def get_user(self, user_id):
+        if settings.USER_CACHE_TIMEOUT:
+            user = cache.get_user(user_id, load_user)
+        else:
+            user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
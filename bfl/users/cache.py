@@ -0,0 +1,82 @@
+"""
+Per-user caching of rendered page fragments and of the user of a session.
+
+Every user has a version number that is part of the key of everything cached
+for them. Saving the user or their profile (or logging sets, which changes the
+home page statistics) bumps the version, so stale entries are never read
+again and simply expire.
+"""
+
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from bfl import metrics
+
+def _version_key(user_id):
+    return f'user-version:{user_id}'
+
+def user_version(user_id):
+    """
+    Return the current version of the user's fragments.
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock so a version that was evicted from the cache can never come back
+        version = time.time_ns()
+        cache.add(_version_key(user_id), version, timeout=None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+def bump_user_version(user_id):
+    """
+    Invalidate every cached fragment of the user.
+    """
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError: # The user has no version yet
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+def fragment_key(name, user_id, vary_on=()):
+    parts = ':'.join(str(value) for value in vary_on)
+    return f'fragment:{name}:{user_id}:{user_version(user_id)}:{parts}'
+
+def get_or_render(name, user_id, render, vary_on=()):
+    """
+    Return the cached fragment, or render and cache it, counting hits and misses.
+    """
+    if not settings.FRAGMENT_CACHE_TIMEOUT:
+        return render()
+    key = fragment_key(name, user_id, vary_on)
+    content = cache.get(key)
+    if content is not None:
+        metrics.incr('fragments.hit')
+        metrics.incr(f'fragments.hit.{name}')
+        return content
+    metrics.incr('fragments.miss')
+    metrics.incr(f'fragments.miss.{name}')
+    content = render()
+    cache.set(key, content, settings.FRAGMENT_CACHE_TIMEOUT)
+    return content
+
+def stats():
+    """
+    Return the hit and miss counters of the fragment cache.
+    """
+    return metrics.snapshot('fragments.')['counters']
+
+def get_user(user_id, load):
+    """
+    Return the user from the local cache, or load and cache them. The key contains the
+    version, so saving the user or their profile makes the next request load them again.
+    """
+    key = f'user:{user_id}:{user_version(user_id)}'
+    local = caches['local']
+    user = local.get(key)
+    if user is not None:
+        metrics.incr('users.cache.hit')
+        return user
+    metrics.incr('users.cache.miss')
+    user = load(user_id)
+    if user is not None: # Unknown users are not cached, they may be created later
+        local.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
@@ -0,0 +1,22 @@
+"""
+Email addresses are stored in lower case and kept unique by a unique index on
+auth_user.email (see migration 0003_user_email_unique), so every lookup here
+is an exact match on the indexed column.
+"""
+
+from django.contrib.auth.models import User
+
+def normalize(email):
+    """
+    Return the address in the form it is stored in.
+    """
+    return (email or '').strip().lower()
+
+def in_use(email, exclude_user=None):
+    """
+    Return whether another user has the address.
+    """
+    users = User.objects.filter(email=normalize(email))
+    if exclude_user is not None and exclude_user.pk is not None:
+        users = users.exclude(pk=exclude_user.pk)
+    return users.exists()
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from .models import Profile
+from . import emails
 
 class UserRegisterForm(UserCreationForm):
     first_name = forms.CharField(label="First Name", max_length=30)
@@ -20,12 +21,10 @@ class UserRegisterForm(UserCreationForm):
         """
         Checks the email if it is unique.
         """
-        email = self.cleaned_data.get('email')
-        try:
-            user = User.objects.get(email=email) # Try to find a user with the email the user entered.
-        except User.DoesNotExist:
-            return email
-        raise forms.ValidationError('The email address is already in use by another user.')
+        email = emails.normalize(self.cleaned_data.get('email'))
+        if emails.in_use(email): # An index lookup, the database also enforces this with a unique index
+            raise forms.ValidationError('The email address is already in use by another user.')
+        return email
 
     class Meta:
         model = User
@@ -38,16 +37,10 @@ class UserUpdateForm(forms.ModelForm):
         """
         Checks if the user's email is unique.
         """
-        email = self.cleaned_data.get('email')
-        try:
-            user = User.objects.get(email=email) # Try to find a user with the email the user entered.
-        except User.DoesNotExist:
-            return email
-        else:
-            if user == self.instance:
-                return email
-            else: # Only raise the validation error if the user's entered email is not the same as the user's current email
-                raise forms.ValidationError('This email address is already in use.')
+        email = emails.normalize(self.cleaned_data.get('email'))
+        if emails.in_use(email, exclude_user=self.instance): # The user's current email is not a conflict
+            raise forms.ValidationError('This email address is already in use.')
+        return email
 
     class Meta:
         model = User
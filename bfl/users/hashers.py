@@ -0,0 +1,120 @@
+"""
+Password hashers with their cost taken from the settings.
+
+Which hasher makes new hashes is chosen with BFL_PASSWORD_HASHER (see
+bfl/settings.py). A hash made with another hasher, or with the same hasher
+at a different cost, is replaced on the user's next successful login by
+Django's check_password, so the cost can be tuned without resetting anyone's
+password.
+
+Every verification is timed under ``passwords.verify.<algorithm>`` in
+bfl.metrics, which is the number to compare with the CPU budget of a login.
+"""
+
+import base64
+import hashlib
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.translation import gettext_noop as _
+from bfl import metrics
+
+class TimedHasherMixin:
+    def verify(self, password, encoded):
+        with metrics.timer(f'passwords.verify.{self.algorithm}'):
+            return super().verify(password, encoded)
+
+class PBKDF2PasswordHasher(TimedHasherMixin, hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
+
+class Argon2PasswordHasher(TimedHasherMixin, hashers.Argon2PasswordHasher):
+    """
+    Needs the argon2-cffi package.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+class ScryptPasswordHasher(hashers.BasePasswordHasher):
+    """
+    Memory-hard hashing with hashlib.scrypt from the standard library. The work
+    factor (N) must be a power of 2, the memory used is about 128 * N * block size bytes.
+    """
+    algorithm = 'scrypt'
+
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.SCRYPT_PARALLELISM
+
+    def salt(self):
+        return get_random_string(22)
+
+    def encode(self, password, salt, work_factor=None, block_size=None, parallelism=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        work_factor = work_factor or self.work_factor
+        block_size = block_size or self.block_size
+        parallelism = parallelism or self.parallelism
+        hash = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=work_factor, r=block_size, p=parallelism,
+            maxmem=2 * 128 * work_factor * block_size * parallelism, # OpenSSL refuses anything over 32 MB by default
+            dklen=64,
+        )
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return f'{self.algorithm}${work_factor}${salt}${block_size}${parallelism}${hash}'
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash = encoded.split('$', 5)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash,
+        }
+
+    def verify(self, password, encoded):
+        with metrics.timer(f'passwords.verify.{self.algorithm}'):
+            decoded = self.decode(encoded)
+            encoded_2 = self.encode(password, decoded['salt'], decoded['work_factor'], decoded['block_size'], decoded['parallelism'])
+            return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('work factor'): decoded['work_factor'],
+            _('block size'): decoded['block_size'],
+            _('parallelism'): decoded['parallelism'],
+            _('salt'): hashers.mask_hash(decoded['salt']),
+            _('hash'): hashers.mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (decoded['work_factor'], decoded['block_size'], decoded['parallelism']) != (self.work_factor, self.block_size, self.parallelism)
+
+    def harden_runtime(self, password, encoded):
+        # The cost is part of every hash and is raised on the next login, there are no extra rounds to make up for
+        pass
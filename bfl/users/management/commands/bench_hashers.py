@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from bfl.bench import measure, format_table
+
+class Command(BaseCommand):
+    help = 'Measure how long each password hasher takes at the configured cost, to tune it against the CPU budget of a login.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help='Number of timed verifications per hasher.')
+
+    def handle(self, *args, **options):
+        rows = []
+        for name, path in settings.PASSWORD_HASHER_CHOICES.items():
+            hasher = import_string(path)()
+            try:
+                encoded = hasher.encode('bench-Password-1234', hasher.salt())
+            except ValueError as e: # The library of the hasher is not installed
+                self.stderr.write(f'Skipping {name}: {e}')
+                continue
+            timing = measure(lambda: hasher.verify('bench-Password-1234', encoded), options['repeat'], warmup=1)
+            rows.append({
+                'hasher': name,
+                'preferred': 'yes' if name == settings.PASSWORD_HASHER else '',
+                'cost': ', '.join(f'{key}={value}' for key, value in hasher.safe_summary(encoded).items() if key not in ('algorithm', 'salt', 'hash', 'checksum')),
+                'p50_ms': timing['p50_ms'],
+                'p95_ms': timing['p95_ms'],
+                'logins/s per core': round(1000 / timing['p50_ms'], 1),
+            })
+        self.stdout.write(format_table(rows, ['hasher', 'preferred', 'cost', 'p50_ms', 'p95_ms', 'logins/s per core']))
@@ -0,0 +1,119 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models.signals import post_save
+from django.test import override_settings
+from PIL import Image
+from bfl.bench import format_table
+from bfl.metrics import Timing
+from users import avatars, signals
+from users.forms import UserRegisterForm
+from users.models import Profile
+from users.services import register_user
+
+PREFIX = 'bench-register-'
+
+def legacy_profile_save(profile):
+    """
+    Profile.save before users/avatars.py: the picture was opened with Pillow on every save
+    and cropped and resized when larger than 300x300.
+    """
+    profile.save()
+    with Image.open(profile.image.path) as img:
+        if img.height > 300 or img.width > 300:
+            side = min(img.width, img.height)
+            img = img.crop((0, 0, side, side))
+            img.thumbnail((300, 300))
+            img.save(io.BytesIO(), 'JPEG') # Written over the picture back then, the shared default is left alone
+    return profile
+
+def legacy_register(form):
+    """
+    The registration flow before users/services.py: every step commits on its own, the
+    new user is read back by username and its profile is created and saved explicitly.
+    """
+    form.save()
+    user = User.objects.get(username=form.cleaned_data.get('username'))
+    legacy_profile_save(Profile(user=user))
+
+@contextmanager
+def without_profile_signal():
+    """
+    Register users without the signal that creates their profile, as before users/signals.py.
+    """
+    post_save.disconnect(signals.create_profile, sender=User)
+    try:
+        yield
+    finally:
+        post_save.connect(signals.create_profile, sender=User)
+
+@contextmanager
+def default_picture():
+    """
+    Use the configured media directory if it has the default picture, which the legacy
+    flow opens, else a temporary one with a 300x300 picture in its place.
+    """
+    if os.path.exists(os.path.join(settings.MEDIA_ROOT, avatars.DEFAULT_AVATAR)):
+        yield
+        return
+    media_root = tempfile.mkdtemp()
+    try:
+        Image.new('RGB', (300, 300), (200, 200, 200)).save(os.path.join(media_root, avatars.DEFAULT_AVATAR), 'JPEG')
+        with override_settings(MEDIA_ROOT=media_root):
+            yield
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+class Command(BaseCommand):
+    help = 'Measure registrations per second of the legacy and the transactional registration flow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Number of registrations per flow.')
+        parser.add_argument(
+            '--real-hasher', action='store_true',
+            help='Hash passwords with the configured hasher instead of a fast one, which usually dominates the time.',
+        )
+
+    def handle(self, *args, **options):
+        flows = [('legacy', legacy_register, without_profile_signal), ('service', register_user, nullcontext)]
+        # Registrations are committed like real ones, so the created users are deleted afterwards
+        User.objects.filter(username__startswith=PREFIX).delete()
+        hashers = None if options['real_hasher'] else ['django.contrib.auth.hashers.MD5PasswordHasher']
+        rows = []
+        try:
+            with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})), default_picture():
+                for name, flow, signals_context in flows:
+                    timing = Timing()
+                    start = time.perf_counter()
+                    with signals_context():
+                        for i in range(options['users']):
+                            username = f'{PREFIX}{name}-{i}'
+                            form = UserRegisterForm(data={
+                                'first_name': 'Bench',
+                                'last_name': 'User',
+                                'username': username,
+                                'email': f'{username}@bench.invalid',
+                                'password1': 'bench-Password-1234',
+                                'password2': 'bench-Password-1234',
+                            })
+                            request_start = time.perf_counter()
+                            if not form.is_valid():
+                                raise ValueError(f'Invalid benchmark registration: {form.errors.as_text()}')
+                            flow(form)
+                            timing.add(time.perf_counter() - request_start)
+                    elapsed = time.perf_counter() - start
+                    rows.append({
+                        'flow': name,
+                        'users': options['users'],
+                        'registrations/s': round(options['users'] / elapsed, 1),
+                        **{key: value for key, value in timing.as_dict().items() if key in ('p50_ms', 'p95_ms', 'p99_ms')},
+                    })
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+        self.stdout.write(format_table(rows, ['flow', 'users', 'registrations/s', 'p50_ms', 'p95_ms', 'p99_ms']))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from bfl.bench import format_table
+from users import media_gc
+
+class Command(BaseCommand):
+    help = 'Delete the profile picture files no profile uses, e.g. left behind by crashed or interrupted jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=3600, help='Seconds a file must be old before it can be deleted.')
+        parser.add_argument('--workers', type=int, default=8, help='Threads deleting the files.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0 or options['workers'] < 1:
+            raise CommandError('--min-age cannot be negative and --workers must be positive.')
+        result = media_gc.collect(min_age=options['min_age'], workers=options['workers'], dry_run=options['dry_run'])
+        if options['dry_run'] and options['verbosity'] > 1:
+            for name, size in result.orphans:
+                self.stdout.write(f'{name} ({size} bytes)')
+        row = result.as_dict()
+        self.stdout.write(format_table([row], list(row)))
+        if result.errors:
+            raise CommandError(f'{result.errors} files could not be deleted.')
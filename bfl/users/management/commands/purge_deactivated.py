@@ -0,0 +1,63 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from bfl.bench import format_table
+from users import retention
+
+class Command(BaseCommand):
+    help = (
+        'Delete (or archive and delete) the accounts deactivated longer than the grace period ago, '
+        'in batches, continuing an interrupted run from its checkpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-days', type=int, default=settings.DEACTIVATION_GRACE_DAYS, help='Days a deactivated account is kept.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Accounts deleted per transaction.')
+        parser.add_argument('--workers', type=int, default=8, help='Threads deleting the profile pictures.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches, the next run continues from there.')
+        parser.add_argument('--archive', help='Write every account and its history to this directory before deleting it.')
+        parser.add_argument('--checkpoint', default=settings.RETENTION_CHECKPOINT, help='File recording the progress of the run.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint of an interrupted run.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count (and archive) the accounts that would be deleted.')
+        parser.add_argument(
+            '--include-legacy', action='store_true',
+            help='Also delete the inactive accounts without a deactivation date that were last seen before the grace period.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be positive.')
+        if options['archive']:
+            os.makedirs(options['archive'], exist_ok=True)
+        cutoff = timezone.now() - timedelta(days=options['grace_days'])
+        if options['restart']:
+            checkpoint = retention.Checkpoint(options['checkpoint'], cutoff)
+        else:
+            checkpoint = retention.Checkpoint.load(options['checkpoint'], cutoff)
+            if checkpoint.last_pk:
+                self.stdout.write(f'Continuing the run with the cutoff {checkpoint.cutoff:%Y-%m-%d %H:%M} after user {checkpoint.last_pk}.')
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                stats = result.as_dict()
+                self.stdout.write(f"Batch {stats['batches']}: {stats['accounts']} accounts, {stats['accounts/s']} accounts/s")
+
+        result = retention.purge(
+            checkpoint,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            archive=options['archive'],
+            dry_run=options['dry_run'],
+            max_batches=options['max_batches'],
+            progress=progress,
+            include_legacy=options['include_legacy'],
+        )
+        row = result.as_dict()
+        if options['dry_run']:
+            self.stdout.write(f"Dry run, {result.accounts} accounts would be deleted.")
+        elif options['max_batches'] is None or result.batches < options['max_batches']:
+            checkpoint.delete() # Every expired account was handled
+            row['sessions'] = retention.sweep_sessions()
+        self.stdout.write(format_table([row], ['batches', 'accounts', 'pictures', 'sessions', 'seconds', 'accounts/s']))
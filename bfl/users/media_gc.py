@@ -0,0 +1,128 @@
+"""
+Garbage collection of the profile pictures, run by ``manage.py gc_media``.
+
+Pictures are content addressed and shared between profiles (see
+users/avatars.py), so a file can only be deleted once no profile uses it.
+Deleting a profile releases its picture, but files are still left behind by
+jobs that crashed halfway, uploads staged for a job that never ran, old
+uploads replaced outside of Profile.save and runs of purge_deactivated that
+were interrupted between the database and the files.
+
+The collector walks the upload directory with ``os.scandir`` (whose entries
+carry the file metadata, no extra ``stat`` per file), diffs it against the set
+of every name the profiles reference, and deletes the difference on a thread
+pool. Files younger than the minimum age are never touched, they may belong to
+a job that has not updated its profile yet.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.storage import default_storage
+from .models import Profile
+from . import avatars
+
+
+class GCResult:
+    def __init__(self):
+        self.scanned = 0
+        self.referenced = 0 # Names the profiles use
+        self.orphans = [] # (name, size) of the files to delete
+        self.young = 0 # Orphans kept because they are younger than the minimum age
+        self.deleted = 0
+        self.errors = 0
+        self.timings = {} # step -> seconds
+
+    @property
+    def orphan_bytes(self):
+        return sum(size for _, size in self.orphans)
+
+    def as_dict(self):
+        return {
+            'scanned': self.scanned,
+            'referenced': self.referenced,
+            'orphans': len(self.orphans),
+            'MB': round(self.orphan_bytes / 2 ** 20, 2),
+            'too young': self.young,
+            'deleted': self.deleted,
+            'errors': self.errors,
+            **{f'{step} s': round(seconds, 3) for step, seconds in self.timings.items()},
+        }
+
+
+def scan(root, directory):
+    """
+    Yield (storage name, size, modification time) of every file below the directory.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield name, stat.st_size, stat.st_mtime
+
+
+def referenced_names():
+    """
+    Return the set of every file name used by a profile, with the renditions of its picture.
+    """
+    names = set()
+    for image in Profile.objects.values_list('image', flat=True).distinct().iterator():
+        names.add(image)
+        names.update(avatars.renditions(image).values())
+    return names
+
+
+def _delete(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError: # Deleted by someone else in the meantime, which is fine
+        return True
+    except OSError:
+        return False
+
+
+def collect(min_age=3600, workers=8, dry_run=False, directory=avatars.UPLOAD_DIR):
+    """
+    Find (and unless dry_run, delete) the files below the directory no profile uses.
+    """
+    result = GCResult()
+    root = default_storage.path('')
+    start = time.perf_counter()
+    files = list(scan(root, directory))
+    result.scanned = len(files)
+    result.timings['scan'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    referenced = referenced_names() # Read after the scan, so a file created during the scan and used by a profile is kept
+    result.referenced = len(referenced)
+    result.timings['index'] = time.perf_counter() - start
+
+    deadline = time.time() - min_age
+    for name, size, mtime in files:
+        if name in referenced:
+            continue
+        if mtime > deadline:
+            result.young += 1
+        else:
+            result.orphans.append((name, size))
+
+    if not dry_run and result.orphans:
+        start = time.perf_counter()
+        paths = [os.path.join(root, name) for name, _ in result.orphans]
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='media-gc') as pool:
+            deleted = sum(pool.map(_delete, paths))
+        result.deleted = deleted
+        result.errors = len(paths) - deleted
+        result.timings['delete'] = time.perf_counter() - start
+    return result
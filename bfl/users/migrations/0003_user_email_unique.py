@@ -0,0 +1,76 @@
+"""
+Store every email address in lower case and enforce their uniqueness with a
+unique index on auth_user.email, which also replaces the full table scans of
+the email checks in users/forms.py with index lookups.
+
+Empty addresses (e.g. superusers created without one) are left out of the
+index. The migration stops with the list of conflicting addresses if existing
+users share an address, those have to be resolved by hand first.
+"""
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower, Trim
+
+BATCH_SIZE = 1000
+INDEX_NAME = 'users_auth_user_email_unique'
+
+
+def find_duplicates(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = (
+        User.objects.exclude(email='').annotate(normalized=Lower(Trim('email')))
+        .values('normalized').annotate(users=Count('id')).filter(users__gt=1)
+        .order_by('normalized').values_list('normalized', flat=True)
+    )
+    duplicates = list(duplicates[:50])
+    if duplicates:
+        raise RuntimeError(
+            'Some users share an email address, give them unique addresses before migrating: '
+            + ', '.join(duplicates)
+        )
+
+
+def lowercase_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    last_pk = 0
+    while True:
+        # Walk the table by primary key so every batch is a short indexed range scan and a short transaction
+        pks = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        User.objects.filter(pk__in=pks).update(email=Lower(Trim('email')))
+        last_pk = pks[-1]
+
+
+def create_index(apps, schema_editor):
+    quote = schema_editor.quote_name
+    if schema_editor.connection.features.supports_partial_indexes:
+        schema_editor.execute(
+            f"CREATE UNIQUE INDEX {quote(INDEX_NAME)} ON {quote('auth_user')} ({quote('email')}) WHERE {quote('email')} <> ''"
+        )
+    else: # e.g. MySQL, where every user needs an address for the index to be unique
+        schema_editor.execute(f"CREATE UNIQUE INDEX {quote(INDEX_NAME)} ON {quote('auth_user')} ({quote('email')})")
+
+
+def drop_index(apps, schema_editor):
+    quote = schema_editor.quote_name
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f"DROP INDEX {quote(INDEX_NAME)} ON {quote('auth_user')}")
+    else:
+        schema_editor.execute(f"DROP INDEX {quote(INDEX_NAME)}")
+
+
+class Migration(migrations.Migration):
+    atomic = False # Each batch of the backfill commits on its own
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_auto_20200918_1130'),
+    ]
+
+    operations = [
+        migrations.RunPython(find_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
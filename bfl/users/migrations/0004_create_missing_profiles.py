@@ -0,0 +1,37 @@
+"""
+Give every user without a profile the default one, so a user always has a
+profile (new users get theirs from a signal, see users/signals.py).
+"""
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+DEFAULT_AVATAR = 'default.jpeg' # users.avatars.DEFAULT_AVATAR when this migration was written
+
+
+def create_missing_profiles(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    last_pk = 0
+    while True:
+        # Walk the table by primary key so every batch is a short indexed range scan and a short transaction
+        pks = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        Profile.objects.bulk_create(
+            Profile(user_id=pk, image=DEFAULT_AVATAR)
+            for pk in User.objects.filter(pk__in=pks, profile__isnull=True).values_list('pk', flat=True)
+        )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False # Each batch commits on its own
+
+    dependencies = [
+        ('users', '0003_user_email_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
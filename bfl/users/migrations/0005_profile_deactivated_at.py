@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_create_missing_profiles'),
+    ]
+
+    operations = [
+        # Accounts deactivated before are left without a date, they are only purged with --include-legacy
+        migrations.AddField(
+            model_name='profile',
+            name='deactivated_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,25 +1,32 @@
 from django.db import models
+from django_cleanup import cleanup
 from django.contrib.auth.models import User
-from PIL import Image
+from . import avatars
 
+@cleanup.ignore # Profiles can share a picture, the signals delete it when the last one is deleted
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE) # if the user is deleted, also delete the profile but not vice versa
-    image = models.ImageField(default='default.jpeg', upload_to='profile_pics') # default to the default.jpeg picture when profile is created
+    image = models.ImageField(default=avatars.DEFAULT_AVATAR, upload_to='profile_pics') # default to the default.jpeg picture when profile is created
+    deactivated_at = models.DateTimeField(null=True, blank=True, db_index=True) # when the user deactivated their account, see users/retention.py
 
     def __str__(self):
         return f'{self.user.username} Profile' # how profile name will be displayed on Admin site
 
-    def save(self):
-        super().save() # initially save the image
-        img = Image.open(self.image.path) # open the image
-        if img.height > 300 or img.width > 300: # if the image is too large
-            output_size = (300, 300) # the desired output size
-            # if the image is rectangular then crop the top half of the picture into a square
-            # depending on if the height is larger than the width or vice versa
-            if img.height > img.width:
-                crop_size = (0, 0, img.width, img.width)
-            else:
-                crop_size = (0, 0, img.height, img.height)
-            cropped_img = img.crop(crop_size) # crop the image into a square
-            cropped_img.thumbnail(output_size) # crop the image into the desired output size
-            cropped_img.save(self.image.path) # save the image 
+    def save(self, *args, **kwargs):
+        upload = None
+        if self.image and not self.image._committed: # a new picture was uploaded
+            upload = self.image
+            self.image = self.current_image() # keep showing the current picture until the new one is processed
+        super().save(*args, **kwargs)
+        if upload is not None:
+            # crop and resize the picture in the background, see users/avatars.py
+            avatars.queue.submit(self.pk, avatars.stage_upload(upload))
+
+    def current_image(self):
+        """
+        Return the name of the picture that is stored in the database for this profile.
+        """
+        if self.pk is None:
+            return avatars.DEFAULT_AVATAR
+        name = Profile.objects.filter(pk=self.pk).values_list('image', flat=True).first()
+        return name or avatars.DEFAULT_AVATAR
@@ -0,0 +1,166 @@
+"""
+Rate limiting of the login and registration attempts.
+
+Every attempt takes a token from a bucket per client IP address and, for
+logins, per username. Buckets hold up to ``capacity`` tokens and refill
+continuously at ``capacity / period`` tokens per second (settings.RATELIMITS),
+so short bursts are fine but a sustained stream of attempts is throttled
+before the password is hashed.
+
+Buckets are kept in a store selected by BFL_RATELIMIT_STORE:
+
+memory  this process only, the least recently used buckets are evicted
+        (and start full again) beyond settings.RATELIMIT_MEMORY_KEYS
+cache   the RATELIMIT_CACHE_ALIAS cache, shared by the workers when it is a
+        file or database cache. Updates are not atomic, concurrent attempts
+        of one client can overdraw its bucket by a few tokens.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+from bfl import metrics
+
+
+def refill(state, capacity, rate, now):
+    """
+    Return the tokens of a bucket with the given (tokens, updated at) state at the time now.
+    """
+    if state is None:
+        return capacity
+    tokens, updated_at = state
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def take_token(state, capacity, rate, now):
+    """
+    Take a token from the bucket. Return the new state and the seconds until a
+    token is available, 0 when one was taken.
+    """
+    tokens = refill(state, capacity, rate, now)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryStore:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        with self.lock:
+            state, retry_after = take_token(self.buckets.get(key), capacity, rate, time.monotonic())
+            self.buckets[key] = state
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False) # The least recently used bucket
+        return retry_after
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheStore:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, capacity, rate):
+        cache = caches[self.alias]
+        key = f'ratelimit:{key}'
+        state, retry_after = take_token(cache.get(key), capacity, rate, time.time()) # Wall time, shared by the workers
+        cache.set(key, state, timeout=int(capacity / rate) + 1) # A bucket that would be full again is not needed
+        return retry_after
+
+    def clear(self):
+        pass # Buckets expire with the cache entries
+
+
+_memory_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _memory_store
+    if settings.RATELIMIT_STORE == 'cache':
+        return CacheStore(settings.RATELIMIT_CACHE_ALIAS)
+    if _memory_store is None:
+        with _store_lock:
+            if _memory_store is None:
+                _memory_store = MemoryStore(settings.RATELIMIT_MEMORY_KEYS)
+    return _memory_store
+
+
+def client_ip(request):
+    """
+    Return the IP address of the client, from the header set by the proxies in front
+    of the application when settings.RATELIMIT_IP_HEADER names one.
+
+    Every proxy appends the address it received the request from, so only the last
+    settings.RATELIMIT_PROXY_COUNT entries were written by trusted proxies. The ones
+    before them come from the client and could be anything.
+    """
+    header = settings.RATELIMIT_IP_HEADER
+    count = settings.RATELIMIT_PROXY_COUNT
+    if header and count > 0:
+        addresses = [address.strip() for address in request.META.get(header, '').split(',')]
+        if len(addresses) >= count and addresses[-count]:
+            return addresses[-count] # The address the outermost trusted proxy saw
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check(scope, **values):
+    """
+    Take a token from the bucket of every value (e.g. ip=..., username=...) for
+    the scope, stopping at the first empty one. Return 0 if the attempt may go
+    ahead, else the seconds until it may be retried.
+    """
+    store = get_store()
+    for kind, value in values.items():
+        limit = settings.RATELIMITS.get(f'{scope}.{kind}')
+        if limit is None or not value:
+            continue
+        capacity, period = limit
+        digest = hashlib.sha1(str(value).lower().encode()).hexdigest() # Bounded keys, no usernames or addresses in the cache
+        retry_after = store.take(f'{scope}.{kind}:{digest}', capacity, capacity / period)
+        if retry_after:
+            metrics.incr('ratelimit.throttled')
+            metrics.incr(f'ratelimit.throttled.{scope}.{kind}')
+            return retry_after
+    return 0.0
+
+
+def ratelimit(scope, username_field=None):
+    """
+    Throttle the POST requests of a view by client IP address and, with
+    username_field, by the username posted in that field. Throttled requests
+    get a 429 response without running the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if settings.RATELIMIT_ENABLED and request.method == 'POST':
+                values = {'ip': client_ip(request)}
+                if username_field:
+                    values['username'] = request.POST.get(username_field, '').strip()
+                retry_after = check(scope, **values)
+                if retry_after:
+                    response = render(request, 'users/throttled.html', {'title': 'Too Many Attempts', 'retry_after': int(retry_after) + 1}, status=429)
+                    response['Retry-After'] = str(int(retry_after) + 1)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """
+    Return the counters of throttled requests.
+    """
+    return metrics.snapshot('ratelimit.')['counters']
@@ -0,0 +1,178 @@
+"""
+Deletion of the accounts that were deactivated longer than the grace period
+(settings.DEACTIVATION_GRACE_DAYS) ago, run by ``manage.py purge_deactivated``.
+Inactive accounts without a deactivation date, from before it was recorded,
+are only deleted when the run includes them (``--include-legacy``).
+
+Accounts are deleted in batches, each in its own transaction, along with
+their history, profile and profile picture (unless another profile shares
+it). The pictures of a batch are deleted on a thread pool after it commits.
+With an archive directory the account and its history are first written to
+``<pk>.json`` and ``<pk>.ndjson.gz`` there (see log/exporters.py).
+
+After every batch the primary key it ended at is written to a checkpoint
+file, so an interrupted run continues where it stopped, with the same cutoff.
+Finally the stored sessions of deleted and deactivated users are removed.
+"""
+
+import json
+import os
+import time
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from log import exporters, services as log_services
+from . import avatars
+
+
+def grace_days():
+    return settings.DEACTIVATION_GRACE_DAYS
+
+
+def expired_accounts(cutoff, include_legacy=False):
+    """
+    Return the deactivated users whose grace period ended before the cutoff. With
+    include_legacy, also the inactive users without a deactivation date (deactivated
+    before it was recorded, or in the admin) who were last seen before the cutoff.
+    """
+    expired = Q(profile__deactivated_at__lt=cutoff)
+    if include_legacy:
+        last_seen_before = Q(last_login__lt=cutoff) | Q(last_login=None, date_joined__lt=cutoff)
+        expired |= Q(profile__deactivated_at=None) & last_seen_before
+    return User.objects.filter(expired, is_active=False)
+
+
+class Checkpoint:
+    """
+    Progress of a run, stored as JSON in a file that is replaced atomically.
+    """
+
+    def __init__(self, path, cutoff, last_pk=0):
+        self.path = path
+        self.cutoff = cutoff
+        self.last_pk = last_pk
+
+    @classmethod
+    def load(cls, path, cutoff):
+        """
+        Return the checkpoint of an interrupted run, or a new one with the given cutoff.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path, cutoff)
+        return cls(path, parse_datetime(data['cutoff']), data['last_pk'])
+
+    def save(self):
+        with open(f'{self.path}.tmp', 'w') as f:
+            json.dump({'cutoff': self.cutoff.isoformat(), 'last_pk': self.last_pk}, f)
+        os.replace(f'{self.path}.tmp', self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def archive_account(user, directory):
+    """
+    Write the account and the history of the user to the archive directory.
+    """
+    account = {
+        'pk': user.pk,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_joined': user.date_joined.isoformat(),
+        'deactivated_at': user.profile.deactivated_at and user.profile.deactivated_at.isoformat(), # None for legacy accounts
+        'image': user.profile.image.name,
+    }
+    for name, pieces in (
+        (f'{user.pk}.json', [json.dumps(account).encode()]),
+        (f'{user.pk}.ndjson.gz', exporters.export(user, 'ndjson', compress=True)),
+    ):
+        path = os.path.join(directory, name)
+        with open(f'{path}.tmp', 'wb') as f:
+            for piece in pieces:
+                f.write(piece)
+        os.replace(f'{path}.tmp', path) # An interrupted run never leaves a partial archive behind
+
+
+class PurgeResult:
+    def __init__(self):
+        self.batches = 0
+        self.accounts = 0
+        self.pictures = 0 # Pictures deleted, each with its renditions
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'batches': self.batches,
+            'accounts': self.accounts,
+            'pictures': self.pictures,
+            'seconds': round(self.seconds, 2),
+            'accounts/s': round(self.accounts / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+def purge(checkpoint, batch_size=200, workers=8, archive=None, dry_run=False, max_batches=None, progress=None, include_legacy=False):
+    """
+    Delete the expired accounts after the checkpoint in batches, see the module
+    docstring and expired_accounts. ``progress`` is called with the result after every batch.
+    """
+    result = PurgeResult()
+    start = time.perf_counter()
+    while max_batches is None or result.batches < max_batches:
+        users = list(
+            expired_accounts(checkpoint.cutoff, include_legacy).filter(pk__gt=checkpoint.last_pk)
+            .select_related('profile').order_by('pk')[:batch_size]
+        )
+        if not users:
+            break
+        if archive:
+            for user in users:
+                archive_account(user, archive)
+        if not dry_run:
+            pks = [user.pk for user in users]
+            with avatars.collect_released_pictures() as pictures:
+                with transaction.atomic():
+                    log_services.delete_history(pks)
+                    User.objects.filter(pk__in=pks).delete() # The profiles release their pictures into the set
+            result.pictures += len(avatars.delete_unused_pictures(pictures, workers))
+        checkpoint.last_pk = users[-1].pk
+        if not dry_run:
+            checkpoint.save()
+        result.batches += 1
+        result.accounts += len(users)
+        result.seconds = time.perf_counter() - start
+        if progress is not None:
+            progress(result)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def sweep_sessions(batch_size=1000):
+    """
+    Delete the stored sessions of users that were deleted or deactivated, which can
+    never be used again, and return how many were deleted. Sessions do not record
+    their user in a column, so they are decoded a batch at a time.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if not hasattr(store, 'get_model_class'): # Sessions that are not in the database expire by themselves
+        return 0
+    Session = store.get_model_class()
+    deleted, last_key = 0, ''
+    while True:
+        sessions = list(Session.objects.filter(session_key__gt=last_key).order_by('session_key')[:batch_size])
+        if not sessions:
+            return deleted
+        last_key = sessions[-1].session_key
+        owners = {session.session_key: session.get_decoded().get(SESSION_KEY) for session in sessions}
+        active = {str(pk) for pk in User.objects.filter(pk__in={pk for pk in owners.values() if pk}, is_active=True).values_list('pk', flat=True)}
+        ended = [key for key, pk in owners.items() if pk and pk not in active] # Anonymous sessions are left alone
+        deleted += Session.objects.filter(session_key__in=ended).delete()[0]
@@ -0,0 +1,27 @@
+"""
+Account operations shared by the views and management commands.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+from .models import Profile
+
+def register_user(form):
+    """
+    Create the user of a valid UserRegisterForm along with their profile (see
+    users/signals.py) in a single transaction, so a failure never leaves a user
+    without a profile. Raises IntegrityError if another registration took the
+    username or email after the form was validated.
+    """
+    with transaction.atomic():
+        return form.save()
+
+def deactivate_user(user):
+    """
+    Deactivate the account and start its grace period, after which users/retention.py
+    deletes it along with everything the user logged.
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        Profile.objects.filter(user=user).update(deactivated_at=timezone.now())
@@ -0,0 +1,40 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from .models import Profile
+from .cache import bump_user_version
+from . import avatars
+from .emails import normalize
+
+@receiver(pre_save, sender=User)
+def normalize_email(sender, instance, **kwargs):
+    instance.email = normalize(instance.email) # The unique index on the column is only case-insensitive for normalized addresses
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw, **kwargs):
+    if created and not raw: # Fixtures bring their own profiles
+        # Every user has a profile, so views and templates never have to check. It starts with
+        # the default picture, which is only a name, nothing is read from disk.
+        Profile.objects.create(user=instance)
+
+@receiver(post_save, sender=User)
+def reactivate_user(sender, instance, created, raw, update_fields=None, **kwargs):
+    if instance.is_active and not created and not raw and (update_fields is None or 'is_active' in update_fields):
+        # Reactivated (in the admin), a later deactivation without a date must not inherit the old one
+        Profile.objects.filter(user=instance, deactivated_at__isnull=False).update(deactivated_at=None)
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    bump_user_version(instance.pk) # The cached fragments show the user's name and email
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_user_version(instance.pk) # Their sessions must not find the cached user
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, **kwargs):
+    bump_user_version(instance.user_id) # The cached fragments show the profile picture
+
+@receiver(post_delete, sender=Profile)
+def profile_deleted(sender, instance, **kwargs):
+    avatars.release_picture(instance.image.name)
@@ -0,0 +1,38 @@
+from django import template
+from django.core.files.storage import default_storage
+from .. import avatars
+
+register = template.Library()
+
+def _name(image):
+    return getattr(image, 'name', None) or avatars.DEFAULT_AVATAR # Users without a profile get the default picture
+
+@register.simple_tag
+def avatar_srcset(image, ext='jpg'):
+    """
+    Return the srcset attribute value listing every rendition of the profile picture
+    in the given format, e.g. {% avatar_srcset user.profile.image 'webp' %}.
+    """
+    names = avatars.renditions(_name(image))
+    if not names: # The default picture and old uploads only have a single file
+        return default_storage.url(_name(image)) if ext == 'jpg' else ''
+    return ', '.join(
+        f'{default_storage.url(name)} {size}w' # The real width, smaller pictures have fewer renditions
+        for (size, name_ext), name in sorted(names.items()) if name_ext == ext
+    )
+
+@register.inclusion_tag('users/avatar.html')
+def avatar(image, sizes, css_class='', element_id=''):
+    """
+    Render a <picture> for the profile picture that lets the browser pick the
+    smallest rendition for the displayed size, e.g. {% avatar user.profile.image '32px' %}.
+    """
+    names = avatars.renditions(_name(image))
+    return {
+        'src': default_storage.url(_name(image)),
+        'srcset': avatar_srcset(image) if names else '',
+        'webp_srcset': avatar_srcset(image, 'webp') if names else '',
+        'sizes': sizes,
+        'css_class': css_class,
+        'element_id': element_id,
+    }
@@ -0,0 +1,35 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from bfl.storage import fallback_ext, variant_name, variant_widths
+
+register = template.Library()
+
+def static_srcset(name, ext):
+    """
+    Return the srcset attribute value listing the collected variants of a static image in
+    the given format, empty without the manifest storage (e.g. with DEBUG on).
+    """
+    if not settings.STATIC_MANIFEST:
+        return ''
+    collected = getattr(staticfiles_storage, 'hashed_files', {})
+    return ', '.join(
+        f'{staticfiles_storage.url(variant_name(name, width, ext))} {width}w'
+        for width in variant_widths(name) if variant_name(name, width, ext) in collected # Images are never upscaled
+    )
+
+@register.inclusion_tag('users/static_image.html')
+def static_image(name, sizes, alt='', style=''):
+    """
+    Render a <picture> for a static image that lets the browser pick the smallest
+    variant written by collectstatic for the displayed size,
+    e.g. {% static_image 'users/images/gym-weight.jpg' '100vw' 'Gym Weights' %}.
+    """
+    return {
+        'src': staticfiles_storage.url(name),
+        'srcset': static_srcset(name, fallback_ext(name)),
+        'webp_srcset': static_srcset(name, 'webp'),
+        'sizes': sizes,
+        'alt': alt,
+        'style': style,
+    }
@@ -0,0 +1,32 @@
+from django import template
+from .. import cache
+
+register = template.Library()
+
+class UserCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        user = context.get('user')
+        if user is None or not user.is_authenticated: # Only fragments of logged in users are cached
+            return self.nodelist.render(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return cache.get_or_render(self.name, user.pk, lambda: self.nodelist.render(context), vary_on)
+
+@register.tag
+def usercache(parser, token):
+    """
+    Cache the enclosed fragment for the logged in user until their user or profile changes.
+
+    Usage: {% usercache "name" [vary_on ...] %} ... {% endusercache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endusercache',))
+    parser.delete_first_token()
+    name = bits[1].strip('\'"')
+    return UserCacheNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,6 +1,27 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from datetime import timedelta
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
 from django.urls import reverse
+from django.contrib.auth.hashers import make_password, check_password, get_hasher
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from bfl import metrics
 from .models import Profile
+from . import avatars, cache, media_gc, ratelimit, retention, services
+from log.models import Exercise, Workout, WorkoutSet
+from .templatetags.avatar_tags import avatar_srcset
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
 from django.contrib.auth.models import User
 
@@ -18,11 +39,9 @@ def create_user(first_name='Test', last_name='User', username='myuser', email='m
 
 def create_profile(user):
     """
-    Create a profile for the given user.
+    Return the profile of the given user, which was created along with the user.
     """
-    profile = Profile(user=user)
-    profile.save()
-    return profile
+    return Profile.objects.get(user=user)
 
 class ProfileModelTests(TestCase):
     def test_profile_creation(self):
@@ -35,6 +54,15 @@ class ProfileModelTests(TestCase):
         self.assertEqual(user.profile, profile) # Make sure that the profile is associated to the user
         self.assertEqual(profile.__str__(), f'{user.username} Profile') # Make sure that the profile prints correctly
 
+    def test_every_user_has_a_profile(self):
+        """
+        A profile should be created along with every user, however the user is created.
+        """
+        user = User.objects.create_user('another', 'another@test.com', password)
+        self.assertEqual(User.objects.select_related('profile').get(pk=user.pk).profile.image.name, avatars.DEFAULT_AVATAR)
+        superuser = User.objects.create_superuser('admin', 'admin@test.com', password)
+        self.assertTrue(Profile.objects.filter(user=superuser).exists())
+
     def test_user_default_picture(self):
         """
         When a user creates an account and profile, the default profile picture should be "default.jpeg".
@@ -43,6 +71,411 @@ class ProfileModelTests(TestCase):
         profile = create_profile(user=user) # Create the profile for the user
         self.assertEqual(user.profile.image.url, "/media/default.jpeg") # Make sure the default profile picture is the default.jpeg
 
+def create_image(width=1200, height=900, name='photo.jpg'):
+    """
+    Create an uploaded JPEG picture with the given dimensions.
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+class AvatarProcessingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp() # Keep the uploaded pictures out of the project
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, AVATAR_WORKERS=0)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_uploaded_picture_is_cropped_and_resized(self):
+        """
+        An uploaded picture should be replaced by a 300x300 square once it is processed.
+        """
+        profile = create_profile(user=create_user())
+        profile.image = create_image()
+        profile.save()
+        profile.refresh_from_db()
+        self.assertNotEqual(profile.image.name, avatars.DEFAULT_AVATAR) # The processed picture was swapped in
+        with Image.open(profile.image.path) as img:
+            self.assertEqual(img.size, (300, 300))
+
+    def test_renditions_are_named_after_content(self):
+        """
+        Every rendition should be written once per size and format, named after the uploaded content.
+        """
+        profile = create_profile(user=create_user())
+        profile.image = create_image()
+        profile.save()
+        profile.refresh_from_db()
+        names = avatars.renditions(profile.image.name)
+        self.assertEqual(len(names), len(avatars.AVATAR_SIZES) * len(avatars.AVATAR_FORMATS))
+        for (size, ext), name in names.items():
+            with Image.open(os.path.join(self.media_root, name)) as img:
+                self.assertEqual(img.size, (size, size))
+        other = create_profile(user=create_user(username='other', email='other@test.com'))
+        other.image = create_image() # The same picture uploaded again ends up with the same names
+        other.save()
+        other.refresh_from_db()
+        self.assertEqual(other.image.name, profile.image.name)
+
+    def test_avatar_srcset(self):
+        """
+        The srcset should list every rendition of a processed picture and only the file itself for the default picture.
+        """
+        profile = create_profile(user=create_user())
+        self.assertEqual(avatar_srcset(profile.image), '/media/default.jpeg')
+        profile.image = create_image()
+        profile.save()
+        profile.refresh_from_db()
+        srcset = avatar_srcset(profile.image)
+        for size in avatars.AVATAR_SIZES:
+            self.assertIn(f'_{size}.jpg {size}w', srcset)
+
+    def test_small_picture_is_not_enlarged(self):
+        """
+        A picture smaller than the largest rendition should only list the widths its renditions really have.
+        """
+        profile = create_profile(user=create_user())
+        profile.image = create_image(200, 120)
+        profile.save()
+        profile.refresh_from_db()
+        self.assertTrue(profile.image.name.endswith('_120.jpg'))
+        for (size, ext), name in avatars.renditions(profile.image.name).items():
+            with Image.open(os.path.join(self.media_root, name)) as img:
+                self.assertEqual(img.size, (size, size))
+        srcset = avatar_srcset(profile.image)
+        self.assertEqual([entry.split(' ')[1] for entry in srcset.split(', ')], ['32w', '64w', '120w'])
+
+    def test_previous_picture_is_kept_until_processed(self):
+        """
+        The profile should point to the previous picture while the upload waits in the queue.
+        """
+        profile = create_profile(user=create_user())
+        with override_settings(AVATAR_WORKERS=1):
+            profile.image = create_image()
+            profile.save() # The job only starts once the transaction commits, which never happens in a TestCase
+        self.assertEqual(profile.image.name, avatars.DEFAULT_AVATAR)
+        profile.refresh_from_db()
+        self.assertEqual(profile.image.name, avatars.DEFAULT_AVATAR)
+
+    def test_queue_reports_depth_and_timing(self):
+        """
+        The queue should be empty after processing and report how long the job took.
+        """
+        profile = create_profile(user=create_user())
+        processed = avatars.queue.stats()['timings'].get('avatars.job', {}).get('count', 0)
+        profile.image = create_image()
+        profile.save()
+        stats = avatars.queue.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['timings']['avatars.job']['count'], processed + 1)
+
+@override_settings(FRAGMENT_CACHE_TIMEOUT=600)
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        create_profile(user=self.user)
+        self.client.login(username=self.user.username, password=password)
+
+    def test_fragments_are_reused_until_the_user_changes(self):
+        """
+        The profile card should be rendered once, then served from the cache until the user is saved.
+        """
+        before = cache.stats()
+        self.client.get(reverse('profile'))
+        response = self.client.get(reverse('profile'))
+        after = cache.stats()
+        self.assertEqual(after['fragments.miss.profile'], before.get('fragments.miss.profile', 0) + 1)
+        self.assertEqual(after['fragments.hit.profile'], before.get('fragments.hit.profile', 0) + 1)
+        self.assertContains(response, self.user.email)
+        self.user.email = 'changed@test.com'
+        self.user.save()
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'changed@test.com')
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=0)
+    def test_fragments_are_not_cached_when_turned_off(self):
+        """
+        Without fragment caching, changes the version does not record (e.g. made by another worker) should be seen.
+        """
+        self.client.get(reverse('profile'))
+        User.objects.filter(pk=self.user.pk).update(email='elsewhere@test.com')
+        self.assertContains(self.client.get(reverse('profile')), 'elsewhere@test.com')
+
+    def test_cached_home_page_skips_the_statistics_queries(self):
+        """
+        The statistics of the home page should not be queried when the page is served from the cache.
+        """
+        self.client.get(reverse('user_home'))
+        with self.assertNumQueries(2): # session and user
+            self.client.get(reverse('user_home'))
+
+@override_settings(USER_CACHE_TIMEOUT=300, FRAGMENT_CACHE_TIMEOUT=600, SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class SessionUserCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        create_profile(user=self.user)
+        self.client.login(username=self.user.username, password=password)
+
+    def test_cached_session_and_user(self):
+        """
+        A cached home page should need no query at all once the session and user are cached.
+        """
+        self.client.get(reverse('user_home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user_home'))
+        self.assertEqual(response.context['user'], self.user)
+        self.client.get(reverse('profile'))
+        self.user.profile.refresh_from_db()
+        with self.assertNumQueries(0): # The profile was cached with the user
+            self.client.get(reverse('profile'))
+
+    def test_saving_invalidates_the_cached_user(self):
+        """
+        The cached user should only be replaced when the user is saved: an update() that bypasses save()
+        is not seen, a saved change is seen by the next request and a deactivated user is logged out.
+        """
+        self.client.get(reverse('user_home'))
+        User.objects.filter(pk=self.user.pk).update(first_name='Stale') # Not through save, the cache is not told
+        self.assertNotEqual(self.client.get(reverse('user_home')).context['user'].first_name, 'Stale')
+        self.user.first_name = 'Fresh'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('user_home')).context['user'].first_name, 'Fresh')
+        self.user.is_active = False
+        self.user.save()
+        self.assertRedirects(self.client.get(reverse('user_home')), f"{reverse('login')}?next={reverse('user_home')}")
+
+    def test_clear_expired_sessions(self):
+        """
+        Only expired sessions should be deleted, in as many batches as needed.
+        """
+        Session.objects.bulk_create(
+            Session(session_key=f'expired{i:033d}', session_data='', expire_date=timezone.now() - timedelta(days=1))
+            for i in range(5)
+        )
+        out = io.StringIO()
+        call_command('clear_expired_sessions', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired sessions', out.getvalue())
+        self.assertEqual(Session.objects.count(), 1) # The session of the logged in client
+        self.assertEqual(self.client.get(reverse('user_home')).status_code, 200)
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, AVATAR_WORKERS=0)
+        self.settings_override.enable()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(self.settings_override.disable)
+        self.checkpoint = os.path.join(self.media_root, 'checkpoint.json')
+        self.kept = create_user(username='kept', email='kept@test.com') # Shares the picture of the first expired user
+        self.expired = [create_user(username=f'expired{i}', email=f'expired{i}@test.com') for i in range(3)]
+        for user, color in ((self.kept, 1), (self.expired[0], 1), (self.expired[1], 2)):
+            user.profile.image = create_image(name=f'photo{color}.jpg', width=600 + color)
+            user.profile.save()
+            user.profile.refresh_from_db()
+        squat = Exercise.objects.create(name='Pistol Squat', muscle_group='legs', user=self.expired[0])
+        workout = Workout.objects.create(user=self.expired[0])
+        WorkoutSet.objects.create(workout=workout, exercise=squat, reps=5, weight=0)
+        for user in self.expired + [self.kept]:
+            services.deactivate_user(user)
+        Profile.objects.filter(user__in=self.expired).update(deactivated_at=timezone.now() - timedelta(days=31))
+
+    def purge(self, **options):
+        out = io.StringIO()
+        call_command('purge_deactivated', checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+
+    def test_purge_expired_accounts(self):
+        """
+        Accounts deactivated longer ago than the grace period should be deleted with their history and unshared pictures.
+        """
+        shared, own = self.expired[0].profile.image.name, self.expired[1].profile.image.name
+        self.assertIn('would be deleted', self.purge(dry_run=True))
+        self.assertEqual(User.objects.count(), 4)
+        self.purge(batch_size=2, archive=os.path.join(self.media_root, 'archive'))
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['kept']) # Still in its grace period
+        self.assertFalse(WorkoutSet.objects.exists() or Workout.objects.exists() or Exercise.objects.exists())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, shared))) # Still used by the kept profile
+        self.assertFalse(any(os.path.exists(os.path.join(self.media_root, name)) for name in avatars.renditions(own).values()))
+        self.assertFalse(os.path.exists(self.checkpoint))
+        with gzip.open(os.path.join(self.media_root, 'archive', f'{self.expired[0].pk}.ndjson.gz'), 'rt') as f:
+            self.assertEqual(json.loads(f.readline())['exercise'], 'Pistol Squat')
+
+    def test_interrupted_purge_continues(self):
+        """
+        A run stopped after some batches should leave a checkpoint the next run continues from.
+        """
+        self.purge(batch_size=1, max_batches=2)
+        self.assertEqual(User.objects.filter(username__startswith='expired').count(), 1)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['last_pk'], self.expired[1].pk)
+        self.purge(batch_size=1)
+        self.assertFalse(User.objects.filter(username__startswith='expired').exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_reactivation_clears_the_deactivation_date(self):
+        """
+        An account reactivated and then deactivated again without a date should not be purged as if its old grace period ran.
+        """
+        user = self.expired[2]
+        user.is_active = True
+        user.save() # Reactivated in the admin
+        self.assertIsNone(Profile.objects.get(user=user).deactivated_at)
+        user.is_active = False
+        user.save() # Deactivated in the admin again, which records no date
+        self.purge()
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_legacy_accounts_only_purged_when_included(self):
+        """
+        Inactive accounts without a deactivation date should only be deleted when the run includes them.
+        """
+        legacy = create_user(username='legacy', email='legacy@test.com')
+        User.objects.filter(pk=legacy.pk).update(is_active=False, last_login=timezone.now() - timedelta(days=400))
+        recent = create_user(username='recent', email='recent@test.com')
+        User.objects.filter(pk=recent.pk).update(is_active=False, last_login=timezone.now())
+        self.purge()
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'kept', 'legacy', 'recent'})
+        self.purge(include_legacy=True, archive=os.path.join(self.media_root, 'archive'))
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'kept', 'recent'})
+
+    def test_sessions_of_deactivated_users_are_swept(self):
+        """
+        Sessions of deactivated and deleted users should be removed, those of active users kept.
+        """
+        active = create_user(username='active', email='active@test.com')
+        self.client.force_login(active)
+        for user in (self.kept, self.expired[2]):
+            client = Client()
+            client.force_login(user)
+        self.assertEqual(retention.sweep_sessions(batch_size=1), 2)
+        self.assertEqual(self.client.get(reverse('user_home')).status_code, 200)
+
+class MediaGCTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, AVATAR_WORKERS=0)
+        self.settings_override.enable()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(self.settings_override.disable)
+        self.profile = create_profile(user=create_user())
+        self.profile.image = create_image()
+        self.profile.save()
+        self.profile.refresh_from_db()
+
+    def write(self, name, age):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_same_picture_is_stored_once(self):
+        """
+        A picture that was uploaded before should not be decoded again, the profiles share its files.
+        """
+        other = create_profile(user=create_user(username='other', email='other@test.com'))
+        with mock.patch.object(avatars.Image, 'open') as image_open:
+            other.image = create_image()
+            other.save()
+        image_open.assert_not_called()
+        other.refresh_from_db()
+        self.assertEqual(other.image.name, self.profile.image.name)
+
+    def test_collect_orphans(self):
+        """
+        Old files no profile uses should be deleted, but not in a dry run, and never the files in use or young ones.
+        """
+        old = [self.write('profile_pics/0123456789abcdef0123_300.jpg', 7200), self.write('profile_pics/incoming/crashed.jpg', 7200)]
+        young = self.write('profile_pics/fedcba9876543210fedc_64.webp', 60)
+        in_use = [os.path.join(self.media_root, name) for name in avatars.renditions(self.profile.image.name).values()]
+        for path in in_use:
+            os.utime(path, (time.time() - 7200, time.time() - 7200))
+        result = media_gc.collect(dry_run=True)
+        self.assertEqual((len(result.orphans), result.young, result.deleted), (2, 1, 0))
+        self.assertTrue(all(os.path.exists(path) for path in old))
+        out = io.StringIO()
+        call_command('gc_media', workers=2, stdout=out)
+        self.assertIn('scan s', out.getvalue())
+        self.assertFalse(any(os.path.exists(path) for path in old))
+        self.assertTrue(all(os.path.exists(path) for path in in_use + [young]))
+
+@override_settings(RATELIMITS={'login.ip': (5, 60), 'login.username': (2, 60), 'register.ip': (1, 3600)})
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        ratelimit.get_store().clear()
+        self.addCleanup(ratelimit.get_store().clear)
+        self.user = create_user()
+
+    def attempt(self, username='myuser', password='wrong'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password})
+
+    def test_login_throttled_before_authentication(self):
+        """
+        Attempts beyond the bucket of a username should get a 429 without hashing the password.
+        """
+        throttled = ratelimit.stats().get('ratelimit.throttled.login.username', 0)
+        self.assertEqual([self.attempt().status_code for _ in range(2)], [200, 200])
+        with mock.patch('django.contrib.auth.forms.authenticate') as authenticate:
+            response = self.attempt(username='MyUser', password=password) # Usernames are compared case insensitively
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(ratelimit.stats()['ratelimit.throttled.login.username'], throttled + 1)
+        for i in range(2): # Other usernames from the same address until its bucket is empty (the throttled attempt counted too)
+            self.assertEqual(self.attempt(username=f'user{i}').status_code, 200)
+        self.assertEqual(self.attempt(username='someone-else').status_code, 429)
+
+    def test_register_throttled_by_address(self):
+        """
+        Registrations should be throttled per client address, other addresses are not affected.
+        """
+        self.assertEqual(self.client.post(reverse('register'), {}).status_code, 200)
+        self.assertEqual(self.client.post(reverse('register'), {}).status_code, 429)
+        self.assertEqual(self.client.post(reverse('register'), {}, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.client.get(reverse('register')).status_code, 200) # Only attempts are limited
+
+    @override_settings(RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR', RATELIMIT_PROXY_COUNT=1)
+    def test_spoofed_forwarded_for(self):
+        """
+        Addresses a client puts in X-Forwarded-For itself should not give it a bucket of its own.
+        """
+        self.assertEqual(self.client.post(reverse('register'), {}, HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7').status_code, 200)
+        self.assertEqual(self.client.post(reverse('register'), {}, HTTP_X_FORWARDED_FOR='2.2.2.2, 203.0.113.7').status_code, 429)
+        self.assertEqual(self.client.post(reverse('register'), {}, HTTP_X_FORWARDED_FOR='203.0.113.8').status_code, 200)
+        with override_settings(RATELIMIT_PROXY_COUNT=2): # Two proxies, the first entry is the one the outer proxy saw
+            request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.9, 10.0.0.1')
+            self.assertEqual(ratelimit.client_ip(request), '203.0.113.9')
+            request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='10.0.0.1', REMOTE_ADDR='10.0.0.2')
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.2') # Not the chain of the proxies, the header is ignored
+
+    def test_buckets(self):
+        """
+        Buckets should refill over time, and the memory store should evict the least recently used ones.
+        """
+        state, retry_after = ratelimit.take_token(None, 2, 1.0, now=100)
+        state, retry_after = ratelimit.take_token(state, 2, 1.0, now=100)
+        self.assertEqual((state, retry_after), ((0, 100), 0))
+        self.assertEqual(ratelimit.take_token(state, 2, 1.0, now=100.25)[1], 0.75)
+        self.assertEqual(ratelimit.take_token(state, 2, 1.0, now=101)[1], 0) # One token refilled
+        store = ratelimit.MemoryStore(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            store.take(key, 1, 0.001)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+        with override_settings(RATELIMIT_STORE='cache'):
+            cached = ratelimit.get_store()
+            self.assertEqual(cached.take('shared', 1, 0.001), 0)
+            self.assertGreater(cached.take('shared', 1, 0.001), 0)
+
 class UserCreationTests(TestCase):
 
     def test_register_user(self):
@@ -68,6 +501,64 @@ class UserCreationTests(TestCase):
         else:
             self.assertNotEqual(my_user.username, my_second_user.username) # Check if the usernames for both of the users are equal if an error isnt raised
 
+    def test_registration_is_atomic(self):
+        """
+        Registering should create the user and profile together, or neither if the profile cannot be created.
+        """
+        data = {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'username': 'johndoe',
+            'email': 'johndoe@example.com',
+            'password1': 'a-Strong-password-42',
+            'password2': 'a-Strong-password-42',
+        }
+        form = UserRegisterForm(data=data)
+        self.assertTrue(form.is_valid())
+        with mock.patch.object(Profile.objects, 'create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                services.register_user(form)
+        self.assertFalse(User.objects.filter(username='johndoe').exists()) # No user without a profile is left behind
+        form = UserRegisterForm(data=data)
+        self.assertTrue(form.is_valid())
+        with self.assertNumQueries(4): # savepoint, user and profile inserts, release: no re-fetch of the user
+            user = services.register_user(form)
+        self.assertEqual(user.profile.image.name, 'default.jpeg')
+
+SCRYPT_FIRST = [
+    'users.hashers.ScryptPasswordHasher',
+    'users.hashers.PBKDF2PasswordHasher',
+]
+
+class PasswordHashingTests(TestCase):
+
+    @override_settings(PASSWORD_HASHERS=SCRYPT_FIRST, SCRYPT_WORK_FACTOR=2 ** 10)
+    def test_scrypt_hasher(self):
+        """
+        Scrypt hashes should verify and ask for an update when the cost changes.
+        """
+        encoded = make_password(password)
+        self.assertTrue(encoded.startswith('scrypt$1024$'))
+        self.assertTrue(check_password(password, encoded))
+        self.assertFalse(check_password('wrong', encoded))
+        hasher = get_hasher('scrypt')
+        self.assertFalse(hasher.must_update(encoded))
+        with self.settings(SCRYPT_WORK_FACTOR=2 ** 11):
+            self.assertTrue(hasher.must_update(encoded))
+
+    def test_password_is_rehashed_on_login(self):
+        """
+        Logging in should upgrade a hash made with another hasher to the preferred one and time the authentication.
+        """
+        user = create_user()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        logins = metrics.snapshot('login.')['timings'].get('login.authenticate', {}).get('count', 0)
+        with self.settings(PASSWORD_HASHERS=SCRYPT_FIRST, SCRYPT_WORK_FACTOR=2 ** 10):
+            self.client.post(reverse('login'), {'username': user.username, 'password': password})
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertEqual(metrics.snapshot('login.')['timings']['login.authenticate']['count'], logins + 1)
+
 class UserRegisterFormTests(TestCase):
 
     def test_duplicate_user_email(self):
@@ -102,6 +593,55 @@ class UserRegisterFormTests(TestCase):
         form = UserRegisterForm(data=form_data)
         self.assertFalse(form.is_valid()) # Should return false since there shouldnt be two users with the same email
 
+class EmailUniquenessTests(TestCase):
+
+    def test_email_is_stored_in_lower_case_and_unique(self):
+        """
+        Emails should be normalized on save and the database should reject an address in use in another case.
+        """
+        my_user = create_user(email='MyEmail@Test.com')
+        my_user.refresh_from_db()
+        self.assertEqual(my_user.email, 'myemail@test.com')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            create_user(username='johndoe', email='MYEMAIL@test.com')
+        create_user(username='nomail1', email='') # Users without an address are not constrained
+        create_user(username='nomail2', email='')
+
+    def test_register_form_is_case_insensitive(self):
+        """
+        The register form should reject an email that differs from an existing one only in case.
+        """
+        create_user()
+        form = UserRegisterForm(data={
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'username': 'johndoe',
+            'email': 'MyEmail@Test.com',
+            'password1': password,
+            'password2': password,
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+    def test_concurrent_registration_is_reported(self):
+        """
+        An email taken after the form was validated should be reported on the form instead of raising.
+        """
+        create_user()
+        data = {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'username': 'johndoe',
+            'email': 'myemail@test.com',
+            'password1': 'a-Strong-password-42',
+            'password2': 'a-Strong-password-42',
+        }
+        with mock.patch.object(UserRegisterForm, 'clean_email', lambda form: form.cleaned_data['email']): # Validation races the other registration
+            response = self.client.post(reverse('register'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already in use')
+        self.assertFalse(User.objects.filter(username='johndoe').exists())
+
 class UserUpdateFormTests(TestCase):
 
     def test_duplicate_user_email(self):
@@ -245,3 +785,23 @@ class UsersViewsTests(TestCase):
         self.assertFalse(response.status_code==200)
         response = self.client.get(reverse('deactivate')) # It should also apply to the deactivate page
         self.assertFalse(response.status_code==200)
+
+@override_settings(ROOT_URLCONF='bfl.asgi_urls')
+class AsyncViewsTests(TestCase):
+
+    async def test_async_pages(self):
+        """
+        The async read-only pages should render for a logged in user and redirect an anonymous one.
+        """
+        my_user = await sync_to_async(create_user)()
+        await sync_to_async(create_profile)(user=my_user)
+        response = await self.async_client.get(reverse('user_home'))
+        self.assertEqual(response.status_code, 302)
+        await sync_to_async(self.async_client.force_login)(my_user)
+        for name in ('user_home', 'profile'):
+            response = await self.async_client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, my_user.username)
+        response = await self.async_client.get(reverse('landing'))
+        self.assertEqual(response.status_code, 302) # Logged in users are sent home
+
@@ -1,23 +1,26 @@
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.db import IntegrityError, transaction
 from django.contrib import messages
 from django.contrib.auth import (
     update_session_auth_hash,
-    authenticate,
     logout,
     login as dj_login,
 )
-from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
-from .models import Profile
+from bfl import metrics
+from . import emails, retention, services
+from .ratelimit import ratelimit
+from log.models import ExerciseStats, WeeklyVolume
 
 def landing(request):
     if request.user.is_authenticated:
         return redirect('user_home')
     return render(request, 'users/landing.html')
 
+@ratelimit('login', username_field='username') # Before the form hashes the password
 def login(request):
     if request.user.is_authenticated:
         return redirect('user_home')
@@ -26,10 +29,10 @@ def login(request):
         password = ''
         if request.method == 'POST':
             form = AuthenticationForm(request=request, data=request.POST)
-            if form.is_valid():
-                username = form.cleaned_data.get('username')
-                password = form.cleaned_data.get('password')
-                user = authenticate(username=username, password=password)
+            with metrics.timer('login.authenticate'): # The form authenticates the user, which is mostly password hashing
+                valid = form.is_valid()
+            if valid:
+                user = form.get_user() # Authenticating again would hash the password a second time
                 if user is not None:
                     if user.is_active:
                         dj_login(request, user)
@@ -46,18 +49,31 @@ def login(request):
         }
         return render(request, 'users/login.html', context)
 
+def add_conflict_errors(form):
+    """
+    Explain an IntegrityError raised when saving a user form, which happens when a
+    concurrent request took the username or email after the form was validated.
+    """
+    user = form.instance
+    if emails.in_use(form.cleaned_data.get('email'), exclude_user=user):
+        form.add_error('email', 'The email address is already in use by another user.')
+    else:
+        form.add_error('username', 'A user with that username already exists.')
+
+@ratelimit('register')
 def register(request):
     if request.user.is_authenticated:
         return redirect('user_home')
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
         if form.is_valid():
-            form.save()
-            username = form.cleaned_data.get('username')
-            profile = Profile(user=User.objects.get(username=username))
-            profile.save()
-            messages.success(request, f'Account successfully created for {username}!')
-            return redirect('login')
+            try:
+                user = services.register_user(form)
+            except IntegrityError: # Another registration took the username or email since the form was validated
+                add_conflict_errors(form)
+            else:
+                messages.success(request, f'Account successfully created for {user.username}!')
+                return redirect('login')
     else:
         form = UserRegisterForm()
 
@@ -67,22 +83,42 @@ def register(request):
     }
     return render(request, 'users/register.html', context)
 
-@login_required
-def user_home(request):
-    context = {
+HOME_EXERCISES = 10 # Number of recently trained exercises shown on the home page
+HOME_WEEKS = 8 # Number of weeks of volume shown on the home page
+
+def home_context(user):
+    """
+    Context of the home page, shared with the async view in users/async_views.py.
+    """
+    # The statistics are maintained as sets are logged (see log/services.py), so this is two
+    # indexed queries no matter how much history the user has. The querysets are lazy, when the
+    # page is served from the fragment cache (see users/cache.py) they are not run at all
+    exercise_stats = ExerciseStats.objects.filter(user=user).select_related('exercise').order_by('-last_performed_at')
+    weekly_volume = WeeklyVolume.objects.filter(user=user).order_by('-week')
+    return {
         'title': 'Home',
+        'exercise_stats': exercise_stats[:HOME_EXERCISES],
+        'weekly_volume': weekly_volume[:HOME_WEEKS], # the template shows the oldest week first
     }
-    return render(request, 'users/user-home.html', context)
 
 @login_required
-def profile(request):
-    username = request.user.username
-    name = request.user.first_name + ' ' + request.user.last_name
+def user_home(request):
+    return render(request, 'users/user-home.html', home_context(request.user))
+
+def profile_context(user):
+    """
+    Context of the profile page, shared with the async view in users/async_views.py.
+    """
+    username = user.username
+    name = user.first_name + ' ' + user.last_name
     title = name + ' (@' + username + ')'
-    context = {
+    return {
         'title': title,
     }
-    return render(request, 'users/profile.html', context)
+
+@login_required
+def profile(request):
+    return render(request, 'users/profile.html', profile_context(request.user))
 
 @login_required
 def edit_profile(request):
@@ -90,11 +126,17 @@ def edit_profile(request):
         user_form = UserUpdateForm(request.POST, instance=request.user)
         profile_form = ProfileUpdateForm(request.POST, request.FILES, instance=request.user.profile)
         if user_form.is_valid() and profile_form.is_valid():
-            user_form.save()
-            profile_form.save()
-            next = request.POST.get('next', reverse('profile'))
-            messages.success(request, f'Your account has been updated!')
-            return redirect(next) # request.META.get('HTTP_REFERER') (?)
+            try:
+                with transaction.atomic():
+                    user_form.save()
+            except IntegrityError: # Another user took the username or email since the form was validated
+                request.user.refresh_from_db()
+                add_conflict_errors(user_form)
+            else:
+                profile_form.save()
+                next = request.POST.get('next', reverse('profile'))
+                messages.success(request, f'Your account has been updated!')
+                return redirect(next) # request.META.get('HTTP_REFERER') (?)
     else:
         user_form = UserUpdateForm(instance=request.user)
         profile_form = ProfileUpdateForm(instance=request.user.profile)
@@ -117,12 +159,12 @@ def settings(request):
 def deactivate(request):
     if request.method == "POST":
         user = request.user
-        user.is_active = False
-        user.save()
+        services.deactivate_user(user)
         messages.success(request, f'{user.username} was successfully deactivated.')
         return redirect('logout')
     context = {
         'title': 'Deactivate',
+        'grace_days': retention.grace_days(),
     }
     return render(request, 'users/deactivate.html', context)
 